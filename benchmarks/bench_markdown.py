@@ -0,0 +1,140 @@
+"""Benchmark del conversor de Markdown (parse_markdown_visual).
+
+Uso:
+    python benchmarks/bench_markdown.py              # corpus sintético de 1 a 8 MB
+    python benchmarks/bench_markdown.py CARPETA ...  # todos los .md de esas carpetas
+
+Compara el conversor actual con la cadena de re.sub anterior y mide casos
+patológicos (delimitadores sin cerrar) para comprobar que el tiempo crece de
+forma lineal con el tamaño del texto.
+"""
+import os
+import re
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from main import parse_markdown_visual  # noqa: E402
+
+def legacy_parse_markdown_visual(text):
+    """Conversor anterior: seis pasadas de re.sub/replace sobre todo el texto"""
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    text = re.sub(r'^# (.*?)$', r'<h1 style="font-size:24pt; color:#7aa2f7;">\1</h1>', text, flags=re.MULTILINE)
+    text = re.sub(r'^## (.*?)$', r'<h2 style="font-size:20pt; color:#7aa2f7;">\1</h2>', text, flags=re.MULTILINE)
+    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
+    text = re.sub(r'\*(.*?)\*', r'<i>\1</i>', text)
+    text = re.sub(r'\[\[(.*?)\]\]', r'<a href="model://\1" style="color:#7dcfff;">\1</a>', text)
+    text = text.replace('\n', '<br>')
+    return text
+
+SAMPLE = """# Nota {i}
+
+Texto con **negrita**, *cursiva*, `código en línea` y un [[Enlace {i}|alias]].
+Otra línea del mismo párrafo con un [enlace](https://example.com/{i}) y snake_case.
+
+## Lista
+
+- elemento uno
+- elemento **dos**
+  - anidado *con énfasis*
+1. primero
+2. segundo
+
+| Col A | Col B |
+|:------|------:|
+| {i}   | **x** |
+
+> cita con _énfasis_
+
+```python
+def f(x):
+    return x * {i}
+```
+
+---
+"""
+
+def synthetic_corpus(size):
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        block = SAMPLE.format(i=i)
+        parts.append(block)
+        total += len(block)
+        i += 1
+    return "".join(parts)
+
+def load_corpus(directories):
+    texts = []
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.lower().endswith((".md", ".markdown")):
+                    with open(os.path.join(root, name), "r", encoding="utf-8", errors="replace") as f:
+                        texts.append(f.read())
+    return "\n\n".join(texts)
+
+def timed(fn, text, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def report(label, text, compare=True):
+    mb = len(text) / (1024 * 1024)
+    new = timed(parse_markdown_visual, text)
+    line = f"{label:<28} {mb:7.2f} MB  nuevo {new:7.3f} s ({mb / new:6.2f} MB/s)"
+    if compare:
+        old = timed(legacy_parse_markdown_visual, text)
+        line += f"  anterior {old:7.3f} s ({mb / old:6.2f} MB/s)"
+    print(line)
+    return new
+
+def main():
+    if len(sys.argv) > 1:
+        text = load_corpus(sys.argv[1:])
+        if not text:
+            print("No se encontraron archivos .md")
+            return
+        report("corpus", text)
+        return
+
+    print("Corpus sintético")
+    for mb in (1, 2, 4, 8):
+        report(f"  {mb} MB", synthetic_corpus(mb * 1024 * 1024))
+
+    # Entradas que vuelven cuadráticos a los conversores ingenuos: el tiempo por
+    # MB debe mantenerse aproximadamente constante al duplicar el tamaño
+    print("Casos patológicos (escalado)")
+    cases = {
+        "asteriscos sin cerrar": "*a ",
+        "corchetes sin cerrar": "[a ",
+        "enlaces sin paréntesis": "[a](b ",
+        "comillas invertidas": "`a ",
+        "wiki sin cerrar": "[[a ",
+        "guiones bajos": "_a_b ",
+        "énfasis cerrado": "*a* ",
+        "negrita cerrada": "**a** ",
+        "citas anidadas": "> ",
+        "enlaces anidados": "[",
+    }
+    for label, unit in cases.items():
+        times = []
+        for count in (50000, 100000, 200000):
+            text = unit * count
+            if unit.startswith(">"):
+                # Párrafos de 1000 niveles de cita anidados; count//1000 párrafos
+                text = ("> " * 1000 + "x\n\n") * (count // 1000)
+            elif unit == "[":
+                # Un solo enlace con count niveles de [texto](x) anidados en su etiqueta
+                text = "[" * count + "a" + "](x)" * count
+            times.append(report(f"  {label} x{count}", text, compare=False))
+        print(f"  {'':<26} crecimiento al duplicar: {times[1] / times[0]:.2f}x, {times[2] / times[1]:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark de los formatos de almacenamiento de notas: HTML de Qt (.rtf) y Markdown (.md).
+
+Uso:
+    python benchmarks/bench_storage.py              # 500 notas sintéticas
+    python benchmarks/bench_storage.py VAULT        # las notas .rtf de un vault
+
+Para cada nota genera las dos versiones (toHtml y la serialización Markdown que
+usa el editor) y compara tamaño en disco, tiempo de carga en un QTextDocument y
+tiempo de lectura y extracción del texto plano para el índice.
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PyQt6.QtWidgets import QApplication  # noqa: E402
+
+app = QApplication(sys.argv)
+
+from main import build_note_document, document_to_markdown, extract_plain_text  # noqa: E402
+
+SAMPLE = """<h2>Reunión {i}</h2>
+<p>Notas de la reunión con <b>negrita</b>, <i>cursiva</i> y un enlace a
+<a href="model://Proyecto{i}">Proyecto{i}</a>. Pendientes para la semana:</p>
+<ul><li>Revisar el presupuesto</li><li>Llamar a <b>proveedores</b>
+<ul><li>pedir cotización</li></ul></li><li>Actualizar ##tareas##</li></ul>
+<table border="1"><tr><th>Tarea</th><th>Responsable</th></tr>
+<tr><td>Informe {i}</td><td>Ana</td></tr><tr><td>Compras</td><td>Luis</td></tr></table>
+<p>Más detalles en <a href="https://example.com/{i}">la web</a>.</p>"""
+
+def synthetic_notes(count):
+    return [build_note_document(SAMPLE.format(i=i), rich=True).toHtml() for i in range(count)]
+
+def vault_notes(vault):
+    notes = []
+    for name in sorted(os.listdir(vault)):
+        if name.lower().endswith('.rtf'):
+            with open(os.path.join(vault, name), 'r', encoding='utf-8', errors='ignore') as f:
+                notes.append(f.read())
+    return notes
+
+def timed(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return time.perf_counter() - start
+
+def index_time(contents, ext, markdown):
+    """Escribe las notas en una carpeta temporal y mide leerlas y extraer su texto"""
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i, content in enumerate(contents):
+            path = os.path.join(tmp, f"{i}{ext}")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            paths.append(path)
+        def read(path):
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                extract_plain_text(f.read(), markdown)
+        return timed(read, paths)
+
+def main():
+    notes = vault_notes(sys.argv[1]) if len(sys.argv) > 1 else synthetic_notes(500)
+    if not notes:
+        print("No se encontraron notas .rtf")
+        return
+    markdown = [document_to_markdown(build_note_document(content)) for content in notes]
+    html_bytes = sum(len(n.encode('utf-8')) for n in notes)
+    md_bytes = sum(len(n.encode('utf-8')) for n in markdown)
+    print(f"{len(notes)} notas")
+    print(f"  tamaño      HTML {html_bytes / 1024:9.1f} KB   Markdown {md_bytes / 1024:9.1f} KB   ({html_bytes / md_bytes:.1f}x)")
+    html_load = timed(lambda c: build_note_document(c), notes)
+    md_load = timed(lambda c: build_note_document(c, markdown=True), markdown)
+    print(f"  carga       HTML {html_load:9.3f} s    Markdown {md_load:9.3f} s    ({html_load / md_load:.1f}x)")
+    html_text = index_time(notes, ".rtf", False)
+    md_text = index_time(markdown, ".md", True)
+    print(f"  índice      HTML {html_text:9.3f} s    Markdown {md_text:9.3f} s    ({html_text / md_text:.1f}x)")
+
+if __name__ == "__main__":
+    main()
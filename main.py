@@ -3,18 +3,38 @@ import os
 import re
 import ctypes
 import json
+import html
+import math
+import time
+import bisect
+import itertools
+import tempfile
+import shutil
+import hashlib
+import zlib
+import unicodedata
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from collections import OrderedDict
+from urllib.parse import unquote
+import sqlite3
+import threading
 import platform
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                             QHBoxLayout, QListWidget, QTextEdit, QLineEdit, 
+                             QHBoxLayout, QListView, QListWidget, QTextEdit, QLineEdit, 
                              QPushButton, QSplitter, QMessageBox, QToolBar, 
                              QColorDialog, QFontComboBox, QSpinBox, QFileDialog,
                              QInputDialog, QLabel, QMenu, QMenuBar, QDialog, 
-                             QGridLayout, QCheckBox, QComboBox)
+                             QGridLayout, QCheckBox, QComboBox, QProgressBar, QCompleter,
+                             QDockWidget, QListWidgetItem, QTreeWidget, QTreeWidgetItem,
+                             QStyledItemDelegate, QStyleOptionViewItem, QStyle)
 from PyQt6.QtGui import (QAction, QIcon, QFont, QColor, QTextCursor, 
                          QTextListFormat, QTextTableFormat, QTextCharFormat,
-                         QTextBlockFormat, QTextDocument, QPixmap, QDesktopServices,
-                         QSyntaxHighlighter, QKeySequence, QShortcut)  # QShortcut va aquí
-from PyQt6.QtCore import Qt, QSize, QUrl, QRegularExpression, QEvent
+                         QTextBlockFormat, QTextDocument, QTextDocumentFragment, QPixmap, QDesktopServices,
+                         QSyntaxHighlighter, QKeySequence, QShortcut, QTextBlockUserData)  # QShortcut va aquí
+from PyQt6.QtCore import (Qt, QSize, QUrl, QEvent, QObject,
+                          QRunnable, QThreadPool, QTimer, QFileSystemWatcher, pyqtSignal,
+                          QAbstractListModel, QAbstractProxyModel, QModelIndex, QStringListModel)
 
 # =============================================================================
 # CONFIGURACIÓN
@@ -51,6 +71,28 @@ os.makedirs(APP_CONFIG_DIR, exist_ok=True)
 # Archivo de configuración para guardar el vault actual
 CONFIG_FILE = os.path.join(APP_CONFIG_DIR, "app_config.json")
 VAULT_HISTORY_FILE = os.path.join(APP_CONFIG_DIR, "vault_history.json")
+SETTINGS_FILE = os.path.join(APP_CONFIG_DIR, "settings.json")
+
+# Preferencias por defecto (ARCHIVO > Preferencias...)
+DEFAULT_SETTINGS = {
+    "prefetch_depth": 1,      # Niveles de enlaces a precargar desde la nota abierta
+    "prefetch_max_mb": 64,    # Memoria máxima estimada para documentos precargados
+    "large_note_mb": 2,       # Notas mayores se abren en modo solo lectura, sin resaltado
+    "autosave_seconds": 5,    # Autoguardado tras este tiempo sin escribir (0 = desactivado)
+    "history_keep_days": 90,  # Días que se conservan versiones viejas en el historial
+}
+
+# Extensiones que se muestran como notas del vault
+NOTE_EXTENSIONS = ('.rtf', '.txt', '.html', '.md')
+
+# Carpeta oculta dentro de cada vault para metadatos (índice, etc.)
+VAULT_META_DIRNAME = ".maletin"
+
+# Opciones propias de cada vault, en <vault>/.maletin/vault.json
+VAULT_OPTIONS_FILENAME = "vault.json"
+DEFAULT_VAULT_OPTIONS = {
+    "storage": "html",        # "html": HTML de Qt en .rtf; "markdown": Markdown en .md
+}
 
 # =============================================================================
 # ESTILOS TOKYO NIGHT (KITTY STYLE)
@@ -80,7 +122,7 @@ QWidget {{
     background-color: {C_BG};
     color: {C_FG};
 }}
-QListWidget {{
+QListView {{
     background-color: {C_SIDE};
     color: {C_FG};
     border: 1px solid {C_BORDER};
@@ -89,10 +131,10 @@ QListWidget {{
     selection-background-color: {C_SEL};
     selection-color: #ffffff;
 }}
-QListWidget::item:hover {{
+QListView::item:hover {{
     background-color: {C_LINE};
 }}
-QListWidget::item:selected {{
+QListView::item:selected {{
     background-color: {C_SEL};
     border: 1px solid {C_ACCENT};
 }}
@@ -274,6 +316,49 @@ def save_vault_history(vault_path):
         print(f"Error al guardar historial de vaults: {e}")
         return False
 
+def load_app_settings():
+    """Carga las preferencias de la aplicación (con valores por defecto)"""
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(SETTINGS_FILE):
+        try:
+            with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                settings.update(json.load(f))
+        except Exception as e:
+            print(f"Error al cargar preferencias: {e}")
+    return settings
+
+def save_app_settings(settings):
+    """Guarda las preferencias de la aplicación"""
+    try:
+        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(settings, f, indent=2)
+        return True
+    except Exception as e:
+        print(f"Error al guardar preferencias: {e}")
+        return False
+
+def load_vault_options(vault_path):
+    """Carga las opciones del vault (con valores por defecto)"""
+    options = dict(DEFAULT_VAULT_OPTIONS)
+    path = os.path.join(vault_path, VAULT_META_DIRNAME, VAULT_OPTIONS_FILENAME)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                options.update(json.load(f))
+        except Exception as e:
+            print(f"Error al cargar opciones del vault: {e}")
+    return options
+
+def save_vault_options(vault_path, options):
+    """Guarda las opciones del vault"""
+    try:
+        atomic_write_text(os.path.join(get_vault_meta_dir(vault_path), VAULT_OPTIONS_FILENAME),
+                          json.dumps(options, indent=2))
+        return True
+    except Exception as e:
+        print(f"Error al guardar opciones del vault: {e}")
+        return False
+
 def select_vault_directory(parent=None, current_vault=''):
     """Diálogo para seleccionar un directorio de vault"""
     dialog = QDialog(parent)
@@ -415,9 +500,3006 @@ def select_vault_directory(parent=None, current_vault=''):
             return vault_path
     return None
 
+# =============================================================================
+# ÍNDICE FULL-TEXT DEL MALETÍN
+# =============================================================================
+_HTML_HIDDEN_RE = re.compile(r'<(head|style|script)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_HTML_BREAK_RE = re.compile(r'<(?:br|/p|/h\d|/li|/tr|/td|/th|/div)\b[^>]*>', re.IGNORECASE)
+_HTML_TAG_RE = re.compile(r'<[^>]*>')
+
+# Marcas de Markdown que no forman parte del texto visible
+_MD_LINK_TEXT_RE = re.compile(r'!?\[((?:[^\]\\\n]|\\.)*)\]\((?:<[^>\n]*>|[^)\s]*)\)')
+_MD_LINE_MARK_RE = re.compile(r'^[ \t]*(?:#{1,6}[ \t]+|>[ \t]?|[-*+][ \t]+(?:\[[ xX]\][ \t]+)?|\d+[.)][ \t]+|(?:```|~~~).*$)', re.MULTILINE)
+# Escapes (se conserva el carácter) y marcas de énfasis/código en una sola pasada;
+# los _ van aparte porque dentro de una palabra (snake_case) son texto
+_MD_INLINE_MARK_RE = re.compile(r'\\([!-/:-@\[-`{-~])|[*~`]+')
+_MD_UNDERSCORE_RE = re.compile(r'(?<![\w\\])_+|(?<!\\)_+(?!\w)')
+
+def is_rich_content(content):
+    """Indica si el contenido de una nota debe cargarse como HTML/RTF"""
+    return "{\\rtf" in content or "<html" in content
+
+def is_markdown_note(path):
+    """Las notas .md se guardan y se cargan como Markdown"""
+    return path.lower().endswith('.md')
+
+def extract_plain_text(content, markdown=False):
+    """Extrae el texto visible de una nota (sin etiquetas ni estilos de Qt)"""
+    if markdown:
+        text = _MD_LINK_TEXT_RE.sub(r'\1', content) if '](' in content else content
+        text = _MD_LINE_MARK_RE.sub('', text)
+        if '_' in text:
+            text = _MD_UNDERSCORE_RE.sub('', text)
+        return _MD_INLINE_MARK_RE.sub(r'\1', text)
+    if not is_rich_content(content):
+        return content
+    text = _HTML_HIDDEN_RE.sub(' ', content)
+    text = _HTML_BREAK_RE.sub('\n', text)
+    text = _HTML_TAG_RE.sub('', text)
+    return html.unescape(text)
+
+# Enlaces internos: anclas model://nombre y etiquetas ##nombre## en el texto
+MODEL_LINK_RE = re.compile(r'model://([^"\'<>\s)\]]+)')
+TAG_LINK_RE = re.compile(r"##([\w\.-]+)##")
+TAG_NAME_RE = re.compile(r"[\w\.-]+")
+# En Markdown los destinos con espacios van entre <>: [Mi Nota](<model://Mi Nota>)
+MD_MODEL_LINK_RE = re.compile(r'<model://([^<>\n]+)>|model://([^"\'<>\s)\]]+)')
+
+def extract_links(content, plain_text=None, markdown=False):
+    """Destinos (nombre en minúsculas) de los enlaces internos de una nota"""
+    if plain_text is None:
+        plain_text = extract_plain_text(content, markdown)
+    if markdown:
+        found = (m.group(1) or m.group(2) for m in MD_MODEL_LINK_RE.finditer(content))
+    else:
+        found = MODEL_LINK_RE.findall(content)
+    targets = {unquote(t).strip().lower() for t in found}
+    targets.update(t.lower() for t in TAG_LINK_RE.findall(plain_text))
+    targets.discard("")
+    return targets
+
+def rewrite_links(content, old_name, new_name, markdown=False):
+    """Reescribe los enlaces a old_name (model:// y ##tag##) para que apunten a new_name.
+
+    Solo se reemplazan destinos completos: model://Foo no toca model://Foo Bar.
+    En Markdown los nombres con espacios se escriben como <model://...>, y las
+    etiquetas ##viejo## pasan a ser enlaces si new_name no es un nombre de
+    etiqueta válido. En texto plano esos enlaces no se pueden expresar y se dejan.
+    Devuelve (contenido, reemplazos, enlaces que quedaron apuntando a old_name).
+    """
+    rich = not markdown and is_rich_content(content)
+    old = re.escape(html.escape(old_name, quote=False) if rich else old_name).replace(r'\ ', '(?: |%20)')
+    count = kept = 0
+    def sub(pattern, repl, text):
+        nonlocal count
+        text, n = re.subn(pattern, repl, text, flags=re.IGNORECASE)
+        count += n
+        return text
+    if markdown:
+        angle = re.search(r'[\s()<>]', new_name) is not None
+        md_dest = lambda bracketed: f'<model://{new_name}>' if bracketed or angle else f'model://{new_name}'
+        content = sub(r'(<)?model://' + old + r'(?(1)>|(?=\)))', lambda m: md_dest(m.group(1)), content)
+        # [viejo](model://nuevo): también cambia el texto visible
+        link_text = r'\[' + old + r'\](?=\(<?model://' + re.escape(new_name) + r'[>)])'
+        content = sub(link_text, lambda m: f'[{new_name}]', content)
+        tag = lambda m: f'[{new_name}]({md_dest(False)})'
+    elif rich:
+        new_href = html.escape(new_name, quote=False)
+        content = sub(r'(?<=["\'])model://' + old + r'(?=["\'])', lambda m: 'model://' + new_href, content)
+        anchor_text = r'(href="model://' + re.escape(new_href) + r'"[^>]*>(?:<span[^>]*>)*)' + old + r'(?=(?:</span>)*</a>)'
+        content = sub(anchor_text, lambda m: m.group(1) + new_href, content)
+        tag = lambda m: f'<a href="model://{new_href}">{new_href}</a>'
+    else:
+        link = r'model://' + old + r'(?=[\s"\'<>)\]]|\Z)'
+        if re.search(r'[\s"\'<>)\]]', new_name):
+            kept += len(re.findall(link, content, flags=re.IGNORECASE))
+        else:
+            content = sub(link, lambda m: 'model://' + new_name, content)
+        tag = None
+    if TAG_NAME_RE.fullmatch(new_name):
+        content = sub(r'##' + old + r'##', lambda m: f'##{new_name}##', content)
+    elif tag:
+        content = sub(r'##' + old + r'##', tag, content)
+    else:
+        kept += len(re.findall(r'##' + old + r'##', content, flags=re.IGNORECASE))
+    return content, count, kept
+
+def atomic_write_text(path, text):
+    """Escribe un archivo de forma atómica: temporal + fsync + rename"""
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def rewrite_links_in_file(path, old_name, new_name):
+    """Tarea del pool de renombrado: (ruta, reemplazos, error)"""
+    try:
+        # Decodificación estricta: se reescribe el archivo entero y no se deben perder bytes
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            content = f.read()
+        new_content, count, kept = rewrite_links(content, old_name, new_name, is_markdown_note(path))
+        if count:
+            atomic_write_text(path, new_content)
+        if kept:
+            return path, count, f"{kept} enlaces no se pueden escribir con el nombre '{new_name}' en texto plano"
+        return path, count, None
+    except (OSError, UnicodeDecodeError) as e:
+        return path, 0, str(e)
+
+class LinkRewriteSignals(QObject):
+    finished = pyqtSignal(object)
+
+class LinkRewriteWorker(QRunnable):
+    """Reescribe, en hilos de trabajo, los enlaces de las notas que apuntaban a una nota renombrada"""
+    def __init__(self, vault_path, names, old_name, new_name):
+        super().__init__()
+        self.vault_path = vault_path
+        self.names = names
+        self.old_name = old_name
+        self.new_name = new_name
+        self.signals = LinkRewriteSignals()
+
+    def run(self):
+        report = {"rewritten": [], "errors": []}
+        try:
+            paths = [os.path.join(self.vault_path, name) for name in self.names]
+            with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as pool:
+                for path, count, error in pool.map(lambda p: rewrite_links_in_file(p, self.old_name, self.new_name), paths):
+                    if error:
+                        report["errors"].append(f"{os.path.basename(path)}: {error}")
+                    if count:
+                        report["rewritten"].append(os.path.basename(path))
+        except Exception as e:
+            report["errors"].append(str(e))
+        self.signals.finished.emit(report)
+
+def get_vault_meta_dir(vault_path):
+    """Devuelve (y crea si hace falta) la carpeta de metadatos del vault"""
+    meta_dir = os.path.join(vault_path, VAULT_META_DIRNAME)
+    os.makedirs(meta_dir, exist_ok=True)
+    return meta_dir
+
+def iter_vault_entries(vault_path):
+    """Recorre las notas del vault devolviendo (nombre, mtime, tamaño, id) sin leer su contenido.
+
+    id es (dispositivo, inodo), que se conserva al renombrar; el inodo es 0 donde
+    el sistema de archivos no lo da.
+    """
+    with os.scandir(vault_path) as it:
+        for entry in it:
+            if entry.name.lower().endswith(NOTE_EXTENSIONS) and entry.is_file():
+                st = entry.stat()
+                yield entry.name, st.st_mtime, st.st_size, (st.st_dev, entry.inode())
+
+def scan_vault_entries(vault_path, ids=None):
+    """Devuelve {nombre: (mtime, tamaño)} de todas las notas del vault; si se pasa ids,
+    lo completa con {nombre: (dispositivo, inodo)}"""
+    entries = {}
+    for name, mtime, size, file_id in iter_vault_entries(vault_path):
+        entries[name] = (mtime, size)
+        if ids is not None:
+            ids[name] = file_id
+    return entries
+
+class VaultIndex:
+    """Índice persistente (SQLite FTS5) del texto de las notas de un vault.
+
+    Se guarda en <vault>/.maletin/index.db y se actualiza archivo por archivo
+    comparando mtime y tamaño, de modo que solo se releen las notas que cambiaron.
+    Cada hilo usa su propia conexión. También guarda el grafo de enlaces entre
+    notas (tabla links), que se actualiza a la vez que el texto.
+
+    notes_fts (palabras sin acentos) sirve a la búsqueda por términos del panel de
+    búsqueda; notes_sub (trigramas, sobre el mismo texto) al filtro de la lista
+    lateral, que busca subcadenas.
+    """
+    COMMIT_EVERY = 200
+    SCHEMA_VERSION = 3
+
+    def __init__(self, vault_path):
+        self.vault_path = vault_path
+        self.db_path = os.path.join(get_vault_meta_dir(vault_path), "index.db")
+        self._local = threading.local()
+        self.has_fts = True
+        self.has_trigram = True
+        self.init_schema()
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def init_schema(self):
+        conn = self.connect()
+        if conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+            # Esquema viejo: se reconstruye todo en el próximo escaneo
+            for table in ("files", "links", "notes_sub", "notes_fts", "notes_text"):
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        conn.execute("CREATE TABLE IF NOT EXISTS links ("
+                     "src_id INTEGER NOT NULL, target TEXT NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS links_src ON links (src_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS links_target ON links (target)")
+        conn.execute("CREATE TABLE IF NOT EXISTS files ("
+                     "id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, "
+                     "mtime REAL NOT NULL, size INTEGER NOT NULL)")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5("
+                         "body, tokenize='unicode61 remove_diacritics 2')")
+        except sqlite3.OperationalError:
+            # SQLite compilado sin FTS5: tabla normal y búsqueda recorriendo el texto
+            self.has_fts = False
+            conn.execute("CREATE TABLE IF NOT EXISTS notes_text ("
+                         "rowid INTEGER PRIMARY KEY, body TEXT)")
+        self.has_trigram = self.has_fts
+        if self.has_fts:
+            try:
+                conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS notes_sub USING fts5("
+                             "body, tokenize='trigram', content='notes_fts')")
+            except sqlite3.OperationalError:
+                # SQLite anterior a 3.34: sin trigramas, el filtro recorre el texto
+                self.has_trigram = False
+        conn.commit()
+
+    @property
+    def text_table(self):
+        return "notes_fts" if self.has_fts else "notes_text"
+
+    def known_entries(self):
+        """Devuelve {nombre: (mtime, tamaño)} de lo que hay indexado"""
+        rows = self.connect().execute("SELECT name, mtime, size FROM files")
+        return {name: (mtime, size) for name, mtime, size in rows}
+
+    def _read_note(self, name):
+        path = os.path.join(self.vault_path, name)
+        try:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def _delete_text(self, conn, file_id):
+        if self.has_trigram:
+            # notes_sub toma el texto de notes_fts: hay que borrarlo con el valor viejo
+            row = conn.execute("SELECT body FROM notes_fts WHERE rowid = ?", (file_id,)).fetchone()
+            if row:
+                conn.execute("INSERT INTO notes_sub (notes_sub, rowid, body) VALUES ('delete', ?, ?)",
+                             (file_id, row[0]))
+        conn.execute(f"DELETE FROM {self.text_table} WHERE rowid = ?", (file_id,))
+
+    def _store(self, conn, name, mtime, size, content):
+        row = conn.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()
+        if row:
+            file_id = row[0]
+            conn.execute("UPDATE files SET mtime = ?, size = ? WHERE id = ?", (mtime, size, file_id))
+            self._delete_text(conn, file_id)
+            conn.execute("DELETE FROM links WHERE src_id = ?", (file_id,))
+        else:
+            file_id = conn.execute("INSERT INTO files (name, mtime, size) VALUES (?, ?, ?)",
+                                   (name, mtime, size)).lastrowid
+        plain_text = extract_plain_text(content, is_markdown_note(name))
+        conn.execute(f"INSERT INTO {self.text_table} (rowid, body) VALUES (?, ?)",
+                     (file_id, plain_text))
+        if self.has_trigram:
+            conn.execute("INSERT INTO notes_sub (rowid, body) VALUES (?, ?)", (file_id, plain_text))
+        conn.executemany("INSERT INTO links (src_id, target) VALUES (?, ?)",
+                         [(file_id, target) for target in extract_links(content, plain_text, is_markdown_note(name))])
+
+    def _delete(self, conn, name):
+        row = conn.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()
+        if row:
+            self._delete_text(conn, row[0])
+            conn.execute("DELETE FROM links WHERE src_id = ?", (row[0],))
+            conn.execute("DELETE FROM files WHERE id = ?", (row[0],))
+
+    def sync(self, entries, progress=None, should_stop=None):
+        """Sincroniza el índice con {nombre: (mtime, tamaño)}; devuelve cuántas notas releyó.
+
+        progress(hechas, total) se llama periódicamente y should_stop() permite
+        cancelar a mitad: lo ya indexado queda guardado.
+        """
+        conn = self.connect()
+        known = self.known_entries()
+        for name in known.keys() - entries.keys():
+            self._delete(conn, name)
+        changed = [name for name, stat in entries.items() if known.get(name) != stat]
+        total = len(changed)
+        for i, name in enumerate(changed, 1):
+            if should_stop and should_stop():
+                conn.commit()
+                return i - 1
+            mtime, size = entries[name]
+            self._store(conn, name, mtime, size, self._read_note(name))
+            if i % self.COMMIT_EVERY == 0:
+                conn.commit()
+                if progress: progress(i, total)
+        conn.commit()
+        if progress: progress(total, total)
+        return total
+
+    def update_file(self, name):
+        """Reindexa una sola nota (o la elimina del índice si ya no existe)"""
+        conn = self.connect()
+        path = os.path.join(self.vault_path, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._delete(conn, name)
+        else:
+            self._store(conn, name, st.st_mtime, st.st_size, self._read_note(name))
+        conn.commit()
+
+    def remove_file(self, name):
+        conn = self.connect()
+        self._delete(conn, name)
+        conn.commit()
+
+    def rename_file(self, old_name, new_name):
+        """Renombra una entrada sin volver a leer ni indexar el contenido"""
+        conn = self.connect()
+        self._delete(conn, new_name)
+        conn.execute("UPDATE files SET name = ? WHERE name = ?", (new_name, old_name))
+        conn.commit()
+
+    def outgoing_links(self, name):
+        """Destinos (en minúsculas) enlazados desde una nota"""
+        rows = self.connect().execute("SELECT DISTINCT links.target FROM links JOIN files ON files.id = links.src_id "
+                                      "WHERE files.name = ? ORDER BY links.target", (name,))
+        return [target for (target,) in rows]
+
+    def backlinks(self, name):
+        """Notas que enlazan a una nota (por su nombre sin extensión)"""
+        target = os.path.splitext(name)[0].lower()
+        rows = self.connect().execute("SELECT DISTINCT files.name FROM links JOIN files ON files.id = links.src_id "
+                                      "WHERE links.target = ? AND files.name != ? ORDER BY files.name", (target, name))
+        return [src for (src,) in rows]
+
+    def _all_texts(self):
+        return self.connect().execute(f"SELECT files.name, {self.text_table}.body FROM {self.text_table} "
+                                      f"JOIN files ON files.id = {self.text_table}.rowid")
+
+    def search(self, query, limit=None):
+        """Nombres de las notas cuyo texto contiene la consulta (subcadena, sin distinguir
+        mayúsculas), ordenados por relevancia. Es lo que usa el filtro de la lista lateral."""
+        query = query.lower()
+        if not query:
+            return []
+        if self.has_trigram and len(query) >= 3:
+            # En el índice de trigramas una frase entre comillas coincide como subcadena
+            limit_sql = f" LIMIT {int(limit)}" if limit else ""
+            rows = self.connect().execute("SELECT files.name FROM notes_sub JOIN files ON files.id = notes_sub.rowid "
+                                          "WHERE notes_sub MATCH ? ORDER BY bm25(notes_sub)" + limit_sql,
+                                          ('"' + query.replace('"', '""') + '"',))
+            return [name for (name,) in rows]
+        # Consultas de menos de 3 caracteres (o SQLite sin trigramas): se recorre el texto guardado
+        return list(itertools.islice((name for name, body in self._all_texts() if query in body.lower()), limit))
+
+    def search_texts(self, query):
+        """Recorre (nombre, texto plano) de las notas que tienen palabras que empiezan por
+        todos los términos de la consulta (sin distinguir acentos), por relevancia, sin cargarlas todas"""
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return iter(())
+        if self.has_fts:
+            # Cada término como prefijo entre comillas: evita la sintaxis de FTS5 del usuario
+            match = " ".join(f'"{t}"*' for t in terms)
+            return self.connect().execute("SELECT files.name, notes_fts.body FROM notes_fts "
+                                          "JOIN files ON files.id = notes_fts.rowid "
+                                          "WHERE notes_fts MATCH ? ORDER BY bm25(notes_fts)", (match,))
+        # Sin FTS5 se aplican las mismas reglas recorriendo el texto
+        patterns = [re.compile(r'(?<!\w)' + re.escape(strip_accents(t.lower()))) for t in terms]
+        def matches(body):
+            folded = strip_accents(body.lower())
+            return all(p.search(folded) for p in patterns)
+        return ((name, body) for name, body in self._all_texts() if matches(body))
+
+def parse_links_batch(paths):
+    """Tarea de proceso: [(nombre, destinos)] de un lote de notas"""
+    result = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                result.append((os.path.basename(path), sorted(extract_links(f.read(), markdown=is_markdown_note(path)))))
+        except OSError:
+            result.append((os.path.basename(path), []))
+    return result
+
+class LinkReportSignals(QObject):
+    progress = pyqtSignal(int, int, int)
+    finished = pyqtSignal(int, object)
+
+class LinkReportWorker(QRunnable):
+    """Analiza todas las notas en procesos paralelos: enlaces rotos y notas huérfanas"""
+    BATCH_SIZE = 250
+
+    def __init__(self, generation, vault_path):
+        super().__init__()
+        self.generation = generation
+        self.vault_path = vault_path
+        self.signals = LinkReportSignals()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        report = {"broken": {}, "orphans": [], "error": None}
+        try:
+            names = sorted(scan_vault_entries(self.vault_path))
+            stems = {os.path.splitext(n)[0].lower(): n for n in names}
+            paths = [os.path.join(self.vault_path, n) for n in names]
+            batches = [paths[i:i + self.BATCH_SIZE] for i in range(0, len(paths), self.BATCH_SIZE)]
+            linked = set()
+            done = 0
+            with ProcessPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+                futures = [pool.submit(parse_links_batch, batch) for batch in batches]
+                for future in as_completed(futures):
+                    if self._cancel.is_set():
+                        for f in futures: f.cancel()
+                        break
+                    for name, targets in future.result():
+                        for target in targets:
+                            target_file = stems.get(target)
+                            if target_file is None:
+                                report["broken"].setdefault(target, []).append(name)
+                            elif target_file != name:
+                                linked.add(target_file)
+                    done += 1
+                    self.signals.progress.emit(self.generation, done, len(batches))
+            report["orphans"] = [n for n in names if n not in linked]
+        except (OSError, RuntimeError) as e:
+            report["error"] = str(e)
+        if not self._cancel.is_set():
+            self.signals.finished.emit(self.generation, report)
+
+class VaultScanSignals(QObject):
+    # Cada señal lleva la "generación" del escaneo para descartar resultados viejos
+    files_found = pyqtSignal(int, list)  # [(nombre, mtime, tamaño, id), ...]
+    progress = pyqtSignal(int, int, int)
+    finished = pyqtSignal(int, bool)
+
+class VaultScanWorker(QRunnable):
+    """Escanea el vault en segundo plano: envía los nombres por lotes y luego actualiza el índice"""
+    BATCH_SIZE = 500
+
+    def __init__(self, generation, vault_path, vault_index=None):
+        super().__init__()
+        self.generation = generation
+        self.vault_path = vault_path
+        self.vault_index = vault_index
+        self.signals = VaultScanSignals()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def is_cancelled(self):
+        return self._cancel.is_set()
+
+    def run(self):
+        entries = {}
+        batch = []
+        try:
+            for name, mtime, size, file_id in iter_vault_entries(self.vault_path):
+                if self.is_cancelled():
+                    break
+                entries[name] = (mtime, size)
+                batch.append((name, mtime, size, file_id))
+                if len(batch) >= self.BATCH_SIZE:
+                    self.signals.files_found.emit(self.generation, batch)
+                    batch = []
+            if batch and not self.is_cancelled():
+                self.signals.files_found.emit(self.generation, batch)
+            if self.vault_index and not self.is_cancelled():
+                self.vault_index.sync(entries,
+                                      progress=lambda done, total: self.signals.progress.emit(self.generation, done, total),
+                                      should_stop=self.is_cancelled)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error al escanear el vault: {e}")
+        finally:
+            if self.vault_index:
+                self.vault_index.close()
+            self.signals.finished.emit(self.generation, not self.is_cancelled())
+
+
+# =============================================================================
+# MODELO DE LA LISTA LATERAL
+# =============================================================================
+class NameIndex:
+    """Índice nombre normalizado -> archivo para resolver enlaces internos en O(1).
+
+    La clave es el nombre sin extensión en minúsculas (lo que escriben los enlaces
+    model://nombre y ##nombre##). Las claves ordenadas se usan para autocompletar
+    por prefijo. Un registro de las claves que aparecen o desaparecen permite
+    saber qué enlaces cambiaron de estado desde una generación dada.
+    """
+    LOG_LIMIT = 50000
+
+    def __init__(self):
+        self._files = {}
+        self._sorted = []
+        self._sorted_dirty = False
+        self.generation = 0
+        self._log_generations = []
+        self._log_keys = []
+        self._log_base = 0  # generación desde la que el registro está completo
+
+    def _key_changed(self, key):
+        self.generation += 1
+        self._log_generations.append(self.generation)
+        self._log_keys.append(key)
+        if len(self._log_keys) > self.LOG_LIMIT:
+            half = self.LOG_LIMIT // 2
+            self._log_base = self._log_generations[half - 1]
+            del self._log_generations[:half]
+            del self._log_keys[:half]
+
+    def changed_since(self, generation):
+        """Claves que aparecieron o desaparecieron después de generation (None = no se sabe)"""
+        if generation < self._log_base:
+            return None
+        i = bisect.bisect_right(self._log_generations, generation)
+        return set(self._log_keys[i:])
+
+    @staticmethod
+    def key(name):
+        return os.path.splitext(name)[0].lower()
+
+    def clear(self):
+        self._files = {}
+        self._sorted = []
+        self._sorted_dirty = False
+        self.generation += 1
+        self._log_generations = []
+        self._log_keys = []
+        self._log_base = self.generation
+
+    def add(self, filename):
+        key = self.key(filename)
+        files = self._files.setdefault(key, [])
+        if filename not in files:
+            files.append(filename)
+            if len(files) == 1:
+                self._sorted_dirty = True
+                self._key_changed(key)
+
+    def remove(self, filename):
+        key = self.key(filename)
+        files = self._files.get(key)
+        if files and filename in files:
+            files.remove(filename)
+            if not files:
+                del self._files[key]
+                self._sorted_dirty = True
+                self._key_changed(key)
+
+    def resolve(self, target_name):
+        """Archivo al que apunta un enlace (o None si la nota no existe)"""
+        files = self._files.get(target_name.strip().lower())
+        return files[0] if files else None
+
+    def __contains__(self, target_name):
+        return target_name.strip().lower() in self._files
+
+    def complete(self, prefix, limit=50):
+        """Nombres (sin extensión) que empiezan por prefix, en orden alfabético"""
+        if self._sorted_dirty:
+            self._sorted = sorted(self._files)
+            self._sorted_dirty = False
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._sorted, prefix)
+        result = []
+        for key in itertools.islice(self._sorted, start, None):
+            if not key.startswith(prefix) or len(result) >= limit:
+                break
+            result.append(os.path.splitext(self._files[key][0])[0])
+        return result
+
+class NoteListModel(QAbstractListModel):
+    """Lista de nombres de notas con búsqueda nombre -> fila en O(1)"""
+    name_renamed = pyqtSignal(str, str)
+    names_changed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._names = []
+        self._rows = {}
+        self._rows_dirty = False
+        # Se mantiene junto con la lista: cualquier cambio de archivos lo actualiza
+        self.name_index = NameIndex()
+
+    @property
+    def names(self):
+        return self._names
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._names)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if index.isValid() and role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return self._names[index.row()]
+        return None
+
+    def name_at(self, row):
+        return self._names[row]
+
+    def row_of(self, name):
+        # El diccionario se reconstruye solo tras borrados (que desplazan filas)
+        if self._rows_dirty:
+            self._rows = {n: i for i, n in enumerate(self._names)}
+            self._rows_dirty = False
+        return self._rows.get(name, -1)
+
+    def __contains__(self, name):
+        return self.row_of(name) >= 0
+
+    def reset(self, names=()):
+        self.beginResetModel()
+        self._names = list(names)
+        self._rows_dirty = True
+        self.name_index.clear()
+        for name in self._names:
+            self.name_index.add(name)
+        self.endResetModel()
+        self.names_changed.emit()
+
+    def append_names(self, names):
+        names = [n for n in names if n not in self]
+        if not names: return
+        first = len(self._names)
+        self.beginInsertRows(QModelIndex(), first, first + len(names) - 1)
+        for i, name in enumerate(names, first):
+            self._names.append(name)
+            self._rows[name] = i
+            self.name_index.add(name)
+        self.endInsertRows()
+        self.names_changed.emit()
+
+    def remove_name(self, name):
+        row = self.row_of(name)
+        if row < 0: return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._names[row]
+        self._rows_dirty = True
+        self.name_index.remove(name)
+        self.endRemoveRows()
+        self.names_changed.emit()
+
+    def rename(self, old_name, new_name):
+        row = self.row_of(old_name)
+        if row < 0: return
+        self.remove_name(new_name)
+        row = self.row_of(old_name)
+        self._names[row] = new_name
+        del self._rows[old_name]
+        self._rows[new_name] = row
+        self.name_index.remove(old_name)
+        self.name_index.add(new_name)
+        idx = self.index(row)
+        self.dataChanged.emit(idx, idx)
+        self.name_renamed.emit(old_name, new_name)
+        self.names_changed.emit()
+
+class NoteFilterProxy(QAbstractProxyModel):
+    """Proxy de filtrado de la lista de notas.
+
+    Sin filtro se comporta como identidad. Con filtro muestra una lista de nombres
+    ya calculada (y ordenada por relevancia) fuera del hilo de la GUI, así que no
+    se evalúa ningún predicado por fila en Python.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._names = None
+        self._rows = {}
+
+    @property
+    def is_filtered(self):
+        return self._names is not None
+
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        model.rowsAboutToBeInserted.connect(self._on_rows_about_to_be_inserted)
+        model.rowsInserted.connect(self._on_rows_inserted)
+        model.rowsAboutToBeRemoved.connect(self._on_rows_about_to_be_removed)
+        model.rowsRemoved.connect(self._on_rows_removed)
+        model.dataChanged.connect(self._on_data_changed)
+        model.name_renamed.connect(self._on_name_renamed)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self._on_model_reset)
+
+    def set_filter(self, names):
+        """names=None quita el filtro; si no, lista ordenada de nombres a mostrar"""
+        self.beginResetModel()
+        if names is None:
+            self._names = None
+            self._rows = {}
+        else:
+            src = self.sourceModel()
+            self._names = [n for n in names if n in src]
+            self._rows = {n: i for i, n in enumerate(self._names)}
+        self.endResetModel()
+
+    # --- Estructura del modelo ---
+    def index(self, row, column=0, parent=QModelIndex()):
+        if parent.isValid() or column != 0 or not 0 <= row < self.rowCount():
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid(): return 0
+        if self._names is None:
+            return self.sourceModel().rowCount() if self.sourceModel() else 0
+        return len(self._names)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 1
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid(): return QModelIndex()
+        src = self.sourceModel()
+        if self._names is None:
+            return src.index(proxy_index.row())
+        return src.index(src.row_of(self._names[proxy_index.row()]))
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid(): return QModelIndex()
+        if self._names is None:
+            return self.index(source_index.row())
+        row = self._rows.get(self.sourceModel().name_at(source_index.row()), -1)
+        return self.index(row) if row >= 0 else QModelIndex()
+
+    # --- Propagación de cambios del modelo fuente ---
+    def _on_rows_about_to_be_inserted(self, parent, first, last):
+        if self._names is None: self.beginInsertRows(QModelIndex(), first, last)
+
+    def _on_rows_inserted(self, parent, first, last):
+        # Con filtro activo las notas nuevas aparecen al recalcularlo
+        if self._names is None: self.endInsertRows()
+
+    def _on_rows_about_to_be_removed(self, parent, first, last):
+        if self._names is None:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            return
+        src = self.sourceModel()
+        for row in range(last, first - 1, -1):
+            proxy_row = self._rows.get(src.name_at(row), -1)
+            if proxy_row >= 0:
+                self.beginRemoveRows(QModelIndex(), proxy_row, proxy_row)
+                del self._names[proxy_row]
+                self._rows = {n: i for i, n in enumerate(self._names)}
+                self.endRemoveRows()
+
+    def _on_rows_removed(self, parent, first, last):
+        if self._names is None: self.endRemoveRows()
+
+    def _on_data_changed(self, top_left, bottom_right, roles=()):
+        if self._names is None:
+            self.dataChanged.emit(self.index(top_left.row()), self.index(bottom_right.row()))
+
+    def _on_name_renamed(self, old_name, new_name):
+        if self._names is None or old_name not in self._rows: return
+        row = self._rows.pop(old_name)
+        self._names[row] = new_name
+        self._rows[new_name] = row
+        self.dataChanged.emit(self.index(row), self.index(row))
+
+    def _on_model_reset(self):
+        if self._names is not None:
+            self._names = []
+            self._rows = {}
+        self.endResetModel()
+
+class FilterSignals(QObject):
+    ready = pyqtSignal(int, object)
+
+class NoteFilterWorker(QRunnable):
+    """Calcula el filtro de la lista lateral fuera del hilo de la GUI"""
+    def __init__(self, generation, query, names, vault_index=None):
+        super().__init__()
+        self.generation = generation
+        self.query = query.lower()
+        self.names = names
+        self.vault_index = vault_index
+        self.signals = FilterSignals()
+
+    def run(self):
+        # Primero coincidencias por nombre; luego por contenido, ordenadas por relevancia (BM25)
+        matches = [f for f in self.names if self.query in f.lower()]
+        if self.vault_index:
+            seen = set(matches)
+            try:
+                matches.extend(f for f in self.vault_index.search(self.query) if f not in seen)
+            except sqlite3.Error as e:
+                print(f"Error al buscar en el índice: {e}")
+            finally:
+                self.vault_index.close()
+        self.signals.ready.emit(self.generation, matches)
+
+# =============================================================================
+# SELECTOR RÁPIDO DE NOTAS (CTRL+P)
+# =============================================================================
+class FuzzyNameIndex:
+    """Índice precalculado de nombres de notas para búsqueda difusa.
+
+    Los nombres (en minúsculas y sin extensión) se concatenan en un único texto
+    con sus desplazamientos, de modo que las coincidencias por prefijo, contiguas
+    y por subsecuencia se buscan con una sola pasada de regex en C. Cada nivel se
+    corta en MAX_PER_TIER resultados, así que el coste por tecla está acotado.
+    """
+    MAX_PER_TIER = 300
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.keys = [os.path.splitext(n)[0].lower() for n in self.names]
+        self.ids = {n: i for i, n in enumerate(self.names)}
+        # Cada nombre va precedido de "\n": así el prefijo es una búsqueda literal ("\nconsulta")
+        self.blob = "".join("\n" + k for k in self.keys)
+        self.starts = list(itertools.accumulate((len(k) + 1 for k in self.keys[:-1]), initial=0))
+
+    def _collect(self, pattern, found):
+        """Agrega a found los índices de nombre que coinciden con pattern (acotado)"""
+        count = 0
+        for m in pattern.finditer(self.blob):
+            i = bisect.bisect_right(self.starts, m.start()) - 1
+            if i not in found:
+                found.add(i)
+                count += 1
+                if count >= self.MAX_PER_TIER:
+                    break
+
+    def _match_score(self, key, query, pattern):
+        if key.startswith(query):
+            return 100 - min(len(key) - len(query), 20)
+        pos = key.find(query)
+        if pos >= 0:
+            # Bonificación si la coincidencia empieza una palabra
+            boundary = not key[pos - 1].isalnum()
+            return (85 if boundary else 70) - min(len(key) - len(query), 20) / 2
+        m = pattern.search(key)
+        if not m:
+            return None
+        spread = (m.end() - m.start()) - len(query)
+        return max(10, 55 - spread * 2 - m.start())
+
+    def search(self, query, frecency=None, limit=50):
+        """Devuelve [(nombre, puntuación)] ordenados por coincidencia + frecencia"""
+        query = query.strip().lower().replace("\n", "")
+        frecency = frecency or {}
+        if not query:
+            ranked = sorted(((frecency.get(n, 0), n) for n in self.names if frecency.get(n)), reverse=True)
+            return [(n, score) for score, n in ranked[:limit]]
+        
+        # Las notas con frecencia se evalúan siempre; luego prefijo, contiguas y subsecuencia
+        found = {self.ids[n] for n in frecency if n in self.ids}
+        escaped = re.escape(query)
+        self._collect(re.compile("\n" + escaped), found)
+        self._collect(re.compile(escaped), found)
+        # Subsecuencia con clases negadas ("a[^\nb]*b"): sin retroceso, lineal en el texto
+        pattern = re.compile(re.escape(query[0]) + "".join(
+            f"[^\n{re.escape(c)}]*{re.escape(c)}" for c in query[1:]))
+        if sum(1 for i in found if query in self.keys[i]) < limit:
+            self._collect(pattern, found)
+
+        results = []
+        for i in found:
+            score = self._match_score(self.keys[i], query, pattern)
+            if score is not None:
+                name = self.names[i]
+                results.append((name, score + frecency.get(name, 0)))
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results[:limit]
+
+class FrecencyStore:
+    """Frecuencia y fecha de apertura de cada nota, persistida en <vault>/.maletin/frecency.json"""
+    DAY = 86400
+
+    def __init__(self, vault_path):
+        self.vault_path = vault_path
+        self.path = os.path.join(get_vault_meta_dir(vault_path), "frecency.json")
+        self.visits = {}
+        self.dirty = False
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.visits = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error al cargar la frecencia: {e}")
+
+    def record(self, filename):
+        entry = self.visits.setdefault(filename, {"count": 0, "last": 0})
+        entry["count"] += 1
+        entry["last"] = time.time()
+        self.dirty = True
+
+    def rename(self, old_name, new_name):
+        if old_name in self.visits:
+            self.visits[new_name] = self.visits.pop(old_name)
+            self.dirty = True
+
+    def scores(self):
+        """{nombre: puntuación} combinando cuántas veces y hace cuánto se abrió"""
+        now = time.time()
+        result = {}
+        for name, entry in self.visits.items():
+            age = now - entry.get("last", 0)
+            if age < self.DAY: weight = 1.0
+            elif age < 7 * self.DAY: weight = 0.7
+            elif age < 30 * self.DAY: weight = 0.5
+            elif age < 90 * self.DAY: weight = 0.3
+            else: weight = 0.1
+            result[name] = 12 * math.log2(1 + entry.get("count", 0)) * weight
+        return result
+
+    def save(self):
+        if not self.dirty: return
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.visits, f)
+            self.dirty = False
+        except OSError as e:
+            print(f"Error al guardar la frecencia: {e}")
+
+class QuickSwitcherDialog(QDialog):
+    """Paleta tipo Ctrl+P para saltar a una nota por nombre"""
+    def __init__(self, parent, name_index, frecency):
+        super().__init__(parent)
+        self.name_index = name_index
+        self.frecency = frecency
+        self.selected_file = None
+        self.setWindowTitle("Ir a nota")
+        self.setWindowFlags(Qt.WindowType.Popup)
+        self.resize(700, 450)
+        self.init_ui()
+        self.update_results("")
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+        self.txt_query = QLineEdit()
+        self.txt_query.setPlaceholderText("🔎 Nombre de la nota...")
+        self.txt_query.textChanged.connect(self.update_results)
+        self.txt_query.returnPressed.connect(self.accept_current)
+        self.txt_query.installEventFilter(self)
+        self.lst_results = QListWidget()
+        self.lst_results.itemActivated.connect(lambda item: self.accept_current())
+        self.lst_results.itemClicked.connect(lambda item: self.accept_current())
+        layout.addWidget(self.txt_query)
+        layout.addWidget(self.lst_results)
+        self.setLayout(layout)
+
+    def eventFilter(self, obj, event):
+        # Flechas y RePág/AvPág mueven la selección sin salir del campo de texto
+        if obj is self.txt_query and event.type() == QEvent.Type.KeyPress:
+            if event.key() in (Qt.Key.Key_Down, Qt.Key.Key_Up, Qt.Key.Key_PageDown, Qt.Key.Key_PageUp):
+                QApplication.sendEvent(self.lst_results, event)
+                return True
+        return super().eventFilter(obj, event)
+
+    def update_results(self, query):
+        self.lst_results.clear()
+        for name, _ in self.name_index.search(query, self.frecency):
+            self.lst_results.addItem(name)
+        if self.lst_results.count():
+            self.lst_results.setCurrentRow(0)
+
+    def accept_current(self):
+        item = self.lst_results.currentItem()
+        if item:
+            self.selected_file = item.text()
+            self.accept()
+
+# =============================================================================
+# BÚSQUEDA DE TEXTO EN TODO EL VAULT
+# =============================================================================
+# Variantes acentuadas de cada letra: el índice FTS ignora los acentos y los
+# fragmentos deben resaltar lo mismo que encontró
+SEARCH_ACCENTS = {'a': 'aáàâäã', 'e': 'eéèêë', 'i': 'iíìîï', 'o': 'oóòôöõ',
+                  'u': 'uúùûü', 'n': 'nñ', 'c': 'cç'}
+# Contexto a cada lado de una coincidencia, fragmentos por nota y notas como máximo
+SEARCH_SNIPPET_RADIUS = 50
+SEARCH_SNIPPETS_PER_NOTE = 3
+SEARCH_MAX_NOTES = 500
+# Role con el HTML resaltado de un fragmento
+SNIPPET_HTML_ROLE = Qt.ItemDataRole.UserRole + 1
+
+def strip_accents(text):
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if not unicodedata.combining(c))
+
+def compile_vault_search_pattern(query):
+    """Patrón que marca las palabras que empiezan por algún término de la consulta.
+
+    Sigue las reglas de VaultIndex.search_texts (términos como prefijo, sin distinguir
+    mayúsculas ni acentos). Devuelve None si la consulta no tiene palabras.
+    """
+    terms = {strip_accents(t.lower()) for t in re.findall(r'\w+', query)}
+    if not terms:
+        return None
+    parts = [''.join(f'[{SEARCH_ACCENTS[c]}]' if c in SEARCH_ACCENTS else re.escape(c) for c in term)
+             for term in sorted(terms, key=len, reverse=True)]
+    return re.compile(r'(?<!\w)(?:' + '|'.join(parts) + r')\w*', re.IGNORECASE)
+
+def build_snippet(text, start, end, pattern):
+    """Fragmento alrededor de text[start:end]: (HTML con las coincidencias resaltadas, texto plano)"""
+    lo = max(0, start - SEARCH_SNIPPET_RADIUS)
+    hi = min(len(text), end + SEARCH_SNIPPET_RADIUS)
+    piece = text[lo:hi]
+    html_parts, plain_parts = [], []
+    last = 0
+    for m in pattern.finditer(piece):
+        gap = re.sub(r'\s+', ' ', piece[last:m.start()])
+        html_parts.append(html.escape(gap))
+        html_parts.append(f'<b style="color:{C_WARNING};">{html.escape(m.group())}</b>')
+        plain_parts.append(gap + m.group())
+        last = m.end()
+    gap = re.sub(r'\s+', ' ', piece[last:])
+    html_parts.append(html.escape(gap))
+    plain_parts.append(gap)
+    prefix = "…" if lo > 0 else ""
+    suffix = "…" if hi < len(text) else ""
+    return (prefix + ''.join(html_parts).strip() + suffix,
+            prefix + ''.join(plain_parts).strip() + suffix)
+
+def search_note_text(text, pattern):
+    """(coincidencias, [(html, texto, número de coincidencia)]) de una nota; None si no hay"""
+    snippets = []
+    count = 0
+    covered = -1
+    for m in pattern.finditer(text):
+        if len(snippets) < SEARCH_SNIPPETS_PER_NOTE and m.start() >= covered:
+            html_text, plain = build_snippet(text, m.start(), m.end(), pattern)
+            snippets.append((html_text, plain, count))
+            covered = m.end() + SEARCH_SNIPPET_RADIUS
+        count += 1
+    return (count, snippets) if count else None
+
+class VaultSearchSignals(QObject):
+    results = pyqtSignal(int, list)  # [(nombre, coincidencias, fragmentos), ...]
+    finished = pyqtSignal(int, int, bool)  # notas, truncado
+
+class VaultSearchWorker(QRunnable):
+    """Busca en el texto plano de las notas y envía los resultados por tandas.
+
+    Usa el índice para saber qué notas contienen los términos (y su texto ya
+    extraído); sin índice lee y extrae cada nota del disco.
+    """
+    EMIT_SECONDS = 0.1
+
+    def __init__(self, generation, query, pattern, vault_path, vault_index=None):
+        super().__init__()
+        self.generation = generation
+        self.query = query
+        self.pattern = pattern
+        self.vault_path = vault_path
+        self.vault_index = vault_index
+        self.signals = VaultSearchSignals()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def iter_texts(self):
+        if self.vault_index:
+            yield from self.vault_index.search_texts(self.query)
+            return
+        for name in sorted(scan_vault_entries(self.vault_path)):
+            try:
+                with open(os.path.join(self.vault_path, name), 'r', encoding='utf-8', errors='ignore') as f:
+                    yield name, extract_plain_text(f.read(), is_markdown_note(name))
+            except OSError:
+                continue
+
+    def run(self):
+        found = 0
+        truncated = False
+        batch = []
+        last_emit = time.monotonic()
+        try:
+            for name, text in self.iter_texts():
+                if self._cancel.is_set(): return
+                result = search_note_text(text or "", self.pattern)
+                if result is None: continue
+                if found == SEARCH_MAX_NOTES:
+                    truncated = True
+                    break
+                found += 1
+                batch.append((name, result[0], result[1]))
+                if time.monotonic() - last_emit >= self.EMIT_SECONDS:
+                    self.signals.results.emit(self.generation, batch)
+                    batch = []
+                    last_emit = time.monotonic()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error al buscar en el vault: {e}")
+        finally:
+            if self.vault_index:
+                self.vault_index.close()
+        if self._cancel.is_set(): return
+        if batch:
+            self.signals.results.emit(self.generation, batch)
+        self.signals.finished.emit(self.generation, found, truncated)
+
+class SnippetDelegate(QStyledItemDelegate):
+    """Pinta los fragmentos de búsqueda como HTML (coincidencias resaltadas)"""
+    def paint(self, painter, option, index):
+        html_text = index.data(SNIPPET_HTML_ROLE)
+        if not html_text:
+            super().paint(painter, option, index)
+            return
+        opt = QStyleOptionViewItem(option)
+        self.initStyleOption(opt, index)
+        opt.text = ""
+        style = opt.widget.style() if opt.widget else QApplication.style()
+        style.drawControl(QStyle.ControlElement.CE_ItemViewItem, opt, painter, opt.widget)
+        doc = QTextDocument()
+        doc.setDocumentMargin(0)
+        doc.setDefaultFont(opt.font)
+        doc.setHtml(f'<span style="color:{C_FG};">{html_text}</span>')
+        rect = style.subElementRect(QStyle.SubElement.SE_ItemViewItemText, opt, opt.widget)
+        painter.save()
+        painter.translate(rect.left(), rect.top() + (rect.height() - doc.size().height()) / 2)
+        painter.setClipRect(0, 0, rect.width(), rect.height())
+        doc.drawContents(painter)
+        painter.restore()
+
+# =============================================================================
+# REEMPLAZO EN TODO EL VAULT
+# =============================================================================
+# Lotes de reemplazo guardados en <vault>/.maletin/replace para poder deshacerlos
+REPLACE_DIRNAME = "replace"
+REPLACE_KEEP_BATCHES = 10
+REPLACE_PREVIEW_SAMPLES = 5
+REPLACE_CONTEXT_CHARS = 40
+_HTML_TOKEN_RE = re.compile(r'(<[^>]*>)')
+_HTML_HIDDEN_TAG_RE = re.compile(r'<(/?)(head|style|script|title)\b', re.IGNORECASE)
+# Todo lo que en Markdown no es texto visible (o es código): escapes, bloques y
+# tramos de código, destinos de enlaces, autoenlaces, marcas de inicio de línea,
+# líneas de reglas/tablas, énfasis, corchetes y separadores de tabla
+_MD_MARKUP_TOKEN_RE = re.compile(
+    r'(\\[!-/:-@\[-`{-~]'
+    r'|^[ ]{0,3}(?P<fence>`{3,}|~{3,})[^\n]*\n(?:.*?^[ ]{0,3}(?P=fence)[ \t]*$|.*\Z)'
+    r'|(?P<ticks>`+)[^\n]*?(?P=ticks)'
+    r'|\]\((?:<[^>\n]*>|[^)\s]*)(?:[ \t]+"[^"\n]*")?\)'
+    r'|<[A-Za-z][\w+.-]*:[^\s<>]*>'
+    r'|^[ \t]*(?:#{1,6}[ \t]+|>[ \t]?|[-*+][ \t]+(?:\[[ xX]\][ \t]+)?|\d+[.)][ \t]+)'
+    r'|^[ \t]*[-=*_|:][-=*_|: \t]*$'
+    r'|[*~]+|(?<!\w)_+|_+(?!\w)|!?\[|\]|\|)',
+    re.MULTILINE | re.DOTALL)
+_MD_REPLACEMENT_ESCAPE_RE = re.compile(r'([\\`*_\[\]<>|~])')
+
+def make_replacement(pattern, template, regex):
+    """Función match -> texto de reemplazo (la plantilla solo admite grupos en modo regex)"""
+    if regex:
+        return compile_replacement(template, pattern)
+    return lambda match: template
+
+def substitute_text(text, pattern, replacement, samples=None):
+    """Reemplaza las coincidencias no vacías de text; devuelve (texto, cantidad).
+
+    Si se pasa samples, se añaden (antes, viejo, nuevo, después) de las primeras
+    coincidencias para la vista previa.
+    """
+    out = []
+    last = 0
+    for m in pattern.finditer(text):
+        if m.start() == m.end(): continue
+        new = replacement(m)
+        out.append(text[last:m.start()])
+        out.append(new)
+        last = m.end()
+        if samples is not None and len(samples) < REPLACE_PREVIEW_SAMPLES:
+            before = text[max(0, m.start() - REPLACE_CONTEXT_CHARS):m.start()]
+            after = text[m.end():m.end() + REPLACE_CONTEXT_CHARS]
+            samples.append((re.sub(r'\s+', ' ', before), m.group(), new, re.sub(r'\s+', ' ', after)))
+    if not out:
+        return text, 0
+    out.append(text[last:])
+    return ''.join(out), len(out) // 2
+
+def replace_in_text_nodes(content, pattern, replacement, samples=None):
+    """Reemplaza solo en el texto visible de un HTML de Qt, nunca en etiquetas, atributos ni estilos.
+
+    Los nodos de texto sin coincidencias quedan tal cual; los modificados se
+    vuelven a escapar. Una coincidencia partida por un cambio de formato (dos
+    nodos distintos) no se reemplaza.
+    """
+    parts = _HTML_TOKEN_RE.split(content)
+    hidden = 0
+    count = 0
+    for i, part in enumerate(parts):
+        if i % 2:
+            tag = _HTML_HIDDEN_TAG_RE.match(part)
+            if tag:
+                hidden = max(0, hidden - 1) if tag.group(1) else hidden + 1
+            continue
+        if hidden or not part: continue
+        text, n = substitute_text(html.unescape(part), pattern, replacement, samples)
+        if n:
+            parts[i] = html.escape(text, quote=False)
+            count += n
+    return (''.join(parts), count) if count else (content, 0)
+
+def replace_in_markdown_text(content, pattern, replacement, samples=None):
+    """Reemplaza solo en el texto visible de una nota Markdown.
+
+    Marcas, destinos de enlaces y código quedan intactos, y el texto nuevo se
+    escapa para que no cree marcas. Como en el HTML, una coincidencia partida por
+    una marca (énfasis, escape) no se reemplaza.
+    """
+    parts = _MD_MARKUP_TOKEN_RE.split(content)
+    step = _MD_MARKUP_TOKEN_RE.groups + 1
+    escaped = lambda m: _MD_REPLACEMENT_ESCAPE_RE.sub(r'\\\1', replacement(m))
+    count = 0
+    for i in range(0, len(parts), step):
+        if not parts[i]: continue
+        text, n = substitute_text(parts[i], pattern, escaped, samples)
+        if n:
+            parts[i] = text
+            count += n
+    if not count:
+        return content, 0
+    return ''.join(parts[i] for i in range(len(parts)) if i % step in (0, 1)), count
+
+def replace_in_note(content, pattern, replacement, samples=None, markdown=False):
+    """Reemplazo sobre el contenido de una nota según su formato: (contenido, cantidad)"""
+    if markdown:
+        return replace_in_markdown_text(content, pattern, replacement, samples)
+    if "<html" in content:
+        return replace_in_text_nodes(content, pattern, replacement, samples)
+    if "{\\rtf" in content:
+        return content, 0  # RTF crudo: no se toca
+    return substitute_text(content, pattern, replacement, samples)
+
+def scan_replace_batch(paths, find_args, template):
+    """Tarea de proceso: [(nombre, cantidad, muestras, sha1, error)] de las notas con coincidencias"""
+    pattern = compile_find_pattern(*find_args)
+    replacement = make_replacement(pattern, template, find_args[2])
+    results = []
+    for path in paths:
+        name = os.path.basename(path)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            samples = []
+            _, count = replace_in_note(data.decode('utf-8'), pattern, replacement, samples, is_markdown_note(path))
+            if count:
+                results.append((name, count, samples, hashlib.sha1(data).hexdigest(), None))
+        except (OSError, UnicodeDecodeError) as e:
+            results.append((name, 0, [], None, str(e)))
+    return results
+
+def apply_replace_batch(jobs, find_args, template, batch_dir):
+    """Tarea de proceso: aplica el reemplazo a [(número, ruta, sha1 previsto)].
+
+    Antes de tocar cada nota guarda su original en el lote (<número>.orig) y
+    después deja <número>.json con los sha1 de antes y después, lo que permite
+    deshacer incluso un lote interrumpido. Las notas que cambiaron desde la
+    vista previa se saltan. Devuelve [(nombre, cantidad, error)].
+    """
+    pattern = compile_find_pattern(*find_args)
+    replacement = make_replacement(pattern, template, find_args[2])
+    results = []
+    for number, path, expected in jobs:
+        name = os.path.basename(path)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if hashlib.sha1(data).hexdigest() != expected:
+                results.append((name, 0, "cambió desde la vista previa"))
+                continue
+            content, count = replace_in_note(data.decode('utf-8'), pattern, replacement,
+                                             markdown=is_markdown_note(path))
+            if not count:
+                results.append((name, 0, None))
+                continue
+            with open(os.path.join(batch_dir, f"{number}.orig"), 'wb') as f:
+                f.write(zlib.compress(data))
+                f.flush()
+                os.fsync(f.fileno())
+            atomic_write_text(path, content)
+            record = {"name": name, "before": expected,
+                      "after": hashlib.sha1(content.encode('utf-8')).hexdigest()}
+            atomic_write_text(os.path.join(batch_dir, f"{number}.json"), json.dumps(record))
+            results.append((name, count, None))
+        except (OSError, UnicodeDecodeError) as e:
+            results.append((name, 0, str(e)))
+    return results
+
+def create_replace_batch(vault_path, manifest):
+    """Crea la carpeta de un lote nuevo con su manifiesto; borra los lotes más viejos"""
+    root = os.path.join(get_vault_meta_dir(vault_path), REPLACE_DIRNAME)
+    os.makedirs(root, exist_ok=True)
+    batch_dir = os.path.join(root, time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}")
+    os.makedirs(batch_dir)
+    atomic_write_text(os.path.join(batch_dir, "manifest.json"), json.dumps(manifest, ensure_ascii=False))
+    batches = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    for old in batches[:-REPLACE_KEEP_BATCHES]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return batch_dir
+
+def latest_replace_batch(vault_path):
+    """(carpeta, manifiesto) del último lote sin deshacer, o None"""
+    root = os.path.join(vault_path, VAULT_META_DIRNAME, REPLACE_DIRNAME)
+    try:
+        batches = sorted((d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d))), reverse=True)
+    except OSError:
+        return None
+    for name in batches:
+        batch_dir = os.path.join(root, name)
+        try:
+            with open(os.path.join(batch_dir, "manifest.json"), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not manifest.get("undone"):
+            return batch_dir, manifest
+    return None
+
+def undo_replace_batch(vault_path, batch_dir, manifest):
+    """Restaura los originales de un lote: (restauradas, [conflictos]).
+
+    Solo se restaura una nota si sigue tal como la dejó el reemplazo; si se
+    editó después queda como está y se informa.
+    """
+    restored = []
+    conflicts = []
+    for number, name in enumerate(manifest["files"]):
+        try:
+            with open(os.path.join(batch_dir, f"{number}.json"), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue  # la nota no llegó a modificarse
+        path = os.path.join(vault_path, name)
+        try:
+            with open(path, 'rb') as f:
+                current = hashlib.sha1(f.read()).hexdigest()
+            if current == record["before"]: continue
+            if current != record["after"]:
+                conflicts.append(name)
+                continue
+            with open(os.path.join(batch_dir, f"{number}.orig"), 'rb') as f:
+                original = zlib.decompress(f.read()).decode('utf-8')
+            atomic_write_text(path, original)
+            restored.append(name)
+        except (OSError, ValueError, zlib.error) as e:
+            conflicts.append(f"{name}: {e}")
+    manifest["undone"] = True
+    atomic_write_text(os.path.join(batch_dir, "manifest.json"), json.dumps(manifest, ensure_ascii=False))
+    return restored, conflicts
+
+class VaultReplaceSignals(QObject):
+    progress = pyqtSignal(int, int, int)
+    finished = pyqtSignal(int, object)
+
+class VaultReplaceWorker(QRunnable):
+    """Busca (vista previa) o aplica un reemplazo en todo el vault con procesos paralelos.
+
+    Sin jobs analiza todas las notas; con jobs [(número, ruta, sha1)] aplica el
+    reemplazo a esas notas guardando los originales en batch_dir.
+    """
+    BATCH_SIZE = 100
+
+    def __init__(self, generation, vault_path, find_args, template, jobs=None, batch_dir=None):
+        super().__init__()
+        self.generation = generation
+        self.vault_path = vault_path
+        self.find_args = find_args
+        self.template = template
+        self.jobs = jobs
+        self.batch_dir = batch_dir
+        self.signals = VaultReplaceSignals()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        report = {"results": [], "error": None}
+        try:
+            if self.jobs is None:
+                items = [os.path.join(self.vault_path, n) for n in sorted(scan_vault_entries(self.vault_path))]
+                task = scan_replace_batch
+            else:
+                items = self.jobs
+                task = apply_replace_batch
+            batches = [items[i:i + self.BATCH_SIZE] for i in range(0, len(items), self.BATCH_SIZE)]
+            extra = () if self.jobs is None else (self.batch_dir,)
+            done = 0
+            with ProcessPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+                futures = [pool.submit(task, batch, self.find_args, self.template, *extra) for batch in batches]
+                for future in as_completed(futures):
+                    # Al aplicar no se cancela a medias: cada lote ya empezado termina
+                    if self._cancel.is_set() and self.jobs is None:
+                        for f in futures: f.cancel()
+                        break
+                    report["results"].extend(future.result())
+                    done += 1
+                    self.signals.progress.emit(self.generation, done, len(batches))
+        except (OSError, RuntimeError, re.error) as e:
+            report["error"] = str(e)
+        if not self._cancel.is_set() or self.jobs is not None:
+            self.signals.finished.emit(self.generation, report)
+
+# =============================================================================
+# CONVERSIÓN DE MARKDOWN
+# =============================================================================
+# Conversor de una sola pasada: los bloques se reconocen línea a línea (mirando
+# como mucho la línea siguiente, para tablas) y el texto de cada bloque se
+# tokeniza una vez; el énfasis se resuelve con una pila de delimitadores como
+# en CommonMark. Todo es lineal en el tamaño del texto.
+MD_ATX_RE = re.compile(r' {0,3}(#{1,6})(?:[ \t]+|$)(.*?)(?:[ \t]+#+)?[ \t]*$')
+MD_SETEXT_RE = re.compile(r' {0,3}(=+|-+)[ \t]*$')
+MD_HR_RE = re.compile(r' {0,3}(?:(?:\*[ \t]*){3,}|(?:-[ \t]*){3,}|(?:_[ \t]*){3,})$')
+MD_FENCE_RE = re.compile(r'( {0,3})(`{3,}|~{3,})[ \t]*([^`\s]*)')
+MD_QUOTE_RE = re.compile(r' {0,3}> ?(.*)$')
+MD_LIST_RE = re.compile(r'( *)([-+*]|(\d{1,9})[.)])(?:[ \t]+(.*)|$)')
+MD_TABLE_DELIM_RE = re.compile(r' {0,3}\|?[ \t]*:?-+:?[ \t]*(?:\|[ \t]*:?-+:?[ \t]*)*\|?[ \t]*$')
+# Separador de celdas: | sin escapar y fuera de un [[enlace|alias]]
+MD_TABLE_SPLIT_RE = re.compile(r'(?<!\\)\|(?![^\[\n]*\]\])')
+MD_INLINE_SPECIAL_RE = re.compile(r'[\\`!\[<*_\n]')
+MD_AUTOLINK_RE = re.compile(r'<((?:https?|ftp)://[^\s<>]+|mailto:[^\s<>]+)>')
+MD_PUNCTUATION = set('!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~')
+MD_LINK_STYLE = 'color:#7dcfff;'
+MD_HEADING_STYLES = {1: 'font-size:24pt; color:#7aa2f7;', 2: 'font-size:20pt; color:#7aa2f7;'}
+
+class _MdDelimiter:
+    """Tramo de * o _ que puede abrir o cerrar énfasis (nodo de una lista doblemente enlazada)"""
+    __slots__ = ('char', 'count', 'length', 'can_open', 'can_close', 'open_tags', 'close_tags',
+                 'index', 'prev', 'next')
+
+    def __init__(self, char, length, can_open, can_close):
+        self.char = char
+        self.count = length
+        self.length = length
+        self.can_open = can_open
+        self.can_close = can_close
+        self.open_tags = []
+        self.close_tags = []
+        self.index = 0
+        self.prev = None
+        self.next = None
+
+    def __str__(self):
+        return ''.join(self.close_tags) + self.char * self.count + ''.join(self.open_tags)
+
+    def unlink(self):
+        if self.prev: self.prev.next = self.next
+        if self.next: self.next.prev = self.prev
+
+MD_BRACKET_RE = re.compile(r'\\.|[\[\]]', re.DOTALL)
+
+def _md_bracket_pairs(text):
+    """Posición del ] que cierra cada [ (una pasada con pila)"""
+    pairs = {}
+    stack = []
+    for m in MD_BRACKET_RE.finditer(text):
+        c = m.group()
+        if c == '[':
+            stack.append(m.start())
+        elif c == ']' and stack:
+            pairs[stack.pop()] = m.start()
+    return pairs
+
+def _md_process_emphasis(delimiters):
+    """Empareja los delimitadores de énfasis (algoritmo de CommonMark simplificado).
+
+    Los delimitadores forman una lista doblemente enlazada: quitar los que quedan
+    entre un par emparejado es O(1), así el total sigue siendo lineal.
+    """
+    previous = None
+    for i, delimiter in enumerate(delimiters):
+        delimiter.index = i
+        delimiter.prev = previous
+        if previous: previous.next = delimiter
+        previous = delimiter
+    # (carácter, puede abrir, largo % 3) -> índice hasta el cual no hay abridores útiles
+    bottom = {}
+    closer = delimiters[0] if delimiters else None
+    while closer is not None:
+        if not closer.can_close or closer.count == 0:
+            closer = closer.next
+            continue
+        key = (closer.char, closer.can_open, closer.length % 3)
+        lowest = bottom.get(key, -1)
+        opener = closer.prev
+        while opener is not None and opener.index > lowest:
+            if opener.char == closer.char and opener.can_open and opener.count:
+                # "Regla del 3" de CommonMark para tramos que abren y cierran a la vez
+                odd = ((opener.can_close or closer.can_open)
+                       and (opener.length + closer.length) % 3 == 0
+                       and (opener.length % 3 or closer.length % 3))
+                if not odd: break
+            opener = opener.prev
+        else:
+            opener = None
+        if opener is None:
+            bottom[key] = closer.prev.index if closer.prev else -1
+            following = closer.next
+            if not closer.can_open: closer.unlink()
+            closer = following
+            continue
+        use = 2 if opener.count >= 2 and closer.count >= 2 else 1
+        tag = 'b' if use == 2 else 'i'
+        opener.count -= use
+        closer.count -= use
+        opener.open_tags.insert(0, f'<{tag}>')
+        closer.close_tags.append(f'</{tag}>')
+        # Lo que quedó entre ambos ya no puede emparejarse
+        opener.next = closer
+        closer.prev = opener
+        if opener.count == 0:
+            opener.unlink()
+        if closer.count == 0:
+            following = closer.next
+            closer.unlink()
+            closer = following
+
+def render_markdown_inline(text):
+    """Convierte el texto de un bloque: énfasis, código, enlaces, [[enlaces wiki]] y saltos.
+
+    El texto de un enlace se convierte en la misma pasada, sin buscar enlaces
+    dentro (CommonMark no los permite) y con su propio énfasis.
+    """
+    if not MD_INLINE_SPECIAL_RE.search(text):
+        return html.escape(text, quote=False)
+    out = []
+    delimiters = []
+    brackets = None
+    failed_code = set()  # longitudes de ` sin cierre más adelante
+    no_wiki_close = False
+    no_paren_from = None  # desde aquí ya no hay ningún ")"
+    label = None  # dentro del texto de un enlace: estado de afuera a recuperar al cerrarlo
+    label_start = 0
+    i = 0
+    n = limit = len(text)
+    while True:
+        if i >= limit:
+            if label is None: break
+            if delimiters:
+                _md_process_emphasis(delimiters)
+            out.append('</a>')
+            delimiters, failed_code, no_paren_from, i = label
+            label = None
+            label_start = 0
+            limit = n
+            continue
+        m = MD_INLINE_SPECIAL_RE.search(text, i, limit)
+        j = m.start() if m else limit
+        if j > i:
+            out.append(html.escape(text[i:j], quote=False))
+            i = j
+            if i >= limit: continue
+        c = text[i]
+        if c == '\\':
+            nxt = text[i + 1] if i + 1 < limit else ''
+            if nxt == '\n':
+                out.append('<br />')
+                i += 2
+            elif nxt in MD_PUNCTUATION:
+                out.append(html.escape(nxt, quote=False))
+                i += 2
+            else:
+                out.append('\\')
+                i += 1
+        elif c == '\n':
+            # Dos espacios antes del salto: salto duro; si no, un espacio
+            if out and isinstance(out[-1], str) and out[-1].endswith('  '):
+                out[-1] = out[-1].rstrip(' ')
+                out.append('<br />')
+            else:
+                out.append(' ')
+            i += 1
+        elif c == '`':
+            k = i
+            while k < limit and text[k] == '`': k += 1
+            length = k - i
+            end = -1
+            if length not in failed_code:
+                search = k
+                while True:
+                    end = text.find('`' * length, search, limit)
+                    if end < 0 or not (end + length < limit and text[end + length] == '`'):
+                        break
+                    search = end + length
+                    while search < limit and text[search] == '`': search += 1
+            if end < 0:
+                failed_code.add(length)
+                out.append('`' * length)
+                i = k
+            else:
+                code = text[k:end].replace('\n', ' ')
+                if len(code) > 2 and code[0] == ' ' and code[-1] == ' ' and code.strip():
+                    code = code[1:-1]
+                out.append(f'<code style="background-color:{C_LINE};">{html.escape(code, quote=False)}</code>')
+                i = end + length
+        elif c == '[' and label is None and text.startswith('[[', i) and not no_wiki_close:
+            end = text.find(']]', i + 2)
+            if end < 0:
+                no_wiki_close = True
+                out.append('[')
+                i += 1
+                continue
+            target, _, alias = text[i + 2:end].partition('|')
+            target = target.strip()
+            alias = alias.strip() or target
+            out.append(f'<a href="model://{html.escape(target)}" style="{MD_LINK_STYLE}">{html.escape(alias, quote=False)}</a>')
+            i = end + 2
+        elif (c == '[' and label is None) or (c == '!' and text.startswith('![', i)):
+            start = i + 1 if c == '!' else i
+            if brackets is None:
+                brackets = _md_bracket_pairs(text)
+            close = brackets.get(start)
+            dest_end = -1
+            if (close is not None and close + 1 < limit and text[close + 1] == '('
+                    and (no_paren_from is None or close + 2 < no_paren_from)):
+                dest_end = text.find(')', close + 2, limit)
+                if dest_end < 0: no_paren_from = close + 2
+            if dest_end < 0:
+                out.append(html.escape(text[i:start + 1], quote=False))
+                i = start + 1
+                continue
+            dest = text[close + 2:dest_end].strip().split(None, 1)
+            url = html.escape(dest[0].strip('<>')) if dest else ''
+            if c == '!':
+                out.append(f'<img src="{url}" alt="{html.escape(text[start + 1:close])}" />')
+                i = dest_end + 1
+            else:
+                out.append(f'<a href="{url}" style="{MD_LINK_STYLE}">')
+                label = (delimiters, failed_code, no_paren_from, dest_end + 1)
+                delimiters, failed_code = [], set()
+                i = label_start = start + 1
+                limit = close
+        elif c == '[':
+            out.append('[')
+            i += 1
+        elif c == '<':
+            m = MD_AUTOLINK_RE.match(text, i, limit) if label is None else None
+            if m:
+                url = html.escape(m.group(1))
+                out.append(f'<a href="{url}" style="{MD_LINK_STYLE}">{url}</a>')
+                i = m.end()
+            else:
+                out.append('&lt;')
+                i += 1
+        elif c == '!':
+            out.append('!')
+            i += 1
+        else:  # * o _
+            k = i
+            while k < limit and text[k] == c: k += 1
+            before = text[i - 1] if i > label_start else ' '
+            after = text[k] if k < limit else ' '
+            left = not after.isspace() and (after not in MD_PUNCTUATION or before.isspace() or before in MD_PUNCTUATION)
+            right = not before.isspace() and (before not in MD_PUNCTUATION or after.isspace() or after in MD_PUNCTUATION)
+            if c == '_':
+                can_open = left and (not right or before in MD_PUNCTUATION)
+                can_close = right and (not left or after in MD_PUNCTUATION)
+            else:
+                can_open, can_close = left, right
+            delimiter = _MdDelimiter(c, k - i, can_open, can_close)
+            delimiters.append(delimiter)
+            out.append(delimiter)
+            i = k
+    if delimiters:
+        _md_process_emphasis(delimiters)
+    return ''.join(map(str, out))
+
+def _md_table_cells(line):
+    line = line.strip()
+    if line.startswith('|'): line = line[1:]
+    if line.endswith('|') and not line.endswith('\\|'): line = line[:-1]
+    return [cell.strip().replace('\\|', '|') for cell in MD_TABLE_SPLIT_RE.split(line)]
+
+# Citas anidadas más hondas se dejan como texto: cada nivel vuelve a recorrer su contenido
+MD_MAX_QUOTE_DEPTH = 16
+
+def parse_markdown_visual(text, quote_depth=0):
+    """Convierte Markdown (lo básico de CommonMark, tablas y [[enlaces wiki]]) en el HTML del editor"""
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    out = []
+    paragraph = []
+    lists = []  # [(etiqueta, sangría del marcador, columna del contenido)]
+    blank = False
+
+    def flush_paragraph():
+        if paragraph:
+            content = render_markdown_inline('\n'.join(paragraph))
+            out.append(content if lists else f'<p>{content}</p>')
+            paragraph.clear()
+
+    def close_lists(indent=-1):
+        while lists and indent < lists[-1][1]:
+            out.append(f'</li></{lists.pop()[0]}>')
+
+    def flush_all():
+        flush_paragraph()
+        close_lists()
+
+    n = len(lines)
+    i = 0
+    while i < n:
+        line = lines[i]
+        if '\t' in line: line = line.expandtabs(4)
+        i += 1
+        stripped = line.strip()
+        if not stripped:
+            flush_paragraph()
+            blank = True
+            continue
+        indent = len(line) - len(line.lstrip(' '))
+        # Solo se prueban los bloques que pueden empezar con este carácter
+        first = stripped[0]
+        if lists and blank and indent < lists[-1][2] and not MD_LIST_RE.match(line):
+            close_lists()
+        was_blank, blank = blank, False
+        fence = MD_FENCE_RE.match(line) if first in '`~' else None
+        if fence and not (fence.group(2)[0] == '`' and '`' in line[fence.end():]):
+            flush_all()
+            marker = fence.group(2)
+            code = []
+            while i < n:
+                candidate = lines[i]
+                i += 1
+                if candidate.strip().startswith(marker[0] * len(marker)) and not candidate.strip().strip(marker[0]):
+                    break
+                code.append(candidate)
+            out.append(f'<pre style="background-color:{C_SIDE};">{html.escape(chr(10).join(code), quote=False)}</pre>')
+            continue
+        heading = MD_ATX_RE.match(line) if first == '#' else None
+        if heading:
+            flush_all()
+            level = len(heading.group(1))
+            style = MD_HEADING_STYLES.get(level, 'color:#7aa2f7;')
+            out.append(f'<h{level} style="{style}">{render_markdown_inline(heading.group(2).strip())}</h{level}>')
+            continue
+        if paragraph and not lists and first in '=-' and MD_SETEXT_RE.match(line):
+            level = 1 if stripped[0] == '=' else 2
+            content = render_markdown_inline('\n'.join(paragraph))
+            paragraph.clear()
+            out.append(f'<h{level} style="{MD_HEADING_STYLES[level]}">{content}</h{level}>')
+            continue
+        if first in '*-_' and MD_HR_RE.match(line):
+            flush_all()
+            out.append('<hr />')
+            continue
+        if first == '>' and quote_depth < MD_MAX_QUOTE_DEPTH and MD_QUOTE_RE.match(line):
+            flush_all()
+            quoted = [MD_QUOTE_RE.match(line).group(1)]
+            while i < n:
+                m = MD_QUOTE_RE.match(lines[i])
+                if not m: break
+                quoted.append(m.group(1))
+                i += 1
+            out.append(f'<blockquote>{parse_markdown_visual(chr(10).join(quoted), quote_depth + 1)}</blockquote>')
+            continue
+        item = MD_LIST_RE.match(line) if first in '-+*' or first.isdigit() else None
+        if item and (lists or not paragraph or item.group(4)):
+            flush_paragraph()
+            marker_indent = len(item.group(1))
+            number = item.group(3)
+            tag = 'ol' if number is not None else 'ul'
+            content = item.group(4) or ''
+            content_col = marker_indent + len(item.group(2)) + 1 + (len(content) - len(content.lstrip(' ')) if content else 0)
+            close_lists(marker_indent)
+            if lists and marker_indent < lists[-1][2]:
+                if lists[-1][0] == tag:
+                    out.append('</li><li>')
+                    paragraph.append(content.strip())
+                    continue
+                out.append(f'</li></{lists.pop()[0]}>')
+            start = f' start="{int(number)}"' if number is not None and int(number) != 1 else ''
+            out.append(f'<{tag}{start}><li>')
+            lists.append((tag, marker_indent, content_col))
+            paragraph.append(content.strip())
+            continue
+        if lists and was_blank:
+            # Párrafo de continuación dentro de un elemento de lista
+            out.append('<br />')
+        if (not paragraph and not lists and '|' in line and i < n and MD_TABLE_DELIM_RE.match(lines[i])
+                and len(_md_table_cells(lines[i])) == len(_md_table_cells(line))):
+            header = _md_table_cells(line)
+            aligns = []
+            for cell in _md_table_cells(lines[i]):
+                if cell.startswith(':') and cell.endswith(':'): aligns.append(' align="center"')
+                elif cell.endswith(':'): aligns.append(' align="right"')
+                else: aligns.append('')
+            i += 1
+            rows = ['<tr>' + ''.join(f'<th{aligns[k] if k < len(aligns) else ""}>{render_markdown_inline(cell)}</th>'
+                                     for k, cell in enumerate(header)) + '</tr>']
+            while i < n and lines[i].strip() and '|' in lines[i]:
+                cells = _md_table_cells(lines[i])
+                i += 1
+                rows.append('<tr>' + ''.join(f'<td{aligns[k] if k < len(aligns) else ""}>{render_markdown_inline(cell)}</td>'
+                                             for k, cell in enumerate(cells[:len(header)])) + '</tr>')
+            out.append(f'<table border="1" cellspacing="0" cellpadding="4">{"".join(rows)}</table>')
+            continue
+        if not paragraph and not lists and indent >= 4:
+            code = [line[4:]]
+            while i < n:
+                candidate = lines[i].expandtabs(4)
+                if candidate.strip() and not candidate.startswith('    '): break
+                code.append(candidate[4:])
+                i += 1
+            while code and not code[-1].strip(): code.pop()
+            out.append(f'<pre style="background-color:{C_SIDE};">{html.escape(chr(10).join(code), quote=False)}</pre>')
+            continue
+        paragraph.append(line.strip() if not line.endswith('  ') else line.lstrip())
+    flush_all()
+    return ''.join(out)
+
+# =============================================================================
+# IMPORTACIÓN DE CARPETAS
+# =============================================================================
+IMPORT_EXTENSIONS = ('.txt', '.md', '.markdown', '.html', '.htm')
+# Registro {sha1 del archivo de origen: nota creada} para reanudar importaciones
+IMPORTED_FILENAME = "imported.json"
+IMPORT_BATCH_FILES = 50
+
+def plain_text_to_html(text):
+    """HTML de una nota a partir de texto plano: una línea por párrafo, con el texto escapado"""
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    paragraphs = ''.join(f'<p style="margin-top:0px; margin-bottom:0px;">{html.escape(line, quote=False) or "<br />"}</p>'
+                         for line in lines)
+    return f'<html><body style="white-space: pre-wrap;">{paragraphs}</body></html>'
+
+def import_keeps_markdown(path, markdown):
+    """En un vault Markdown los .md se importan tal cual, como notas .md"""
+    return markdown and path.lower().endswith(('.md', '.markdown'))
+
+def convert_import_file(path, data, markdown=False):
+    """Contenido de nota (HTML, o Markdown si se conserva) de un archivo importado según su extensión"""
+    text = data.decode('utf-8', errors='replace')
+    if import_keeps_markdown(path, markdown):
+        return text.replace('\r\n', '\n')
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.md', '.markdown'):
+        return f'<html><body>{parse_markdown_visual(text)}</body></html>'
+    if ext in ('.html', '.htm'):
+        return text if "<html" in text else f'<html><body>{text}</body></html>'
+    return plain_text_to_html(text)
+
+def iter_import_files(root, skip_dir=None):
+    """Recorre un árbol de carpetas con os.scandir devolviendo los archivos importables.
+
+    Omite carpetas ocultas y skip_dir (el propio vault, si está dentro del origen).
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith('.'): continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if skip_dir is None or os.path.normcase(entry.path) != os.path.normcase(skip_dir):
+                        subdirs.append(entry.path)
+                elif entry.name.lower().endswith(IMPORT_EXTENSIONS) and entry.is_file():
+                    yield entry.path
+            except OSError:
+                continue
+        stack.extend(reversed(subdirs))
+
+_import_known_hashes = frozenset()
+_import_markdown = False
+
+def init_import_process(known_hashes, markdown=False):
+    global _import_known_hashes, _import_markdown
+    _import_known_hashes = known_hashes
+    _import_markdown = markdown
+
+def convert_import_batch(paths):
+    """Tarea de proceso: [(ruta, sha1, contenido o None si ya estaba importado, error)]"""
+    results = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha1(data).hexdigest()
+            if digest in _import_known_hashes:
+                results.append((path, digest, None, None))
+            else:
+                results.append((path, digest, convert_import_file(path, data, _import_markdown), None))
+        except (OSError, ValueError, RuntimeError) as e:
+            # Un archivo que no se puede convertir no corta la importación de los demás
+            results.append((path, None, None, str(e)))
+    return results
+
+def load_imported_hashes(vault_path):
+    try:
+        with open(os.path.join(vault_path, VAULT_META_DIRNAME, IMPORTED_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_imported_hashes(vault_path, imported):
+    atomic_write_text(os.path.join(get_vault_meta_dir(vault_path), IMPORTED_FILENAME),
+                      json.dumps(imported, ensure_ascii=False))
+
+class ImportSignals(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(object)
+
+class FolderImportWorker(QRunnable):
+    """Importa un árbol de carpetas al vault: conversión en procesos y escritura por lotes.
+
+    Cada archivo se identifica por el sha1 de su contenido; el registro se guarda
+    tras cada lote, así una importación interrumpida se reanuda saltando lo ya
+    importado. Los nombres repetidos reciben un sufijo " (2)", " (3)"...
+    Con markdown (vault en modo Markdown) los .md se copian como notas .md.
+    """
+    def __init__(self, source_dir, vault_path, markdown=False):
+        super().__init__()
+        self.source_dir = source_dir
+        self.vault_path = vault_path
+        self.markdown = markdown
+        self.signals = ImportSignals()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def target_name(self, path, taken):
+        """Nombre libre en el vault; taken guarda nombres sin extensión, que es como se enlazan"""
+        base = os.path.splitext(os.path.basename(path))[0].strip() or "sin nombre"
+        stem = base
+        n = 1
+        while stem.lower() in taken:
+            n += 1
+            stem = f"{base} ({n})"
+        taken.add(stem.lower())
+        return stem + (".md" if import_keeps_markdown(path, self.markdown) else ".rtf")
+
+    def run(self):
+        report = {"imported": [], "skipped": 0, "errors": [], "cancelled": False}
+        try:
+            imported = load_imported_hashes(self.vault_path)
+            taken = {os.path.splitext(name)[0].lower() for name in scan_vault_entries(self.vault_path)}
+            paths = list(iter_import_files(self.source_dir, skip_dir=self.vault_path))
+            batches = [paths[i:i + IMPORT_BATCH_FILES] for i in range(0, len(paths), IMPORT_BATCH_FILES)]
+            done = 0
+            self.signals.progress.emit(0, len(paths))
+            with ProcessPoolExecutor(max_workers=os.cpu_count() or 1, initializer=init_import_process,
+                                     initargs=(frozenset(imported), self.markdown)) as pool:
+                futures = [pool.submit(convert_import_batch, batch) for batch in batches]
+                for future in as_completed(futures):
+                    if self._cancel.is_set():
+                        for f in futures: f.cancel()
+                        report["cancelled"] = True
+                        break
+                    for path, digest, content, error in future.result():
+                        if error:
+                            report["errors"].append(f"{path}: {error}")
+                            continue
+                        if digest in imported and os.path.splitext(imported[digest])[0].lower() in taken:
+                            report["skipped"] += 1
+                            continue
+                        name = None
+                        try:
+                            if content is None:
+                                # Registrado pero la nota ya no existe: se vuelve a convertir
+                                with open(path, 'rb') as f:
+                                    content = convert_import_file(path, f.read(), self.markdown)
+                            name = self.target_name(path, taken)
+                            atomic_write_text(os.path.join(self.vault_path, name), content)
+                        except OSError as e:
+                            if name: taken.discard(os.path.splitext(name)[0].lower())
+                            report["errors"].append(f"{path}: {e}")
+                            continue
+                        imported[digest] = name
+                        report["imported"].append(name)
+                    save_imported_hashes(self.vault_path, imported)
+                    done += len(future.result())
+                    self.signals.progress.emit(done, len(paths))
+        except (OSError, RuntimeError) as e:
+            report["errors"].append(str(e))
+        self.signals.finished.emit(report)
+
+# =============================================================================
+# DOCUMENTOS DE NOTAS Y CACHÉ
+# =============================================================================
+NOTE_DOCUMENT_STYLESHEET = f"a {{ text-decoration: underline; color: {C_ACCENT}; font-weight: bold; }}"
+
+# Inicio de bloque de primer nivel en el HTML que genera Qt (uno por línea) y
+# apertura/cierre de contenedores dentro de los cuales no se puede cortar
+HTML_BLOCK_START_RE = re.compile(r'\n(?=<(?:p|h[1-6])\b)|<(/?)(?:table|ul|ol)\b', re.IGNORECASE)
+HTML_BODY_RE = re.compile(r'<body[^>]*>', re.IGNORECASE)
+
+def split_html_body(content, chunk_chars):
+    """Divide el HTML en (cabecera + primer trozo, resto de trozos) por límites de bloque"""
+    m = HTML_BODY_RE.search(content)
+    if not m: return content, []
+    end = content.rfind('</body>')
+    if end < m.end(): end = len(content)
+    body = content[m.end():end]
+    chunks = []
+    depth = 0
+    last = 0
+    for bm in HTML_BLOCK_START_RE.finditer(body):
+        if bm.group(0).startswith('\n'):
+            if depth == 0 and bm.start() - last >= chunk_chars:
+                chunks.append(body[last:bm.start()])
+                last = bm.start()
+        elif bm.group(1):
+            depth = max(0, depth - 1)
+        else:
+            depth += 1
+    chunks.append(body[last:])
+    return content[:m.end()] + chunks[0], chunks[1:]
+
+def new_note_document():
+    """QTextDocument vacío con la hoja de estilos y la fuente de las notas"""
+    doc = QTextDocument()
+    doc.setDefaultStyleSheet(NOTE_DOCUMENT_STYLESHEET)
+    doc.setDefaultFont(QFont("Cascadia Code", 16))
+    return doc
+
+def build_note_document(content="", rich=None, chunk_chars=None, progress=None, markdown=False):
+    """Crea un QTextDocument (sin padre) con el contenido de una nota.
+
+    Con chunk_chars el HTML se inserta por trozos: entre trozo y trozo el hilo de
+    trabajo suelta el GIL, así la GUI sigue respondiendo mientras se parsea.
+    Cada trozo se parsea con la cabecera y el <body> originales en un documento
+    aparte, así el resultado es el mismo que con un solo setHtml.
+    Con markdown el contenido se lee como Markdown (notas .md).
+    """
+    doc = new_note_document()
+    if markdown:
+        doc.setMarkdown(content)
+        doc.setModified(False)
+        return doc
+    if rich is None:
+        rich = is_rich_content(content)
+    if rich and chunk_chars and len(content) > chunk_chars:
+        first, rest = split_html_body(content, chunk_chars)
+        head = first[:HTML_BODY_RE.search(first).end()] if rest else ""
+        # La carga no es una edición: nada de esto debe poder deshacerse
+        doc.setUndoRedoEnabled(False)
+        doc.setHtml(first)
+        cursor = QTextCursor(doc)
+        for i, chunk in enumerate(rest):
+            if progress: progress(i + 1, len(rest) + 1)
+            part = new_note_document()
+            part.setHtml(head + chunk)
+            # El primer bloque del trozo se funde con el bloque nuevo: lleva su formato
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.insertBlock(part.begin().blockFormat(), part.begin().charFormat())
+            cursor.insertFragment(QTextDocumentFragment(part))
+        doc.setUndoRedoEnabled(True)
+    elif rich: doc.setHtml(content)
+    else: doc.setPlainText(content)
+    doc.setModified(False)
+    return doc
+
+# Destinos model:// con espacios: Qt los escribe tal cual y al releerlos cortan el enlace
+MD_SPACED_LINK_RE = re.compile(r'\]\((model://[^)<>\n]*\s[^)<>\n]*)\)')
+
+def _md_add_table_delimiters(text):
+    """Qt escribe las tablas sin fila de encabezado sin la línea |-|-|, y así no se
+    releen como tabla: se agrega tras la primera fila (que pasa a ser encabezado)"""
+    lines = text.split('\n')
+    out = []
+    in_table = False
+    for i, line in enumerate(lines):
+        is_row = len(line) > 1 and line[0] == '|' and line[-1] == '|'
+        out.append(line)
+        if is_row and not in_table:
+            following = lines[i + 1] if i + 1 < len(lines) else ''
+            if not MD_TABLE_DELIM_RE.match(following):
+                out.append('|' + '-|' * (len(MD_TABLE_SPLIT_RE.findall(line)) - 1))
+        in_table = is_row
+    return '\n'.join(out)
+
+def document_to_markdown(doc):
+    """Markdown (dialecto GitHub) de un documento, con los destinos con espacios entre <>"""
+    text = doc.toMarkdown()
+    if text.startswith('|') or '\n|' in text:
+        text = _md_add_table_delimiters(text)
+    return MD_SPACED_LINK_RE.sub(r'](<\1>)', text)
+
+def serialize_note_document(doc, path):
+    """Contenido a escribir en disco según el formato de la nota"""
+    return document_to_markdown(doc) if is_markdown_note(path) else doc.toHtml()
+
+# A partir de este tamaño las notas se parsean fuera del hilo de la GUI
+ASYNC_LOAD_BYTES = 256 * 1024
+# Tamaño de cada trozo de HTML parseado de una vez en segundo plano
+LOAD_CHUNK_CHARS = 64 * 1024
+
+# Estimación gruesa de memoria por carácter de un QTextDocument (texto + formato + layout)
+DOCUMENT_BYTES_PER_CHAR = 16
+
+class DocumentCache:
+    """LRU de documentos ya parseados, validados por (mtime, tamaño) del archivo.
+
+    Se limita por cantidad de documentos y por caracteres totales, que es lo que
+    domina la memoria de un QTextDocument. El documento visible nunca está en la
+    caché: se saca con take() al mostrarlo y se devuelve con put() al dejarlo.
+    """
+    def __init__(self, max_entries=30, max_chars=30_000_000):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._items = OrderedDict()
+        self.total_chars = 0
+
+    def __contains__(self, path):
+        return path in self._items
+
+    def has_valid(self, path, stat):
+        item = self._items.get(path)
+        return item is not None and item[0] == stat
+
+    def take(self, path, stat):
+        item = self._items.pop(path, None)
+        if item is None:
+            return None
+        self.total_chars -= item[1].characterCount()
+        return item[1] if item[0] == stat else None
+
+    def put(self, path, stat, doc):
+        self.invalidate(path)
+        self._items[path] = (stat, doc)
+        self.total_chars += doc.characterCount()
+        while self._items and (len(self._items) > self.max_entries or self.total_chars > self.max_chars):
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.total_chars -= evicted.characterCount()
+
+    def invalidate(self, path):
+        item = self._items.pop(path, None)
+        if item is not None:
+            self.total_chars -= item[1].characterCount()
+
+    def clear(self):
+        self._items.clear()
+        self.total_chars = 0
+
+WORD_RE = re.compile(r"\w+(?:['’-]\w+)*")
+READING_WORDS_PER_MINUTE = 200
+
+class DocumentStats:
+    """Líneas, palabras y caracteres del documento visible, mantenidos con los deltas de contentsChange.
+
+    Las palabras se cuentan por bloque; un cambio solo recuenta los bloques que tocó.
+    """
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self.doc = None
+        self.block_words = []
+        self.words = 0
+        self.block_count = 0
+
+    def attach(self, doc):
+        self.detach()
+        self.doc = doc
+        words = getattr(doc, 'stats_block_words', None)
+        if words is None or len(words) != doc.blockCount():
+            # Una sola pasada por documento; después viaja con él por la caché
+            raw = doc.toRawText()
+            lines = raw.split('\u2029')
+            if len(lines) == doc.blockCount():
+                words = [len(WORD_RE.findall(line)) for line in lines]
+            else:
+                words = []
+                block = doc.begin()
+                while block.isValid():
+                    words.append(len(WORD_RE.findall(block.text())))
+                    block = block.next()
+            doc.stats_block_words = words
+        self.block_words = words
+        self.words = sum(words)
+        self.block_count = doc.blockCount()
+        doc.contentsChange.connect(self.on_contents_change)
+
+    def detach(self):
+        if self.doc is not None:
+            try:
+                self.doc.contentsChange.disconnect(self.on_contents_change)
+            except TypeError:
+                pass
+        self.doc = None
+
+    def on_contents_change(self, position, removed, added):
+        doc = self.doc
+        last = doc.characterCount() - 1
+        first_block = doc.findBlock(min(position, last))
+        b0 = first_block.blockNumber()
+        n_new = doc.findBlock(min(position + added, last)).blockNumber() - b0 + 1
+        n_old = n_new - (doc.blockCount() - self.block_count)
+        self.block_count = doc.blockCount()
+        counts = []
+        block = first_block
+        for _ in range(n_new):
+            counts.append(len(WORD_RE.findall(block.text())))
+            block = block.next()
+        old = self.block_words[b0:b0 + n_old]
+        self.words += sum(counts) - sum(old)
+        self.block_words[b0:b0 + n_old] = counts
+        if self.on_change:
+            self.on_change()
+
+    @property
+    def lines(self):
+        return self.block_count
+
+    @property
+    def characters(self):
+        return self.doc.characterCount() - 1 if self.doc is not None else 0
+
+    @property
+    def reading_minutes(self):
+        return math.ceil(self.words / READING_WORDS_PER_MINUTE)
+
+class DocumentBuildSignals(QObject):
+    ready = pyqtSignal(int, str, object, object)  # generación, ruta, (mtime, tamaño), documento
+    progress = pyqtSignal(int, int, int)  # generación, trozos parseados, total
+
+class DocumentBuildWorker(QRunnable):
+    """Lee y parsea una nota en un hilo de trabajo y entrega el QTextDocument al hilo de la GUI.
+
+    Si se pasa content no se lee el archivo (importaciones ya convertidas).
+    """
+    def __init__(self, generation, path, content=None, rich=None, markdown=None):
+        super().__init__()
+        self.generation = generation
+        self.path = path
+        self.content = content
+        self.rich = rich
+        self.markdown = is_markdown_note(path) if markdown is None else markdown
+        self.signals = DocumentBuildSignals()
+
+    def run(self):
+        doc = None
+        stat = None
+        try:
+            content = self.content
+            if content is None:
+                st = os.stat(self.path)
+                stat = (st.st_mtime, st.st_size)
+                with open(self.path, 'r', encoding='utf-8', errors='ignore') as f:
+                    content = f.read()
+            doc = build_note_document(content, rich=self.rich, chunk_chars=LOAD_CHUNK_CHARS,
+                                      progress=lambda done, total: self.signals.progress.emit(self.generation, done, total),
+                                      markdown=self.markdown)
+            # El documento nace en este hilo: se pasa al de la GUI antes de entregarlo
+            doc.moveToThread(QApplication.instance().thread())
+        except Exception as e:
+            # Cualquier fallo se entrega como doc=None: la GUI no puede quedar esperando
+            print(f"Error al cargar {self.path}: {e}")
+            doc = None
+        self.signals.ready.emit(self.generation, self.path, stat, doc)
+
+class NoteWriterSignals(QObject):
+    saved = pyqtSignal(str, object, bool, str)  # ruta, (mtime, tamaño), escrito (False = sin cambios), sha1
+    failed = pyqtSignal(str, str)
+
+class NoteWriterTask(QRunnable):
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+
+    def run(self):
+        self.writer.drain()
+
+class NoteWriter:
+    """Cola de guardado en segundo plano.
+
+    Cada guardado se escribe de forma atómica (temporal + fsync + rename). Los guardados
+    repetidos de un mismo archivo que aún no se escribieron se fusionan en uno solo, y se
+    omite la escritura si el contenido es idéntico al que ya está en disco.
+    """
+    def __init__(self, parent=None):
+        self.signals = NoteWriterSignals()
+        self.pool = QThreadPool(parent)
+        self.pool.setMaxThreadCount(1)
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()  # ruta -> contenido (el último gana)
+        self._written = {}  # ruta -> (sha1, (mtime, tamaño)) de la última escritura
+        self._scheduled = False
+        self.versions = None  # VersionStore del vault: cada escritura queda en el historial
+
+    def submit(self, path, content):
+        with self._lock:
+            self._pending[path] = content
+            if self._scheduled: return
+            self._scheduled = True
+        self.pool.start(NoteWriterTask(self))
+
+    def is_pending(self, path):
+        with self._lock:
+            return path in self._pending
+
+    def discard(self, path):
+        """Olvida un archivo (eliminado o renombrado); sus guardados pendientes se anulan"""
+        with self._lock:
+            self._pending.pop(path, None)
+            self._written.pop(path, None)
+
+    def flush(self, timeout=-1):
+        """Espera a que todos los guardados pendientes estén en disco"""
+        return self.pool.waitForDone(timeout)
+
+    def drain(self):
+        try:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        self._scheduled = False
+                        return
+                    path, content = self._pending.popitem(last=False)
+                try:
+                    data = content.encode('utf-8')
+                    digest = hashlib.sha1(data).hexdigest()
+                    if self._unchanged(path, data, digest):
+                        st = os.stat(path)
+                        self.signals.saved.emit(path, (st.st_mtime, st.st_size), False, digest)
+                        continue
+                    store = self.versions
+                    if store is not None and os.path.dirname(path) != store.vault_path:
+                        store = None
+                    if store is not None:
+                        self._record_original(store, path)
+                    atomic_write_text(path, content)
+                    st = os.stat(path)
+                    stat = (st.st_mtime, st.st_size)
+                    with self._lock:
+                        self._written[path] = (digest, stat)
+                    if store is not None:
+                        try:
+                            store.record(os.path.basename(path), data)
+                        except sqlite3.Error as e:
+                            print(f"Error al guardar la versión: {e}")
+                    self.signals.saved.emit(path, stat, True, digest)
+                except Exception as e:
+                    # Cualquier fallo (disco, UnicodeEncodeError, SQLite...) se informa y la
+                    # cola sigue: el editor ya marcó la nota como guardada
+                    self.signals.failed.emit(path, str(e))
+        except BaseException:
+            # Si el hilo se corta igual, el próximo submit vuelve a programar la cola
+            with self._lock:
+                self._scheduled = False
+            raise
+
+    def _record_original(self, store, path):
+        """La primera vez que se guarda una nota sin historial se conserva lo que había"""
+        try:
+            name = os.path.basename(path)
+            if os.path.exists(path) and not store.has_versions(name):
+                with open(path, 'rb') as f:
+                    store.record(name, f.read(), kind="original", created=os.path.getmtime(path))
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error al guardar la versión original: {e}")
+
+    def _unchanged(self, path, data, digest):
+        """True si el archivo en disco ya tiene exactamente estos bytes"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if st.st_size != len(data):
+            return False
+        with self._lock:
+            known = self._written.get(path)
+        # Si nadie tocó el archivo desde nuestra última escritura, basta comparar hashes
+        if known and known[1] == (st.st_mtime, st.st_size):
+            return known[0] == digest
+        with open(path, 'rb') as f:
+            same = hashlib.sha1(f.read()).hexdigest() == digest
+        if same:
+            with self._lock:
+                self._written[path] = (digest, (st.st_mtime, st.st_size))
+        return same
+
+# =============================================================================
+# ALMACENAMIENTO EN MARKDOWN
+# =============================================================================
+class MarkdownConvertSignals(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(object)
+
+class MarkdownConvertWorker(QRunnable):
+    """Pasa las notas .rtf (HTML de Qt) de un vault a notas .md.
+
+    Cada nota se parsea con QTextDocument en este hilo y se escribe con
+    toMarkdown; el HTML original queda en el historial de versiones antes de
+    borrar el .rtf. Se saltan las que ya tienen un .md con el mismo nombre.
+    """
+    def __init__(self, vault_path, versions=None):
+        super().__init__()
+        self.vault_path = vault_path
+        self.versions = versions
+        self.signals = MarkdownConvertSignals()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        report = {"converted": [], "bytes_before": 0, "bytes_after": 0, "errors": [], "cancelled": False}
+        try:
+            entries = scan_vault_entries(self.vault_path)
+            stems = {os.path.splitext(name)[0].lower() for name in entries if is_markdown_note(name)}
+            names = sorted(name for name in entries
+                           if name.lower().endswith('.rtf') and os.path.splitext(name)[0].lower() not in stems)
+            self.signals.progress.emit(0, len(names))
+            for i, name in enumerate(names):
+                if self._cancel.is_set():
+                    report["cancelled"] = True
+                    break
+                path = os.path.join(self.vault_path, name)
+                new_name = os.path.splitext(name)[0] + ".md"
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    content = data.decode('utf-8', errors='ignore')
+                    if "{\\rtf" in content and "<html" not in content:
+                        continue  # RTF crudo: Qt no lo lee, se deja como está
+                    markdown = document_to_markdown(build_note_document(content))
+                    if self.versions is not None:
+                        self.versions.record(name, data)
+                    atomic_write_text(os.path.join(self.vault_path, new_name), markdown)
+                    os.remove(path)
+                except (OSError, sqlite3.Error) as e:
+                    report["errors"].append(f"{name}: {e}")
+                    continue
+                report["converted"].append((name, new_name))
+                report["bytes_before"] += len(data)
+                report["bytes_after"] += len(markdown.encode('utf-8'))
+                self.signals.progress.emit(i + 1, len(names))
+        except OSError as e:
+            report["errors"].append(str(e))
+        finally:
+            if self.versions is not None:
+                self.versions.close()
+        self.signals.finished.emit(report)
+
+# =============================================================================
+# DIARIO DE CAMBIOS SIN GUARDAR (RECUPERACIÓN TRAS FALLOS)
+# =============================================================================
+JOURNAL_DIRNAME = "journal"
+JOURNAL_FLUSH_MS = 3000
+
+class NoteJournal:
+    """Diario append-only por nota en .maletin/journal/<nota>.jsonl.
+
+    La primera línea es la cabecera con el SHA-1 del archivo sobre el que se
+    aplican los cambios; cada línea siguiente es un delta de texto
+    {"p", "r", "t", "n"} o un punto de control {"html", "n"} con el documento entero.
+    """
+    def __init__(self, vault_path):
+        self.vault_path = vault_path
+        self.journal_dir = os.path.join(get_vault_meta_dir(vault_path), JOURNAL_DIRNAME)
+
+    def path_for(self, filename):
+        return os.path.join(self.journal_dir, filename + ".jsonl")
+
+    def append(self, filename, entries, base=None):
+        """Añade entradas; con base se empieza un diario nuevo con esa cabecera"""
+        os.makedirs(self.journal_dir, exist_ok=True)
+        with open(self.path_for(filename), 'w' if base else 'a', encoding='utf-8') as f:
+            if base:
+                f.write(json.dumps({"file": filename, "base": base}) + "\n")
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def discard(self, filename):
+        try:
+            os.remove(self.path_for(filename))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error al borrar el diario de {filename}: {e}")
+
+    def pending(self):
+        """Notas con cambios sin guardar registrados"""
+        try:
+            return sorted(n[:-len(".jsonl")] for n in os.listdir(self.journal_dir) if n.endswith(".jsonl"))
+        except OSError:
+            return []
+
+    def read(self, filename):
+        """(hash base, entradas); una última línea truncada por un fallo se ignora"""
+        with open(self.path_for(filename), 'r', encoding='utf-8') as f:
+            lines = f.read().split("\n")
+        header = json.loads(lines[0])
+        entries = []
+        for line in lines[1:]:
+            if not line: continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+        return header["base"], entries
+
+def file_sha1(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def replay_journal(doc, entries):
+    """Aplica las entradas del diario sobre el documento cargado del archivo base"""
+    cursor = QTextCursor(doc)
+    for entry in entries:
+        if "html" in entry:
+            doc.setHtml(entry["html"])
+        else:
+            cursor.setPosition(entry["p"])
+            cursor.setPosition(entry["p"] + entry["r"], QTextCursor.MoveMode.KeepAnchor)
+            if entry["t"]:
+                cursor.insertText(entry["t"])
+            else:
+                cursor.removeSelectedText()
+        if doc.characterCount() != entry["n"]:
+            raise ValueError("el diario no coincide con el documento")
+
+class JournalRecorder:
+    """Traduce contentsChange del documento visible a entradas del diario.
+
+    Escribir y borrar texto con el formato heredado se guarda como delta de texto;
+    cualquier otro cambio (formato, pegado con estilos, imágenes) pide un punto de
+    control, que se toma al volcar el diario y reemplaza los deltas pendientes.
+    """
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self.doc = None
+        self.entries = []
+        self.needs_checkpoint = False
+        self.char_count = 0
+        self.block_count = 0
+
+    def attach(self, doc):
+        self.detach()
+        self.doc = doc
+        self.char_count = doc.characterCount()
+        self.block_count = doc.blockCount()
+        self.reset()
+        doc.contentsChange.connect(self.on_contents_change)
+
+    def detach(self):
+        if self.doc is not None:
+            try:
+                self.doc.contentsChange.disconnect(self.on_contents_change)
+            except TypeError:
+                pass
+        self.doc = None
+
+    def reset(self):
+        self.entries = []
+        self.needs_checkpoint = False
+
+    def has_changes(self):
+        return bool(self.entries) or self.needs_checkpoint
+
+    def take(self):
+        """Entradas a escribir desde el último volcado"""
+        if self.needs_checkpoint:
+            entries = [{"html": self.doc.toHtml(), "n": self.doc.characterCount()}]
+        else:
+            entries = self.entries
+        self.reset()
+        return entries
+
+    def on_contents_change(self, position, removed, added):
+        doc = self.doc
+        previous_count, self.char_count = self.char_count, doc.characterCount()
+        previous_blocks, self.block_count = self.block_count, doc.blockCount()
+        if self.needs_checkpoint:
+            pass
+        elif position + removed >= previous_count or (removed and removed == added):
+            # Cambio del documento entero o solo de formato
+            self.needs_checkpoint = True
+        elif removed and (added or self.block_count < previous_blocks):
+            # Reemplazos y párrafos unidos: el formato resultante depende de cómo se editó
+            self.needs_checkpoint = True
+        elif removed:
+            self.entries.append({"p": position, "r": removed, "t": "", "n": self.char_count})
+        elif added:
+            if self.inherits_format(position, added):
+                cursor = QTextCursor(doc)
+                cursor.setPosition(position)
+                cursor.setPosition(position + added, QTextCursor.MoveMode.KeepAnchor)
+                self.entries.append({"p": position, "r": 0, "t": cursor.selectedText(), "n": self.char_count})
+            else:
+                self.needs_checkpoint = True
+        if self.on_change:
+            self.on_change()
+
+    def inherits_format(self, position, added):
+        """True si el texto insertado tiene el formato que le daría insertText al reproducirlo"""
+        doc = self.doc
+        block = doc.findBlock(position)
+        end = position + added
+        if end > block.position() + block.length() - 1:
+            # Solo se admite un salto de párrafo suelto (Enter) fuera de listas y tablas,
+            # que hereda el formato del bloque
+            return added == 1 and block.textList() is None and QTextCursor(block).currentTable() is None
+        cursor = QTextCursor(doc)
+        if position > block.position():
+            cursor.setPosition(position)
+            expected = cursor.charFormat()
+        elif end < block.position() + block.length() - 1:
+            cursor.setPosition(end + 1)
+            expected = cursor.charFormat()
+        else:
+            expected = block.charFormat()
+        it = block.begin()
+        while not it.atEnd():
+            fragment = it.fragment()
+            if fragment.position() < end and fragment.position() + fragment.length() > position:
+                if fragment.charFormat() != expected:
+                    return False
+            it += 1
+        return True
+
+# =============================================================================
+# HISTORIAL DE VERSIONES DE LAS NOTAS
+# =============================================================================
+HISTORY_CHUNK_MAX = 16 * 1024
+HISTORY_GC_INTERVAL = 24 * 3600
+
+def split_history_chunks(data):
+    """Trozos definidos por el contenido: se corta tras las líneas cuyo CRC cae en el patrón.
+
+    Un cambio en una nota solo altera los trozos vecinos, así que el resto de la
+    versión se reutiliza (deduplica) de las anteriores.
+    """
+    chunks = []
+    start = pos = 0
+    n = len(data)
+    while pos < n:
+        end = data.find(b"\n", pos)
+        end = n if end < 0 else end + 1
+        if (zlib.crc32(data[pos:end]) & 7) == 0 or end - start >= HISTORY_CHUNK_MAX:
+            # Las líneas larguísimas (HTML sin saltos) se parten en trozos de tamaño fijo
+            for i in range(start, end, HISTORY_CHUNK_MAX * 4):
+                chunks.append(data[i:min(end, i + HISTORY_CHUNK_MAX * 4)])
+            start = end
+        pos = end
+    for i in range(start, n, HISTORY_CHUNK_MAX * 4):
+        chunks.append(data[i:min(n, i + HISTORY_CHUNK_MAX * 4)])
+    return chunks
+
+class VersionStore:
+    """Historial de versiones de las notas en <vault>/.maletin/history.db.
+
+    Cada versión es la lista de hashes SHA-1 de sus trozos; los trozos se guardan
+    una sola vez, comprimidos con zlib, y se comparten entre versiones y notas.
+    """
+    SCHEMA_VERSION = 1
+
+    def __init__(self, vault_path):
+        self.vault_path = vault_path
+        self.db_path = os.path.join(get_vault_meta_dir(vault_path), "history.db")
+        self._local = threading.local()
+        self.init_schema()
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def init_schema(self):
+        conn = self.connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS chunks ("
+                     "hash BLOB PRIMARY KEY, data BLOB NOT NULL) WITHOUT ROWID")
+        conn.execute("CREATE TABLE IF NOT EXISTS versions ("
+                     "id INTEGER PRIMARY KEY, name TEXT NOT NULL, created REAL NOT NULL, "
+                     "kind TEXT NOT NULL, size INTEGER NOT NULL, digest TEXT NOT NULL, "
+                     "chunks BLOB NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS versions_name ON versions (name, created)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        conn.commit()
+
+    def has_versions(self, name):
+        return self.connect().execute("SELECT 1 FROM versions WHERE name = ? LIMIT 1", (name,)).fetchone() is not None
+
+    def write_transaction(self):
+        """Abre una transacción con el bloqueo de escritura tomado (BEGIN IMMEDIATE).
+
+        record y gc la usan para no intercalarse: si no, gc podría borrar como
+        huérfano un trozo que record ya dio por existente y aún no referenció.
+        """
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def record(self, name, data, kind="save", created=None):
+        """Guarda una versión; devuelve False si es idéntica a la última de la nota"""
+        digest = hashlib.sha1(data).hexdigest()
+        conn = self.write_transaction()
+        try:
+            last = conn.execute("SELECT digest FROM versions WHERE name = ? ORDER BY created DESC, id DESC LIMIT 1",
+                                (name,)).fetchone()
+            if last and last[0] == digest and kind == "save":
+                conn.rollback()
+                return False
+            hashes = []
+            for chunk in split_history_chunks(data):
+                h = hashlib.sha1(chunk).digest()
+                hashes.append(h)
+                if conn.execute("SELECT 1 FROM chunks WHERE hash = ?", (h,)).fetchone() is None:
+                    conn.execute("INSERT INTO chunks (hash, data) VALUES (?, ?)", (h, zlib.compress(chunk, 6)))
+            conn.execute("INSERT INTO versions (name, created, kind, size, digest, chunks) VALUES (?, ?, ?, ?, ?, ?)",
+                         (name, created or time.time(), kind, len(data), digest, b"".join(hashes)))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return True
+
+    def versions(self, name):
+        """[(id, fecha, tipo, tamaño)] de la más nueva a la más vieja"""
+        return self.connect().execute("SELECT id, created, kind, size FROM versions WHERE name = ? "
+                                      "ORDER BY created DESC, id DESC", (name,)).fetchall()
+
+    def load(self, version_id):
+        """Contenido (bytes) de una versión"""
+        conn = self.connect()
+        row = conn.execute("SELECT chunks FROM versions WHERE id = ?", (version_id,)).fetchone()
+        if row is None:
+            raise KeyError(version_id)
+        hashes = [row[0][i:i + 20] for i in range(0, len(row[0]), 20)]
+        found = {}
+        unique = list(set(hashes))
+        for i in range(0, len(unique), 500):
+            batch = unique[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            for h, blob in conn.execute(f"SELECT hash, data FROM chunks WHERE hash IN ({marks})", batch):
+                found[h] = zlib.decompress(blob)
+        return b"".join(found[h] for h in hashes)
+
+    def rename(self, old_name, new_name):
+        conn = self.connect()
+        conn.execute("UPDATE versions SET name = ? WHERE name = ?", (new_name, old_name))
+        conn.commit()
+
+    def names(self):
+        return [r[0] for r in self.connect().execute("SELECT DISTINCT name FROM versions ORDER BY name")]
+
+    def needs_gc(self):
+        row = self.connect().execute("SELECT value FROM meta WHERE key = 'last_gc'").fetchone()
+        return row is None or time.time() - float(row[0]) > HISTORY_GC_INTERVAL
+
+    def gc(self, keep_days, now=None):
+        """Aplica la política de retención y borra los trozos que ya no usa ninguna versión.
+
+        Se conservan la última versión de cada nota, todas las del último día, una
+        por hora durante una semana y una por día hasta keep_days.
+        """
+        now = now or time.time()
+        conn = self.write_transaction()
+        try:
+            doomed = []
+            kept_buckets = set()
+            last_name = None
+            for vid, name, created in conn.execute("SELECT id, name, created FROM versions "
+                                                   "ORDER BY name, created DESC, id DESC").fetchall():
+                if name != last_name:
+                    last_name = name
+                    continue  # la más reciente siempre se queda
+                age = now - created
+                if age < 86400:
+                    continue
+                if age < 7 * 86400:
+                    bucket = (name, "h", int(created // 3600))
+                elif age < keep_days * 86400:
+                    bucket = (name, "d", int(created // 86400))
+                else:
+                    doomed.append(vid)
+                    continue
+                if bucket in kept_buckets:
+                    doomed.append(vid)
+                else:
+                    kept_buckets.add(bucket)
+            conn.executemany("DELETE FROM versions WHERE id = ?", [(vid,) for vid in doomed])
+            
+            referenced = set()
+            for (blob,) in conn.execute("SELECT chunks FROM versions"):
+                referenced.update(blob[i:i + 20] for i in range(0, len(blob), 20))
+            orphans = [(h,) for (h,) in conn.execute("SELECT hash FROM chunks").fetchall() if h not in referenced]
+            conn.executemany("DELETE FROM chunks WHERE hash = ?", orphans)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_gc', ?)", (str(now),))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return len(doomed), len(orphans)
+
+class VersionGcWorker(QRunnable):
+    def __init__(self, store, keep_days):
+        super().__init__()
+        self.store = store
+        self.keep_days = keep_days
+
+    def run(self):
+        try:
+            versions, chunks = self.store.gc(self.keep_days)
+            if versions or chunks:
+                print(f"Historial: {versions} versiones y {chunks} trozos eliminados")
+        except sqlite3.Error as e:
+            print(f"Error al limpiar el historial: {e}")
+        finally:
+            self.store.close()
+
 # =============================================================================
 # CLASES AUXILIARES
 # =============================================================================
+class PreferencesDialog(QDialog):
+    def __init__(self, parent, settings):
+        super().__init__(parent)
+        self.setWindowTitle("Preferencias")
+        self.resize(600, 320)
+        self.settings = dict(settings)
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QGridLayout()
+        layout.setVerticalSpacing(15)
+        
+        lbl_depth = QLabel("Precarga de enlaces (niveles, 0 = desactivada):")
+        self.spin_depth = QSpinBox()
+        self.spin_depth.setRange(0, 3)
+        self.spin_depth.setValue(self.settings["prefetch_depth"])
+        
+        lbl_mem = QLabel("Memoria máxima de precarga (MB):")
+        self.spin_mem = QSpinBox()
+        self.spin_mem.setRange(1, 2048)
+        self.spin_mem.setValue(self.settings["prefetch_max_mb"])
+        
+        lbl_large = QLabel("Abrir en modo solo lectura notas mayores de (MB):")
+        self.spin_large = QSpinBox()
+        self.spin_large.setRange(1, 1024)
+        self.spin_large.setValue(self.settings["large_note_mb"])
+        
+        lbl_autosave = QLabel("Autoguardado tras inactividad (segundos, 0 = desactivado):")
+        self.spin_autosave = QSpinBox()
+        self.spin_autosave.setRange(0, 600)
+        self.spin_autosave.setValue(self.settings["autosave_seconds"])
+        
+        lbl_history = QLabel("Conservar historial de versiones (días):")
+        self.spin_history = QSpinBox()
+        self.spin_history.setRange(1, 3650)
+        self.spin_history.setValue(self.settings["history_keep_days"])
+        
+        btn_ok = QPushButton("Aceptar")
+        btn_ok.clicked.connect(self.on_ok)
+        btn_cancel = QPushButton("Cancelar")
+        btn_cancel.clicked.connect(self.reject)
+        
+        layout.addWidget(lbl_depth, 0, 0)
+        layout.addWidget(self.spin_depth, 0, 1)
+        layout.addWidget(lbl_mem, 1, 0)
+        layout.addWidget(self.spin_mem, 1, 1)
+        layout.addWidget(lbl_large, 2, 0)
+        layout.addWidget(self.spin_large, 2, 1)
+        layout.addWidget(lbl_autosave, 3, 0)
+        layout.addWidget(self.spin_autosave, 3, 1)
+        layout.addWidget(lbl_history, 4, 0)
+        layout.addWidget(self.spin_history, 4, 1)
+        layout.addWidget(btn_ok, 5, 0)
+        layout.addWidget(btn_cancel, 5, 1)
+        self.setLayout(layout)
+
+    def on_ok(self):
+        self.settings["prefetch_depth"] = self.spin_depth.value()
+        self.settings["prefetch_max_mb"] = self.spin_mem.value()
+        self.settings["large_note_mb"] = self.spin_large.value()
+        self.settings["autosave_seconds"] = self.spin_autosave.value()
+        self.settings["history_keep_days"] = self.spin_history.value()
+        self.accept()
+
+class VersionHistoryDialog(QDialog):
+    """Lista las versiones guardadas de una nota y permite restaurar cualquiera"""
+    def __init__(self, parent, store, filename):
+        super().__init__(parent)
+        self.setWindowTitle(f"Historial: {filename}")
+        self.resize(900, 600)
+        self.parent_window = parent
+        self.store = store
+        self.filename = filename
+        self.init_ui()
+        self.load_versions()
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+        splitter = QSplitter(Qt.Orientation.Horizontal)
+        self.version_list = QListWidget()
+        self.version_list.currentItemChanged.connect(self.on_version_selected)
+        self.preview = QTextEdit()
+        self.preview.setReadOnly(True)
+        splitter.addWidget(self.version_list)
+        splitter.addWidget(self.preview)
+        splitter.setSizes([280, 620])
+        layout.addWidget(splitter)
+        
+        btn_layout = QHBoxLayout()
+        self.btn_restore = QPushButton("RESTAURAR")
+        self.btn_restore.setEnabled(False)
+        self.btn_restore.clicked.connect(self.restore_selected)
+        btn_close = QPushButton("Cerrar")
+        btn_close.clicked.connect(self.reject)
+        btn_layout.addWidget(self.btn_restore)
+        btn_layout.addWidget(btn_close)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+
+    def load_versions(self):
+        kinds = {"save": "", "original": " (original)", "delete": " (eliminada)"}
+        try:
+            versions = self.store.versions(self.filename)
+        except sqlite3.Error as e:
+            print(f"Error al leer el historial: {e}")
+            versions = []
+        for vid, created, kind, size in versions:
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created))
+            item = QListWidgetItem(f"{stamp}  ·  {size // 1024 + 1} KB{kinds.get(kind, '')}")
+            item.setData(Qt.ItemDataRole.UserRole, vid)
+            self.version_list.addItem(item)
+        if not versions:
+            self.version_list.addItem("(sin versiones guardadas)")
+
+    def selected_content(self):
+        item = self.version_list.currentItem()
+        vid = item.data(Qt.ItemDataRole.UserRole) if item else None
+        if vid is None: return None
+        return self.store.load(vid).decode('utf-8', errors='ignore')
+
+    def on_version_selected(self, curr, prev):
+        try:
+            content = self.selected_content()
+        except (sqlite3.Error, KeyError, zlib.error) as e:
+            print(f"Error al leer la versión: {e}")
+            content = None
+        self.btn_restore.setEnabled(content is not None)
+        if content is None:
+            self.preview.clear()
+        elif is_markdown_note(self.filename):
+            self.preview.setMarkdown(content)
+        elif is_rich_content(content):
+            self.preview.setHtml(content)
+        else:
+            self.preview.setPlainText(content)
+
+    def restore_selected(self):
+        content = self.selected_content()
+        if content is not None and self.parent_window.restore_version(self.filename, content):
+            self.accept()
+
 class InsertLinkDialog(QDialog):
     def __init__(self, parent):
         super().__init__(parent)
@@ -480,9 +3562,54 @@ class InsertLinkDialog(QDialog):
         else:
             QMessageBox.warning(self, "Error", "Complete ambos campos.")
 
+AT_LINK_RE = re.compile(r"@@([\w\.-]+)")
+EXTERNAL_URL_RE = re.compile(r"https?://[\w./?=&#-]+")
+
+def compute_link_spans(text):
+    """Enlaces de texto de un bloque: [(inicio, fin, tipo, destino)] ordenados por inicio"""
+    spans = [(m.start(), m.end(), "internal", m.group(1)) for m in TAG_LINK_RE.finditer(text)]
+    spans += [(m.start(), m.end(), "internal", m.group(1)) for m in AT_LINK_RE.finditer(text)]
+    spans += [(m.start(), m.end(), "external", m.group()) for m in EXTERNAL_URL_RE.finditer(text)]
+    spans.sort()
+    return spans
+
+class LinkSpans(QTextBlockUserData):
+    """Enlaces de un bloque calculados por el resaltador, válidos para una revisión del bloque"""
+    def __init__(self, revision, spans, anchor_targets=()):
+        super().__init__()
+        self.revision = revision
+        self.spans = spans
+        self.starts = [span[0] for span in spans]
+        # Claves de nota enlazadas desde el bloque (texto y anclas model://)
+        self.targets = {span[3].strip().lower() for span in spans if span[2] == "internal"}
+        self.targets.update(anchor_targets)
+
+    def link_at(self, pos):
+        """(tipo, destino) del enlace que contiene pos (extremos incluidos) o None"""
+        i = bisect.bisect_right(self.starts, pos) - 1
+        if i >= 0 and pos <= self.spans[i][1]:
+            return self.spans[i][2:]
+        return None
+
+def link_spans_for_block(block):
+    """Enlaces cacheados del bloque; se recalculan solo si el bloque cambió desde entonces"""
+    data = block.userData()
+    if not isinstance(data, LinkSpans) or data.revision != block.revision():
+        # Sin resaltador (notas grandes en solo lectura) se calculan al vuelo
+        data = LinkSpans(block.revision(), compute_link_spans(block.text()))
+        block.setUserData(data)
+    return data
+
 class EnhancedLinkHighlighter(QSyntaxHighlighter):
-    def __init__(self, parent=None):
+    """Resalta enlaces de texto y marca los internos cuya nota no existe.
+
+    name_index es el NameIndex del vault; su registro de cambios permite volver a
+    resaltar solo los bloques que enlazan a notas creadas, renombradas o borradas.
+    """
+    def __init__(self, parent=None, name_index=None):
         super().__init__(parent)
+        self.name_index = name_index
+        self.names_generation = name_index.generation if name_index is not None else 0
         self.internal_link_format = QTextCharFormat()
         self.internal_link_format.setForeground(QColor("#4EC9B0")) 
         self.internal_link_format.setFontUnderline(True)
@@ -491,36 +3618,110 @@ class EnhancedLinkHighlighter(QSyntaxHighlighter):
         self.external_link_format.setForeground(QColor("#6A9955")) 
         self.external_link_format.setFontUnderline(True)
         self.external_link_format.setFontWeight(QFont.Weight.Bold)
-        self.internal_pattern = QRegularExpression(r"@@[\w\.-]+")
-        self.external_pattern = QRegularExpression(r"https?://[\w./?=&#-]+")
+        self.broken_link_format = QTextCharFormat()
+        self.broken_link_format.setForeground(QColor(C_URGENT))
+        self.broken_link_format.setFontUnderline(True)
+        self.broken_link_format.setUnderlineStyle(QTextCharFormat.UnderlineStyle.DashUnderline)
+        self.broken_link_format.setFontWeight(QFont.Weight.Bold)
+
+    def exists(self, target):
+        return self.name_index is None or target in self.name_index
 
     def highlightBlock(self, text):
-        match_iterator = self.external_pattern.globalMatch(text)
-        while match_iterator.hasNext():
-            match = match_iterator.next()
-            self.setFormat(match.capturedStart(), match.capturedLength(), self.external_link_format)
-        match_iterator = self.internal_pattern.globalMatch(text)
-        while match_iterator.hasNext():
-            match = match_iterator.next()
-            self.setFormat(match.capturedStart(), match.capturedLength(), self.internal_link_format)
+        # Los enlaces quedan guardados en el bloque para el hover y los clics
+        spans = compute_link_spans(text)
+        for start, end, kind, target in spans:
+            if kind == "external":
+                fmt = self.external_link_format
+            else:
+                fmt = self.internal_link_format if self.exists(target) else self.broken_link_format
+            self.setFormat(start, end - start, fmt)
+        # Anclas model:// del texto enriquecido: solo se marcan las rotas
+        block = self.currentBlock()
+        anchor_targets = set()
+        it = block.begin()
+        while not it.atEnd():
+            fragment = it.fragment()
+            href = fragment.charFormat().anchorHref()
+            if href.startswith("model://"):
+                target = href[len("model://"):]
+                anchor_targets.add(target.strip().lower())
+                if not self.exists(target):
+                    self.setFormat(fragment.position() - block.position(), fragment.length(), self.broken_link_format)
+            it += 1
+        self.setCurrentBlockUserData(LinkSpans(block.revision(), spans, anchor_targets))
+
+    def refresh_targets(self):
+        """Vuelve a resaltar solo los bloques que enlazan a notas que aparecieron o desaparecieron"""
+        if self.name_index is None or self.names_generation == self.name_index.generation: return
+        keys = self.name_index.changed_since(self.names_generation)
+        self.names_generation = self.name_index.generation
+        if keys is None:
+            self.rehighlight()
+            return
+        if not keys: return
+        block = self.document().begin()
+        while block.isValid():
+            data = block.userData()
+            if isinstance(data, LinkSpans) and not data.targets.isdisjoint(keys):
+                self.rehighlightBlock(block)
+            block = block.next()
 
 class SmartLinkTextEdit(QTextEdit):
+    # Se emite al cambiar el QTextDocument mostrado (caché de documentos)
+    document_swapped = pyqtSignal(object)
+
     def __init__(self, parent_window):
         super().__init__()
         self.parent_window = parent_window
-        self.highlighter = EnhancedLinkHighlighter(self.document())
+        self.note_document = None
+        self.highlighter = None
         self.setMouseTracking(True)
         self.viewport().setMouseTracking(True)
-        self.document().setDefaultStyleSheet(f"a {{ text-decoration: underline; color: {C_ACCENT}; font-weight: bold; }}")
         
         font = self.font()
         font.setPointSize(16)
         font.setFamily("Cascadia Code")
         self.setFont(font)
+        self.set_note_document(build_note_document())
         
         # --- Solución para Ctrl+S BUG: Instalar filtro de eventos ---
         self.installEventFilter(self)
         # --------------------------------------------------------------
+        
+        # Autocompletado de nombres de nota al escribir ##
+        self.link_names_model = QStringListModel(self)
+        self.link_completer = QCompleter(self.link_names_model, self)
+        self.link_completer.setWidget(self)
+        self.link_completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.link_completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self.link_completer.activated.connect(self.insert_link_completion)
+        self.hover_link = None
+
+    def set_note_document(self, doc, highlight=True):
+        """Muestra un documento ya construido sin volver a parsear su contenido"""
+        if not hasattr(doc, 'link_highlighter'):
+            doc.link_highlighter = None
+        if highlight and doc.link_highlighter is None:
+            doc.link_highlighter = EnhancedLinkHighlighter(doc, self.link_name_index())
+        if doc.defaultFont() != self.font():
+            doc.setDefaultFont(self.font())
+        # El editor no se adueña de documentos sin padre: guardamos la referencia
+        self.note_document = doc
+        self.highlighter = doc.link_highlighter
+        self.setDocument(doc)
+        self.document_swapped.emit(doc)
+
+    def link_name_index(self):
+        model = getattr(self.parent_window, 'note_model', None)
+        return model.name_index if model is not None else None
+
+    def enable_highlighting(self):
+        """Activa el resaltado de enlaces en un documento abierto sin él"""
+        doc = self.note_document
+        if doc is not None and doc.link_highlighter is None:
+            doc.link_highlighter = EnhancedLinkHighlighter(doc, self.link_name_index())
+            self.highlighter = doc.link_highlighter
 
     # --- Solución para Ctrl+S BUG: Filtro de eventos para capturar Ctrl+S ---
     def eventFilter(self, obj, event):
@@ -544,9 +3745,48 @@ class SmartLinkTextEdit(QTextEdit):
         else:
             super().wheelEvent(event)
 
+    def keyPressEvent(self, event):
+        # Con el popup abierto, Enter/Tab/Esc los gestiona el autocompletado
+        if self.link_completer.popup().isVisible() and event.key() in (
+                Qt.Key.Key_Enter, Qt.Key.Key_Return, Qt.Key.Key_Escape, Qt.Key.Key_Tab, Qt.Key.Key_Backtab):
+            event.ignore()
+            return
+        super().keyPressEvent(event)
+
     def keyReleaseEvent(self, event):
         super().keyReleaseEvent(event)
         if event.text() == "#": self.check_magic_tag()
+        if event.text() or event.key() == Qt.Key.Key_Backspace:
+            self.update_link_completer()
+
+    def pending_tag_prefix(self):
+        """Texto escrito tras un ## todavía sin cerrar (o None)"""
+        cursor = self.textCursor()
+        text_before = cursor.block().text()[:cursor.positionInBlock()]
+        match = re.search(r"(?<!#)##([\w\.-]*)$", text_before)
+        return match.group(1) if match else None
+
+    def update_link_completer(self):
+        prefix = self.pending_tag_prefix()
+        popup = self.link_completer.popup()
+        names = self.parent_window.name_index.complete(prefix) if prefix is not None else []
+        if not names:
+            popup.hide()
+            return
+        self.link_names_model.setStringList(names)
+        rect = self.cursorRect()
+        rect.setWidth(popup.sizeHintForColumn(0) + popup.verticalScrollBar().sizeHint().width())
+        self.link_completer.complete(rect)
+        popup.setCurrentIndex(self.link_completer.completionModel().index(0, 0))
+
+    def insert_link_completion(self, name):
+        prefix = self.pending_tag_prefix()
+        if prefix is None: return
+        cursor = self.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.Left, QTextCursor.MoveMode.KeepAnchor, len(prefix))
+        cursor.insertText(f"{name}##")
+        self.setTextCursor(cursor)
+        self.check_magic_tag()
 
     def check_magic_tag(self):
         cursor = self.textCursor()
@@ -558,19 +3798,37 @@ class SmartLinkTextEdit(QTextEdit):
         if match:
             model_name = match.group(1)
             full_tag = match.group(0)
+            # Si la nota existe, enlazar con su nombre real (respetando mayúsculas)
+            target_file = self.parent_window.name_index.resolve(model_name)
+            target = os.path.splitext(target_file)[0] if target_file else model_name
             cursor.movePosition(QTextCursor.MoveOperation.Left, QTextCursor.MoveMode.KeepAnchor, len(full_tag))
             cursor.removeSelectedText()
-            html = f'<a href="model://{model_name}">{model_name}</a>&nbsp;'
+            html = f'<a href="model://{target}">{model_name}</a>&nbsp;'
             cursor.insertHtml(html)
             self.setFontPointSize(16)
 
     def mouseMoveEvent(self, event):
-        if self.anchorAt(event.pos()) or self.get_link_at_pos(event.pos()):
+        url = self.anchorAt(event.pos())
+        link_info = None if url else self.get_link_at_pos(event.pos())
+        if url or link_info:
             self.viewport().setCursor(Qt.CursorShape.PointingHandCursor)
         else:
             self.viewport().setCursor(Qt.CursorShape.IBeamCursor)
+        if url.startswith("model://"):
+            link_info = ("internal", url[len("model://"):])
+        self.update_hover_tooltip(link_info)
         super().mouseMoveEvent(event)
 
+    def update_hover_tooltip(self, link_info):
+        """Indica al pasar el mouse si el enlace interno abre una nota o la crea"""
+        if link_info == self.hover_link: return
+        self.hover_link = link_info
+        tip = ""
+        if link_info and link_info[0] == "internal":
+            target_file = self.parent_window.name_index.resolve(link_info[1])
+            tip = f"Abrir: {target_file}" if target_file else f"Crear nota: {link_info[1]}"
+        self.viewport().setToolTip(tip)
+
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
             url = self.anchorAt(event.pos())
@@ -589,28 +3847,110 @@ class SmartLinkTextEdit(QTextEdit):
 
     def get_link_at_pos(self, pos):
         cursor = self.cursorForPosition(pos)
-        block_text = cursor.block().text()
-        pos_in_block = cursor.positionInBlock()
-        internal_regex = re.compile(r"##[\w\.-]+##")
-        for match in internal_regex.finditer(block_text):
-            start, end = match.span()
-            if start <= pos_in_block <= end:
-                return ("internal", match.group()[2:-2]) 
-        external_regex = re.compile(r"https?://[\w./?=&#-]+")
-        for match in external_regex.finditer(block_text):
-            start, end = match.span()
-            if start <= pos_in_block <= end:
-                return ("external", match.group())
-        return None
+        return link_spans_for_block(cursor.block()).link_at(cursor.positionInBlock())
+
+# Tiempo máximo de cada tramo de búsqueda antes de devolver el control a la UI
+FIND_SLICE_SECONDS = 0.015
+# Máximo de coincidencias pintadas a la vez (solo las de la zona visible)
+FIND_MAX_SELECTIONS = 2000
+ASTRAL_RE = re.compile('[\U00010000-\U0010FFFF]')
+
+def compile_find_pattern(text, case_sensitive=False, regex=False, whole_word=False):
+    """Compila el texto buscado; lanza re.error si la expresión regular no es válida"""
+    source = text if regex else re.escape(text)
+    if whole_word:
+        source = rf'(?<!\w)(?:{source})(?!\w)'
+    return re.compile(source, 0 if case_sensitive else re.IGNORECASE)
+
+def find_in_block(pattern, text):
+    """Coincidencias no vacías de un bloque como (inicio, fin, match).
+
+    Las posiciones se devuelven en unidades UTF-16, que son las que usa
+    QTextDocument (un emoji ocupa dos).
+    """
+    astral = ASTRAL_RE.search(text) is not None
+    for m in pattern.finditer(text):
+        start, end = m.span()
+        if start == end: continue
+        if astral:
+            start += len(ASTRAL_RE.findall(text, 0, start))
+            end = start + (end - m.start()) + len(ASTRAL_RE.findall(text, m.start(), end))
+        yield start, end, m
+
+REPLACEMENT_ESCAPE_RE = re.compile(r'\\(?:g<([^>]*)>|(0[0-7]{0,2}|[0-7]{3})|(\d\d?)|(.?))', re.DOTALL)
+REPLACEMENT_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v', 'a': '\a', 'b': '\b', '\\': '\\'}
+
+def compile_replacement(template, pattern):
+    """Prepara una plantilla de reemplazo con la sintaxis de re (\\1, \\g<nombre>).
+
+    Devuelve una función match -> texto. Match.expand vuelve a analizar la
+    plantilla en cada llamada, lo que domina el tiempo con miles de coincidencias.
+    Lanza re.error si la plantilla usa un grupo o un escape no válidos.
+    """
+    parts = []
+    last = 0
+    for m in REPLACEMENT_ESCAPE_RE.finditer(template):
+        parts.append(template[last:m.start()])
+        last = m.end()
+        name, octal, number, char = m.groups()
+        if octal is not None:
+            # Como en re: \0 y tres dígitos octales son un carácter, no un grupo
+            if int(octal, 8) > 0o377: raise re.error(f"escape octal fuera de rango \\{octal}", template, m.start())
+            parts.append(chr(int(octal, 8)))
+            continue
+        if char is not None:
+            if char in REPLACEMENT_ESCAPES: parts.append(REPLACEMENT_ESCAPES[char])
+            elif not char: raise re.error("\\ al final de la plantilla", template, m.start())
+            elif char.isascii() and char.isalnum(): raise re.error(f"escape no válido \\{char}", template, m.start())
+            else: parts.append(m.group())
+            continue
+        group = number if number is not None else name
+        if group.isdigit(): group = int(group)
+        elif group in pattern.groupindex: group = pattern.groupindex[group]
+        else: raise re.error(f"grupo desconocido {group}", template, m.start())
+        if isinstance(group, int) and group > pattern.groups:
+            raise re.error(f"referencia a grupo no válida {group}", template, m.start())
+        parts.append(group)
+    parts.append(template[last:])
+    if all(isinstance(part, str) for part in parts):
+        text = ''.join(parts)
+        return lambda match: text
+    return lambda match: ''.join(part if isinstance(part, str) else (match.group(part) or '') for part in parts)
 
 class FindReplaceDialog(QDialog):
+    """Buscar y reemplazar con resaltado de todas las coincidencias.
+
+    Las coincidencias se calculan por tramos de bloques (FIND_SLICE_SECONDS) para no
+    bloquear la UI en notas enormes; solo se pintan las de la zona visible.
+    """
     def __init__(self, parent, editor):
         super().__init__(parent)
         self.editor = editor
         self.setWindowTitle("Buscar y Reemplazar")
         self.setWindowFlags(Qt.WindowType.Window) 
         self.resize(600, 250)
+        self.pattern = None
+        self.matches = []
+        self.match_starts = []
+        self.search_doc = None
+        self.search_block = None
+        self.search_done = True
+        color = QColor(C_WARNING)
+        color.setAlpha(90)
+        self.match_format = QTextCharFormat()
+        self.match_format.setBackground(color)
+        # Espera a que el usuario deje de escribir antes de buscar
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.start_search)
+        self.slice_timer = QTimer(self)
+        self.slice_timer.setSingleShot(True)
+        self.slice_timer.setInterval(0)
+        self.slice_timer.timeout.connect(self.search_slice)
         self.init_ui()
+        self.editor.verticalScrollBar().valueChanged.connect(self.update_selections)
+        self.editor.cursorPositionChanged.connect(self.update_count)
 
     def init_ui(self):
         layout = QGridLayout()
@@ -618,11 +3958,21 @@ class FindReplaceDialog(QDialog):
         self.lbl_find = QLabel("BUSCAR:")
         self.lbl_find.setStyleSheet(f"color: {C_FG};")
         self.txt_find = QLineEdit()
+        self.txt_find.textChanged.connect(self.schedule_search)
+        self.txt_find.returnPressed.connect(self.find_next)
         self.lbl_rep = QLabel("REEMPLAZAR CON:")
         self.lbl_rep.setStyleSheet(f"color: {C_FG};")
         self.txt_rep = QLineEdit()
         self.chk_case = QCheckBox("Coincidir Mayús/Minús")
         self.chk_case.setStyleSheet(f"color: {C_FG};")
+        self.chk_regex = QCheckBox("Expresión regular")
+        self.chk_regex.setStyleSheet(f"color: {C_FG};")
+        self.chk_word = QCheckBox("Palabra completa")
+        self.chk_word.setStyleSheet(f"color: {C_FG};")
+        for chk in (self.chk_case, self.chk_regex, self.chk_word):
+            chk.toggled.connect(self.schedule_search)
+        self.lbl_count = QLabel("")
+        self.lbl_count.setStyleSheet(f"color: {C_FG};")
         
         self.btn_find = QPushButton("BUSCAR SIGUIENTE")
         self.btn_find.setStyleSheet(f"""
@@ -667,42 +4017,410 @@ class FindReplaceDialog(QDialog):
         layout.addWidget(self.txt_find, 0, 1, 1, 2)
         layout.addWidget(self.lbl_rep, 1, 0)
         layout.addWidget(self.txt_rep, 1, 1, 1, 2)
-        layout.addWidget(self.chk_case, 2, 0, 1, 3)
-        layout.addWidget(self.btn_find, 3, 0)
-        layout.addWidget(self.btn_rep, 3, 1)
-        layout.addWidget(self.btn_all, 3, 2)
+        layout.addWidget(self.chk_case, 2, 0)
+        layout.addWidget(self.chk_regex, 2, 1)
+        layout.addWidget(self.chk_word, 2, 2)
+        layout.addWidget(self.lbl_count, 3, 0, 1, 3)
+        layout.addWidget(self.btn_find, 4, 0)
+        layout.addWidget(self.btn_rep, 4, 1)
+        layout.addWidget(self.btn_all, 4, 2)
         self.setLayout(layout)
 
-    def get_flags(self):
-        f = QTextDocument.FindFlag(0)
-        if self.chk_case.isChecked(): f |= QTextDocument.FindFlag.FindCaseSensitively
-        return f
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.schedule_search()
+
+    def hideEvent(self, event):
+        self.search_timer.stop()
+        self.slice_timer.stop()
+        self.editor.setExtraSelections([])
+        super().hideEvent(event)
+
+    # ----- BÚSQUEDA INCREMENTAL -----
+    def schedule_search(self):
+        if self.isVisible():
+            self.search_timer.start()
+
+    def set_search_doc(self, doc):
+        if self.search_doc is doc: return
+        if self.search_doc is not None:
+            try: self.search_doc.contentsChanged.disconnect(self.schedule_search)
+            except (TypeError, RuntimeError): pass
+        self.search_doc = doc
+        doc.contentsChanged.connect(self.schedule_search)
+
+    def start_search(self):
+        self.slice_timer.stop()
+        self.set_search_doc(self.editor.document())
+        self.pattern = None
+        self.matches = []
+        self.match_starts = []
+        self.search_done = True
+        self.lbl_count.setStyleSheet(f"color: {C_FG};")
+        txt = self.txt_find.text()
+        if not txt or not self.isVisible():
+            self.lbl_count.setText("")
+            self.editor.setExtraSelections([])
+            return
+        try:
+            self.pattern = compile_find_pattern(txt, self.chk_case.isChecked(),
+                                                self.chk_regex.isChecked(), self.chk_word.isChecked())
+        except re.error as e:
+            self.lbl_count.setStyleSheet(f"color: {C_URGENT};")
+            self.lbl_count.setText(f"Expresión no válida: {e}")
+            self.editor.setExtraSelections([])
+            return
+        self.search_block = self.search_doc.begin()
+        self.search_done = False
+        self.search_slice()
+
+    def search_slice(self):
+        """Busca en el siguiente tramo de bloques y reprograma el resto"""
+        if self.pattern is None or self.search_done: return
+        if self.search_doc is not self.editor.document():
+            self.start_search()
+            return
+        deadline = time.monotonic() + FIND_SLICE_SECONDS
+        block = self.search_block
+        while block.isValid() and time.monotonic() < deadline:
+            text = block.text()
+            base = block.position()
+            for start, end, _ in find_in_block(self.pattern, text):
+                self.matches.append((base + start, base + end))
+                self.match_starts.append(base + start)
+            block = block.next()
+        self.search_block = block
+        if block.isValid(): self.slice_timer.start()
+        else: self.search_done = True
+        self.update_selections()
+        self.update_count()
+
+    def ensure_pattern(self):
+        """Arranca ya la búsqueda si hay cambios pendientes, para tener el patrón actual"""
+        if self.search_timer.isActive() or self.search_doc is not self.editor.document() or self.pattern is None:
+            self.search_timer.stop()
+            self.start_search()
+
+    def ensure_search_complete(self):
+        """Termina de golpe la búsqueda pendiente (antes de saltar o reemplazar)"""
+        self.ensure_pattern()
+        while self.pattern is not None and not self.search_done:
+            self.search_slice()
+        self.slice_timer.stop()
+
+    def update_selections(self):
+        if not self.isVisible() or self.pattern is None: return
+        if self.search_doc is not self.editor.document():
+            self.schedule_search()
+            return
+        if not self.matches:
+            self.editor.setExtraSelections([])
+            return
+        first, last = self.visible_range()
+        i = max(0, bisect.bisect_left(self.match_starts, first) - 1)
+        j = min(bisect.bisect_right(self.match_starts, last), i + FIND_MAX_SELECTIONS)
+        selections = []
+        for start, end in self.matches[i:j]:
+            sel = QTextEdit.ExtraSelection()
+            sel.cursor = QTextCursor(self.search_doc)
+            sel.cursor.setPosition(start)
+            sel.cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+            sel.format = self.match_format
+            selections.append(sel)
+        self.editor.setExtraSelections(selections)
+
+    def visible_range(self):
+        """Posiciones de inicio y fin de la zona visible del editor.
+
+        Busca por bisección sobre los rectángulos de bloque: cursorForPosition
+        recorre todo el documento y es lento en notas grandes.
+        """
+        doc = self.search_doc
+        layout = doc.documentLayout()
+        top = self.editor.verticalScrollBar().value()
+        bottom = top + self.editor.viewport().height()
+        def block_at(y):
+            lo, hi = 0, doc.blockCount() - 1
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if layout.blockBoundingRect(doc.findBlockByNumber(mid)).top() <= y: lo = mid
+                else: hi = mid - 1
+            return doc.findBlockByNumber(lo)
+        last_block = block_at(bottom)
+        return block_at(top).position(), last_block.position() + last_block.length()
+
+    def current_match_index(self, cursor):
+        if not cursor.hasSelection(): return None
+        start = cursor.selectionStart()
+        k = bisect.bisect_left(self.match_starts, start)
+        if k < len(self.matches) and self.matches[k] == (start, cursor.selectionEnd()):
+            return k
+        return None
+
+    def update_count(self):
+        if not self.isVisible() or self.pattern is None: return
+        total = len(self.matches)
+        more = "" if self.search_done else "+"
+        if not total:
+            self.lbl_count.setText("Sin coincidencias" if self.search_done else "Buscando...")
+            return
+        k = self.current_match_index(self.editor.textCursor())
+        if k is None: self.lbl_count.setText(f"{total}{more} coincidencias")
+        else: self.lbl_count.setText(f"{k + 1} de {total}{more}")
 
     def find_next(self):
         txt = self.txt_find.text()
         if not txt: return
-        if not self.editor.find(txt, self.get_flags()):
-            self.editor.moveCursor(QTextCursor.MoveOperation.Start)
-            if not self.editor.find(txt, self.get_flags()):
-                QMessageBox.information(self, "Info", "No encontrado.")
+        self.ensure_search_complete()
+        if self.pattern is None: return
+        if not self.matches:
+            QMessageBox.information(self, "Info", "No encontrado.")
+            return
+        cursor = self.editor.textCursor()
+        pos = cursor.selectionEnd() if cursor.hasSelection() else cursor.position()
+        k = bisect.bisect_left(self.match_starts, pos)
+        if k == len(self.matches): k = 0
+        start, end = self.matches[k]
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        self.editor.setTextCursor(cursor)
+        self.update_count()
+
+    def replacement_function(self):
+        """Función match -> texto de reemplazo (con grupos solo en modo regex)"""
+        if self.chk_regex.isChecked():
+            return compile_replacement(self.txt_rep.text(), self.pattern)
+        text = self.txt_rep.text()
+        return lambda match: text
 
     def replace_one(self):
+        self.ensure_search_complete()
         cursor = self.editor.textCursor()
-        if cursor.hasSelection() and cursor.selectedText() == self.txt_find.text():
-            cursor.insertText(self.txt_rep.text())
-            self.find_next()
-        else: self.find_next()
+        if self.current_match_index(cursor) is not None:
+            block = cursor.block()
+            offset = cursor.selectionStart() - block.position()
+            try: replacement = self.replacement_function()
+            except re.error as e:
+                QMessageBox.warning(self, "Error", f"Reemplazo no válido: {e}")
+                return
+            for start, end, m in find_in_block(self.pattern, block.text()):
+                if start == offset:
+                    cursor.insertText(replacement(m))
+                    break
+        self.find_next()
 
     def replace_all(self):
-        txt = self.txt_find.text()
-        rep = self.txt_rep.text()
-        if not txt: return
-        self.editor.moveCursor(QTextCursor.MoveOperation.Start)
-        c = 0
-        while self.editor.find(txt, self.get_flags()):
-            self.editor.textCursor().insertText(rep)
-            c += 1
-        QMessageBox.information(self, "Info", f"Reemplazados: {c}")
+        """Reemplaza todas las coincidencias en un único paso de deshacer.
+
+        Las coincidencias se reúnen en una pasada y se aplican de atrás hacia
+        delante dentro de un solo bloque de edición, así el documento se
+        maqueta una vez y Ctrl+Z lo revierte todo.
+        """
+        if not self.txt_find.text(): return
+        self.ensure_pattern()
+        if self.pattern is None: return
+        try: replacement = self.replacement_function()
+        except re.error as e:
+            QMessageBox.warning(self, "Error", f"Reemplazo no válido: {e}")
+            return
+        doc = self.editor.document()
+        edits = []
+        block = doc.begin()
+        while block.isValid():
+            base = block.position()
+            for start, end, m in find_in_block(self.pattern, block.text()):
+                edits.append((base + start, base + end, replacement(m)))
+            block = block.next()
+        if edits:
+            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+            self.editor.setUpdatesEnabled(False)
+            try:
+                cursor = QTextCursor(doc)
+                cursor.beginEditBlock()
+                for start, end, text in reversed(edits):
+                    cursor.setPosition(start)
+                    cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+                    cursor.insertText(text)
+                cursor.endEditBlock()
+            finally:
+                self.editor.setUpdatesEnabled(True)
+                QApplication.restoreOverrideCursor()
+        QMessageBox.information(self, "Info", f"Reemplazados: {len(edits)}")
+
+class VaultReplaceDialog(QDialog):
+    """Buscar y reemplazar en todas las notas del vault, con vista previa por nota"""
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.app = parent
+        self.setWindowTitle("Reemplazar en el vault")
+        self.setWindowFlags(Qt.WindowType.Window)
+        self.resize(800, 600)
+        self.worker = None
+        self.generation = 0
+        self.scan_args = None
+        self.scan_digests = {}
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QGridLayout(self)
+        lbl_find = QLabel("BUSCAR:")
+        lbl_find.setStyleSheet(f"color: {C_FG};")
+        self.txt_find = QLineEdit()
+        lbl_rep = QLabel("REEMPLAZAR CON:")
+        lbl_rep.setStyleSheet(f"color: {C_FG};")
+        self.txt_rep = QLineEdit()
+        self.chk_case = QCheckBox("Coincidir Mayús/Minús")
+        self.chk_regex = QCheckBox("Expresión regular")
+        self.chk_word = QCheckBox("Palabra completa")
+        for chk in (self.chk_case, self.chk_regex, self.chk_word):
+            chk.setStyleSheet(f"color: {C_FG};")
+        self.btn_scan = QPushButton("VISTA PREVIA")
+        self.btn_scan.clicked.connect(self.start_scan)
+        self.btn_apply = QPushButton("APLICAR")
+        self.btn_apply.setStyleSheet(f"background-color: {C_WARNING}; color: {C_BG}; font-weight: bold; padding: 8px;")
+        self.btn_apply.setEnabled(False)
+        self.btn_apply.clicked.connect(self.apply_replace)
+        self.lbl_status = QLabel("")
+        self.lbl_status.setStyleSheet(f"color: {C_FG};")
+        self.progress = QProgressBar()
+        self.progress.hide()
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.setItemDelegate(SnippetDelegate(self.tree))
+        layout.addWidget(lbl_find, 0, 0)
+        layout.addWidget(self.txt_find, 0, 1, 1, 3)
+        layout.addWidget(lbl_rep, 1, 0)
+        layout.addWidget(self.txt_rep, 1, 1, 1, 3)
+        layout.addWidget(self.chk_case, 2, 1)
+        layout.addWidget(self.chk_regex, 2, 2)
+        layout.addWidget(self.chk_word, 2, 3)
+        layout.addWidget(self.lbl_status, 3, 0, 1, 4)
+        layout.addWidget(self.progress, 4, 0, 1, 4)
+        layout.addWidget(self.tree, 5, 0, 1, 4)
+        layout.addWidget(self.btn_scan, 6, 2)
+        layout.addWidget(self.btn_apply, 6, 3)
+
+    def start_worker(self, jobs=None, batch_dir=None):
+        if self.worker:
+            self.worker.cancel()
+        self.generation += 1
+        self.worker = VaultReplaceWorker(self.generation, self.app.current_vault, self.scan_args,
+                                         self.scan_template, jobs, batch_dir)
+        self.worker.signals.progress.connect(self.on_progress)
+        self.worker.signals.finished.connect(self.on_scan_finished if jobs is None else self.on_apply_finished)
+        self.progress.setRange(0, 0)
+        self.progress.show()
+        self.btn_scan.setEnabled(False)
+        self.btn_apply.setEnabled(False)
+        QThreadPool.globalInstance().start(self.worker)
+
+    def start_scan(self):
+        """Busca en todas las notas sin modificar nada y muestra los cambios propuestos"""
+        text = self.txt_find.text()
+        if not text or not self.app.current_vault: return
+        find_args = (text, self.chk_case.isChecked(), self.chk_regex.isChecked(), self.chk_word.isChecked())
+        try:
+            pattern = compile_find_pattern(*find_args)
+            make_replacement(pattern, self.txt_rep.text(), find_args[2])
+        except re.error as e:
+            QMessageBox.warning(self, "Error", f"Expresión no válida: {e}")
+            return
+        # Lo pendiente de la nota abierta tiene que estar en disco antes de analizar
+        if not self.app.check_save(): return
+        self.app.note_writer.flush()
+        self.scan_args = find_args
+        self.scan_template = self.txt_rep.text()
+        self.tree.clear()
+        self.lbl_status.setText("Analizando...")
+        self.start_worker()
+
+    def on_progress(self, generation, done, total):
+        if generation != self.generation: return
+        self.progress.setRange(0, total)
+        self.progress.setValue(done)
+
+    def on_scan_finished(self, generation, report):
+        if generation != self.generation: return
+        self.worker = None
+        self.progress.hide()
+        self.btn_scan.setEnabled(True)
+        if report["error"]:
+            self.lbl_status.setText(f"Error: {report['error']}")
+            return
+        self.scan_digests = {}
+        errors = []
+        items = []
+        total = 0
+        for name, count, samples, digest, error in sorted(report["results"]):
+            if error:
+                errors.append(f"{name}: {error}")
+                continue
+            self.scan_digests[name] = digest
+            total += count
+            item = QTreeWidgetItem([f"{name} ({count})"])
+            item.setData(0, Qt.ItemDataRole.UserRole, name)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(0, Qt.CheckState.Checked)
+            for before, old, new, after in samples:
+                child = QTreeWidgetItem([f"{before}{old} → {new}{after}"])
+                child.setData(0, SNIPPET_HTML_ROLE,
+                              f'{html.escape(before)}<s style="color:{C_URGENT};">{html.escape(old)}</s>'
+                              f'<b style="color:{C_SUCCESS};">{html.escape(new)}</b>{html.escape(after)}')
+                item.addChild(child)
+            items.append(item)
+        self.tree.addTopLevelItems(items)
+        self.lbl_status.setText(f"{len(items)} notas · {total} coincidencias. Desmarca las notas que no quieras cambiar.")
+        self.btn_apply.setEnabled(bool(items))
+        if errors:
+            QMessageBox.warning(self, "Reemplazar en el vault", "No se pudieron leer algunas notas:\n\n" + "\n".join(errors[:50]))
+
+    def apply_replace(self):
+        names = []
+        for i in range(self.tree.topLevelItemCount()):
+            item = self.tree.topLevelItem(i)
+            if item.checkState(0) == Qt.CheckState.Checked:
+                names.append(item.data(0, Qt.ItemDataRole.UserRole))
+        if not names: return
+        r = QMessageBox.question(self, "Reemplazar en el vault",
+                                 f"¿Aplicar el reemplazo en {len(names)} notas?\n"
+                                 "Se puede deshacer desde EDICIÓN > Deshacer reemplazo en el vault.")
+        if r != QMessageBox.StandardButton.Yes: return
+        if not self.app.check_save(): return
+        self.app.note_writer.flush()
+        vault = self.app.current_vault
+        manifest = {"created": time.time(), "find": self.scan_args[0], "replace": self.scan_template,
+                    "options": list(self.scan_args[1:]), "files": names}
+        try:
+            batch_dir = create_replace_batch(vault, manifest)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"No se pudo crear el diario del reemplazo:\n{e}")
+            return
+        jobs = [(number, os.path.join(vault, name), self.scan_digests[name]) for number, name in enumerate(names)]
+        self.lbl_status.setText("Aplicando...")
+        self.start_worker(jobs, batch_dir)
+
+    def on_apply_finished(self, generation, report):
+        if generation != self.generation: return
+        self.worker = None
+        self.progress.hide()
+        self.btn_scan.setEnabled(True)
+        changed = [name for name, count, error in report["results"] if count]
+        errors = [f"{name}: {error}" for name, count, error in report["results"] if error]
+        if report["error"]:
+            errors.append(report["error"])
+        self.app.on_notes_rewritten(changed)
+        total = sum(count for _, count, _ in report["results"])
+        self.lbl_status.setText(f"Reemplazadas {total} coincidencias en {len(changed)} notas.")
+        self.tree.clear()
+        if errors:
+            QMessageBox.warning(self, "Reemplazar en el vault", "Algunas notas no se modificaron:\n\n" + "\n".join(errors[:50]))
+
+    def closeEvent(self, event):
+        # Un análisis en curso se cancela; una aplicación en curso termina igual
+        if self.worker and self.worker.jobs is None:
+            self.worker.cancel()
+            self.worker = None
+        super().closeEvent(event)
 
 # =============================================================================
 # APP PRINCIPAL
@@ -712,9 +4430,55 @@ class ModelManagerApp(QMainWindow):
         super().__init__()
         self.current_vault = ""
         self.current_file_path = None
-        self.all_files = [] 
-        self.content_cache = {} 
+        self.vault_index = None
+        self.scan_worker = None
+        self.scan_generation = 0
+        self.pending_selection = None
+        self.file_stats = {}
+        self.file_ids = {}  # nombre -> (dispositivo, inodo), para reconocer renombrados
+        self.filter_generation = 0
+        self.fuzzy_index = None
+        self.frecency = None
+        self.document_cache = DocumentCache()
+        self.current_doc_stat = None
+        self.settings = load_app_settings()
+        # Documentos de enlaces precargados especulativamente (acotados por preferencias)
+        self.prefetch_cache = DocumentCache()
+        self.apply_prefetch_settings()
+        self.prefetch_pool = QThreadPool(self)
+        self.prefetch_pool.setMaxThreadCount(2)
+        self.prefetch_generation = 0
+        self.prefetch_pending = set()
+        # Carga de notas grandes fuera del hilo de la GUI
+        self.load_generation = 0
+        self.loading_path = None
+        # Guardado atómico en segundo plano
+        self.note_writer = NoteWriter(self)
+        self.note_writer.signals.saved.connect(self.on_note_saved)
+        self.note_writer.signals.failed.connect(self.on_note_save_failed)
+        # Diario de cambios sin guardar de la nota visible
+        self.journal = None
+        self.journal_recorder = JournalRecorder(self.on_journal_change)
+        self.journal_note_path = None
+        self.journal_open = False
+        self.journal_base = None
+        self.journal_save_digests = {}  # ruta -> sha1 del último guardado pedido
+        self.journal_recovery_pending = False
+        # Estadísticas incrementales del documento visible
+        self.doc_stats = DocumentStats(self.on_stats_change)
+        self.version_store = None
+        self.report_worker = None
+        self.report_generation = 0
+        self.search_worker = None
+        self.search_generation = 0
+        self.search_pattern = None
+        self.pending_reveal = None  # (ruta, patrón, número de coincidencia) a mostrar al abrir
         self.find_dialog = None
+        self.vault_replace_dialog = None
+        self.import_worker = None
+        self.convert_worker = None
+        self.vault_options = None
+        self.vault_options_path = None
         self.history = []        
         self.history_index = -1  
         self.is_navigating = False
@@ -752,10 +4516,8 @@ class ModelManagerApp(QMainWindow):
         if not opened and self.startup_file and self.current_vault:
             path_inicio = os.path.join(self.current_vault, self.startup_file)
             if os.path.exists(path_inicio):
-                # Seleccionarlo y abrirlo
-                items = self.list_widget.findItems(self.startup_file, Qt.MatchFlag.MatchFixedString)
-                if items:
-                    self.list_widget.setCurrentItem(items[0])
+                # Seleccionarlo y abrirlo (cuando el escaneo lo agregue a la lista)
+                self.select_in_list(self.startup_file)
 
     def select_vault_on_first_run(self):
         """Muestra el diálogo para seleccionar el vault en la primera ejecución"""
@@ -805,6 +4567,10 @@ class ModelManagerApp(QMainWindow):
         find_shortcut = QShortcut(QKeySequence.StandardKey.Find, self)
         find_shortcut.activated.connect(self.show_find)
         
+        # Ctrl+P para saltar a una nota
+        quick_shortcut = QShortcut(QKeySequence("Ctrl+P"), self)
+        quick_shortcut.activated.connect(self.show_quick_switcher)
+        
         # Ctrl+Z para deshacer
         undo_shortcut = QShortcut(QKeySequence.StandardKey.Undo, self)
         undo_shortcut.activated.connect(self.editor.undo)
@@ -835,17 +4601,33 @@ class ModelManagerApp(QMainWindow):
         self.search_bar = QLineEdit()
         self.search_bar.setPlaceholderText("🔍 Filtrar...")
         self.search_bar.textChanged.connect(self.filter_models)
+        # El filtro espera a que se deje de teclear y se calcula en segundo plano
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(200)
+        self.filter_timer.timeout.connect(self.run_filter)
         
-        # LISTA CON CONTEXT MENU
-        self.list_widget = QListWidget()
-        self.list_widget.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-        self.list_widget.customContextMenuRequested.connect(self.show_context_menu)
-        self.list_widget.currentItemChanged.connect(self.on_model_selected)
+        # LISTA CON CONTEXT MENU (modelo/vista virtualizado)
+        self.note_model = NoteListModel(self)
+        self.link_refresh_timer = QTimer(self)
+        self.link_refresh_timer.setSingleShot(True)
+        self.link_refresh_timer.setInterval(100)
+        self.link_refresh_timer.timeout.connect(self.refresh_link_highlighting)
+        self.note_model.names_changed.connect(self.link_refresh_timer.start)
+        self.note_proxy = NoteFilterProxy(self)
+        self.note_proxy.setSourceModel(self.note_model)
+        self.list_view = QListView()
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setLayoutMode(QListView.LayoutMode.Batched)
+        self.list_view.setModel(self.note_proxy)
+        self.list_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.list_view.customContextMenuRequested.connect(self.show_context_menu)
+        self.list_view.selectionModel().currentChanged.connect(self.on_model_selected)
         
         btn_ref = QPushButton("🔄 REFRESCAR")
         btn_ref.clicked.connect(self.load_models)
         left_l.addWidget(self.search_bar)
-        left_l.addWidget(self.list_widget)
+        left_l.addWidget(self.list_view)
         left_l.addWidget(btn_ref)
         
         # DERECHA
@@ -854,11 +4636,29 @@ class ModelManagerApp(QMainWindow):
         right_l.setContentsMargins(0,0,0,0)
         
         self.editor = SmartLinkTextEdit(self)
+        self.editor.document_swapped.connect(self.on_document_swapped)
+        self.journal_recorder.attach(self.editor.document())
+        self.doc_stats.attach(self.editor.document())
+        self.watch_modification(self.editor.document())
+        # La barra de estado se actualiza como mucho cuatro veces por segundo
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setSingleShot(True)
+        self.stats_timer.setInterval(250)
+        self.stats_timer.timeout.connect(self.update_stats)
+        self.journal_timer = QTimer(self)
+        self.journal_timer.setSingleShot(True)
+        self.journal_timer.setInterval(JOURNAL_FLUSH_MS)
+        self.journal_timer.timeout.connect(self.flush_journal)
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setSingleShot(True)
+        self.autosave_timer.timeout.connect(self.autosave)
         self.editor.setAcceptRichText(True)
-        self.editor.textChanged.connect(self.update_stats)
         
         self.toolbar = QToolBar()
         self.setup_toolbar()
+        self.setup_links_panel()
+        self.setup_report_panel()
+        self.setup_search_panel()
         self.create_menus()
         
         # BOTONERA
@@ -932,10 +4732,284 @@ class ModelManagerApp(QMainWindow):
         self.lbl_stats = QLabel("LINEAS: 0 | CARACTERES: 0")
         self.lbl_stats.setStyleSheet(f"color: {C_FG}; padding: 5px;")
         self.status_bar.addWidget(self.lbl_stats)
+        
+        # Progreso del escaneo del vault en segundo plano
+        self.scan_progress = QProgressBar()
+        self.scan_progress.setMaximumWidth(220)
+        self.scan_progress.setTextVisible(True)
+        self.scan_progress.hide()
+        self.status_bar.addPermanentWidget(self.scan_progress)
+        
+        # Carga de notas grandes y modo solo lectura
+        self.load_progress = QProgressBar()
+        self.load_progress.setMaximumWidth(160)
+        self.load_progress.setRange(0, 0)
+        self.load_progress.setFormat("Cargando...")
+        self.load_progress.hide()
+        self.status_bar.addPermanentWidget(self.load_progress)
+        self.btn_edit_large = QPushButton("✎ EDITAR")
+        self.btn_edit_large.setToolTip("Nota grande abierta en solo lectura: activar edición y resaltado")
+        self.btn_edit_large.clicked.connect(lambda: self.set_read_mostly(False))
+        self.btn_edit_large.hide()
+        self.status_bar.addPermanentWidget(self.btn_edit_large)
+        
+        # Vigilancia del vault: los cambios externos se aplican como deltas
+        self.fs_watcher = QFileSystemWatcher(self)
+        self.fs_watcher.directoryChanged.connect(self.on_vault_dir_changed)
+        self.fs_watcher.fileChanged.connect(self.on_watched_file_changed)
+        self.vault_change_timer = QTimer(self)
+        self.vault_change_timer.setSingleShot(True)
+        self.vault_change_timer.setInterval(300)
+        self.vault_change_timer.timeout.connect(self.apply_vault_changes)
+
+    def setup_links_panel(self):
+        """Panel lateral con los enlaces entrantes y salientes de la nota actual"""
+        self.links_dock = QDockWidget("🔗 ENLACES", self)
+        self.links_dock.setObjectName("links_dock")
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
+        layout.setContentsMargins(5, 5, 5, 5)
+        lbl_back = QLabel("← ENLAZAN AQUÍ")
+        lbl_back.setStyleSheet(f"color: {C_ACCENT}; font-weight: bold;")
+        self.lst_backlinks = QListWidget()
+        self.lst_backlinks.itemClicked.connect(self.on_backlink_clicked)
+        lbl_out = QLabel("→ SALIENTES")
+        lbl_out.setStyleSheet(f"color: {C_ACCENT}; font-weight: bold;")
+        self.lst_outgoing = QListWidget()
+        self.lst_outgoing.itemClicked.connect(self.on_outgoing_link_clicked)
+        layout.addWidget(lbl_back)
+        layout.addWidget(self.lst_backlinks)
+        layout.addWidget(lbl_out)
+        layout.addWidget(self.lst_outgoing)
+        self.links_dock.setWidget(panel)
+        self.links_dock.visibilityChanged.connect(lambda visible: visible and self.refresh_links_panel())
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.links_dock)
+
+    def refresh_links_panel(self):
+        """Consulta el grafo de enlaces del índice (solo si el panel está visible)"""
+        if not self.links_dock.isVisible(): return
+        self.lst_backlinks.clear()
+        self.lst_outgoing.clear()
+        if not self.current_file_path or not self.vault_index: return
+        filename = os.path.basename(self.current_file_path)
+        try:
+            backlinks = self.vault_index.backlinks(filename)
+            outgoing = self.vault_index.outgoing_links(filename)
+        except sqlite3.Error as e:
+            print(f"Error al consultar enlaces: {e}")
+            return
+        self.lst_backlinks.addItems(backlinks)
+        for target in outgoing:
+            target_file = self.name_index.resolve(target)
+            item = QListWidgetItem(target_file if target_file else f"{target} (no existe)")
+            item.setData(Qt.ItemDataRole.UserRole, target)
+            if not target_file:
+                item.setForeground(QColor(C_URGENT))
+            self.lst_outgoing.addItem(item)
+
+    def on_backlink_clicked(self, item):
+        if self.current_vault and self.check_save():
+            self.load_file(os.path.join(self.current_vault, item.text()))
+
+    def on_outgoing_link_clicked(self, item):
+        self.handle_internal_link(item.data(Qt.ItemDataRole.UserRole))
+
+    def setup_report_panel(self):
+        """Panel con el informe de enlaces rotos y notas huérfanas del vault"""
+        self.report_dock = QDockWidget("🩺 INFORME DE ENLACES", self)
+        self.report_dock.setObjectName("report_dock")
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
+        layout.setContentsMargins(5, 5, 5, 5)
+        btn_run = QPushButton("ANALIZAR")
+        btn_run.clicked.connect(self.run_link_report)
+        self.lbl_report = QLabel("Sin analizar")
+        self.tree_report = QTreeWidget()
+        self.tree_report.setHeaderHidden(True)
+        self.tree_report.itemClicked.connect(self.on_report_item_clicked)
+        layout.addWidget(btn_run)
+        layout.addWidget(self.lbl_report)
+        layout.addWidget(self.tree_report)
+        self.report_dock.setWidget(panel)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.report_dock)
+        self.report_dock.hide()
+
+    def run_link_report(self):
+        if not self.current_vault: return
+        self.report_dock.show()
+        if self.report_worker:
+            self.report_worker.cancel()
+        self.report_generation += 1
+        self.report_started = time.time()
+        self.report_worker = LinkReportWorker(self.report_generation, self.current_vault)
+        self.report_worker.signals.progress.connect(self.on_report_progress)
+        self.report_worker.signals.finished.connect(self.on_report_finished)
+        self.tree_report.clear()
+        self.lbl_report.setText("Analizando...")
+        QThreadPool.globalInstance().start(self.report_worker)
+
+    def on_report_progress(self, generation, done, total):
+        if generation != self.report_generation: return
+        self.lbl_report.setText(f"Analizando... {done}/{total} lotes")
+
+    def on_report_finished(self, generation, report):
+        if generation != self.report_generation: return
+        self.report_worker = None
+        if report["error"]:
+            self.lbl_report.setText(f"Error: {report['error']}")
+            return
+        broken, orphans = report["broken"], report["orphans"]
+        self.lbl_report.setText(f"{len(broken)} destinos rotos · {len(orphans)} huérfanas "
+                                f"({time.time() - self.report_started:.1f} s)")
+        self.tree_report.clear()
+        root_broken = QTreeWidgetItem([f"⛓ Enlaces rotos ({len(broken)})"])
+        for target in sorted(broken):
+            item = QTreeWidgetItem([target])
+            item.setForeground(0, QColor(C_URGENT))
+            for source in sorted(set(broken[target])):
+                child = QTreeWidgetItem([f"← {source}"])
+                child.setData(0, Qt.ItemDataRole.UserRole, source)
+                item.addChild(child)
+            root_broken.addChild(item)
+        root_orphans = QTreeWidgetItem([f"🏝 Notas huérfanas ({len(orphans)})"])
+        for name in orphans:
+            item = QTreeWidgetItem([name])
+            item.setData(0, Qt.ItemDataRole.UserRole, name)
+            root_orphans.addChild(item)
+        self.tree_report.addTopLevelItems([root_broken, root_orphans])
+        root_broken.setExpanded(True)
+
+    def on_report_item_clicked(self, item, column):
+        filename = item.data(0, Qt.ItemDataRole.UserRole)
+        if filename and self.current_vault and self.check_save():
+            self.load_file(os.path.join(self.current_vault, filename))
+
+    def setup_search_panel(self):
+        """Panel de búsqueda en el texto de todas las notas del vault"""
+        self.search_dock = QDockWidget("🔎 BUSCAR EN EL VAULT", self)
+        self.search_dock.setObjectName("search_dock")
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
+        layout.setContentsMargins(5, 5, 5, 5)
+        self.txt_vault_search = QLineEdit()
+        self.txt_vault_search.setPlaceholderText("Buscar en el texto de las notas...")
+        self.txt_vault_search.textChanged.connect(lambda: self.vault_search_timer.start())
+        self.txt_vault_search.returnPressed.connect(self.run_vault_search)
+        self.lbl_vault_search = QLabel("")
+        self.tree_vault_search = QTreeWidget()
+        self.tree_vault_search.setHeaderHidden(True)
+        self.tree_vault_search.setItemDelegate(SnippetDelegate(self.tree_vault_search))
+        self.tree_vault_search.itemClicked.connect(self.on_vault_search_item_clicked)
+        layout.addWidget(self.txt_vault_search)
+        layout.addWidget(self.lbl_vault_search)
+        layout.addWidget(self.tree_vault_search)
+        self.search_dock.setWidget(panel)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.search_dock)
+        self.search_dock.hide()
+        self.vault_search_timer = QTimer(self)
+        self.vault_search_timer.setSingleShot(True)
+        self.vault_search_timer.setInterval(250)
+        self.vault_search_timer.timeout.connect(self.run_vault_search)
+
+    def show_vault_search(self):
+        self.search_dock.show()
+        self.search_dock.raise_()
+        c = self.editor.textCursor()
+        if c.hasSelection():
+            self.txt_vault_search.setText(c.selectedText())
+        self.txt_vault_search.setFocus()
+        self.txt_vault_search.selectAll()
+
+    def cancel_vault_search(self):
+        if self.search_worker:
+            self.search_worker.cancel()
+            self.search_worker = None
+        self.search_generation += 1
+
+    def run_vault_search(self):
+        """Lanza una búsqueda nueva; la anterior se cancela y sus resultados se descartan"""
+        self.vault_search_timer.stop()
+        self.cancel_vault_search()
+        self.tree_vault_search.clear()
+        query = self.txt_vault_search.text().strip()
+        self.search_pattern = compile_vault_search_pattern(query)
+        if not self.current_vault or self.search_pattern is None:
+            self.lbl_vault_search.setText("")
+            return
+        self.search_started = time.time()
+        self.search_hits = 0
+        self.lbl_vault_search.setText("Buscando...")
+        self.search_worker = VaultSearchWorker(self.search_generation, query, self.search_pattern,
+                                               self.current_vault, self.vault_index)
+        self.search_worker.signals.results.connect(self.on_vault_search_results)
+        self.search_worker.signals.finished.connect(self.on_vault_search_finished)
+        QThreadPool.globalInstance().start(self.search_worker)
+
+    def on_vault_search_results(self, generation, batch):
+        if generation != self.search_generation: return
+        items = []
+        for name, count, snippets in batch:
+            item = QTreeWidgetItem([f"{name} ({count})"])
+            item.setData(0, Qt.ItemDataRole.UserRole, (name, 0))
+            item.setForeground(0, QColor(C_ACCENT))
+            for html_text, plain, ordinal in snippets:
+                child = QTreeWidgetItem([plain])
+                child.setData(0, Qt.ItemDataRole.UserRole, (name, ordinal))
+                child.setData(0, SNIPPET_HTML_ROLE, html_text)
+                child.setToolTip(0, plain)
+                item.addChild(child)
+            items.append(item)
+            self.search_hits += count
+        self.tree_vault_search.addTopLevelItems(items)
+        for item in items:
+            item.setExpanded(True)
+        self.lbl_vault_search.setText(f"Buscando... {self.tree_vault_search.topLevelItemCount()} notas · "
+                                      f"{self.search_hits} coincidencias")
+
+    def on_vault_search_finished(self, generation, found, truncated):
+        if generation != self.search_generation: return
+        self.search_worker = None
+        more = f" (se muestran las primeras {SEARCH_MAX_NOTES})" if truncated else ""
+        self.lbl_vault_search.setText(f"{found} notas · {self.search_hits} coincidencias{more} "
+                                      f"({time.time() - self.search_started:.1f} s)")
+
+    def on_vault_search_item_clicked(self, item, column):
+        data = item.data(0, Qt.ItemDataRole.UserRole)
+        if not data or not self.current_vault or not self.check_save(): return
+        name, ordinal = data
+        path = os.path.join(self.current_vault, name)
+        self.pending_reveal = (path, self.search_pattern, ordinal)
+        if self.current_file_path == path and self.loading_path is None:
+            self.reveal_pending_match(path)
+        else:
+            self.load_file(path)
+
+    def reveal_pending_match(self, path):
+        """Selecciona en el editor la coincidencia pedida desde el panel de búsqueda"""
+        reveal, self.pending_reveal = self.pending_reveal, None
+        if reveal is None or reveal[0] != path or reveal[1] is None: return
+        _, pattern, ordinal = reveal
+        doc = self.editor.document()
+        found = None
+        count = 0
+        block = doc.begin()
+        while block.isValid() and count <= ordinal:
+            for start, end, _ in find_in_block(pattern, block.text()):
+                found = (block.position() + start, block.position() + end)
+                count += 1
+                if count > ordinal: break
+            block = block.next()
+        if found is None: return
+        cursor = QTextCursor(doc)
+        cursor.setPosition(found[0])
+        cursor.setPosition(found[1], QTextCursor.MoveMode.KeepAnchor)
+        self.editor.setTextCursor(cursor)
+        self.editor.ensureCursorVisible()
 
     def show_context_menu(self, pos):
-        item = self.list_widget.itemAt(pos)
-        if item:
+        index = self.list_view.indexAt(pos)
+        if index.isValid():
+            filename = index.data()
             menu = QMenu()
             menu.setStyleSheet(f"""
                 QMenu {{ 
@@ -954,10 +5028,86 @@ class ModelManagerApp(QMainWindow):
             """)
             
             act_home = QAction("🏠 Establecer como Inicio", self)
-            act_home.triggered.connect(lambda: self.set_as_startup(item.text()))
+            act_home.triggered.connect(lambda: self.set_as_startup(filename))
             menu.addAction(act_home)
             
-            menu.exec(self.list_widget.mapToGlobal(pos))
+            act_rename = QAction("✏️ Renombrar...", self)
+            act_rename.triggered.connect(lambda: self.rename_note(filename))
+            menu.addAction(act_rename)
+            
+            act_history = QAction("🕘 Historial...", self)
+            act_history.triggered.connect(lambda: self.show_version_history(filename))
+            menu.addAction(act_history)
+            
+            menu.exec(self.list_view.viewport().mapToGlobal(pos))
+
+    def rename_note(self, filename):
+        """Renombra una nota y reescribe los enlaces que apuntan a ella en todo el vault"""
+        if not self.current_vault or not self.check_save(): return
+        self.note_writer.flush()
+        old_stem, ext = os.path.splitext(filename)
+        new_stem, ok = QInputDialog.getText(self, "Renombrar", "Nuevo nombre:", text=old_stem)
+        new_stem = new_stem.strip()
+        if not ok or not new_stem or new_stem == old_stem: return
+        if any(char in new_stem for char in ['/', '\\', ':', '*', '?', '"', '<', '>', '|']):
+            QMessageBox.warning(self, "Nombre inválido", "El nombre no puede contener caracteres especiales como /, \\, :, *, ?, \", <, >, |")
+            return
+        new_filename = new_stem + ext
+        old_path = os.path.join(self.current_vault, filename)
+        new_path = os.path.join(self.current_vault, new_filename)
+        # Permitir cambiar solo mayúsculas/minúsculas en sistemas de archivos que no las
+        # distinguen (el "destino" es el mismo archivo); si es otra nota, no se pisa
+        if os.path.exists(new_path) and not os.path.samefile(old_path, new_path):
+            QMessageBox.warning(self, "Renombrar", f"Ya existe '{new_filename}'.")
+            return
+        
+        # Notas que enlazan a la vieja, según el grafo de enlaces del índice
+        referencing = []
+        if self.vault_index:
+            try:
+                referencing = self.vault_index.backlinks(filename)
+                if old_stem.lower() in self.vault_index.outgoing_links(filename):
+                    referencing.append(new_filename)
+            except sqlite3.Error as e:
+                print(f"Error al consultar enlaces: {e}")
+        
+        try:
+            os.rename(old_path, new_path)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"No se pudo renombrar:\n{e}")
+            return
+        self.rename_file_entry(filename, new_filename)
+        
+        # Inicio e historial de navegación apuntan al nombre nuevo
+        if self.startup_file == filename:
+            self.startup_file = new_filename
+            save_vault_config(self.current_vault, new_filename)
+        self.history = [new_path if p == old_path else p for p in self.history]
+        self.watch_current_file()
+        self.refresh_links_panel()
+        if not referencing:
+            self.status_bar.showMessage(f"Renombrado: {filename} → {new_filename}", 5000)
+            return
+        
+        self.status_bar.showMessage(f"Renombrado: {filename} → {new_filename}. Actualizando enlaces...")
+        worker = LinkRewriteWorker(self.current_vault, referencing, old_stem, new_stem)
+        worker.signals.finished.connect(lambda report: self.on_rename_links_finished(worker, filename, new_filename, report))
+        QThreadPool.globalInstance().start(worker)
+
+    def on_rename_links_finished(self, worker, filename, new_filename, report):
+        if worker.vault_path != self.current_vault: return
+        rewritten = report["rewritten"]
+        for name in rewritten:
+            self.update_index_entry(name)
+        if self.current_file_path and os.path.basename(self.current_file_path) in rewritten:
+            self.is_navigating = True
+            self.load_file(self.current_file_path)
+            self.is_navigating = False
+        self.refresh_links_panel()
+        
+        self.status_bar.showMessage(f"Renombrado: {filename} → {new_filename} ({len(rewritten)} notas actualizadas)", 5000)
+        if report["errors"]:
+            QMessageBox.warning(self, "Renombrar", "No se pudieron actualizar algunas notas:\n\n" + "\n".join(report["errors"]))
 
     def set_as_startup(self, filename):
         try:
@@ -981,16 +5131,32 @@ class ModelManagerApp(QMainWindow):
         self.add_menu_action(m_file, "Guardar", self.save_model)
         m_file.addSeparator()
         self.add_menu_action(m_file, "Abrir...", self.open_any_file)
+        self.add_menu_action(m_file, "Importar carpeta...", self.import_folder)
+        self.add_menu_action(m_file, "Formato de las notas...", self.choose_storage_format)
+        self.add_menu_action(m_file, "Ir a nota... (Ctrl+P)", self.show_quick_switcher)
         self.add_menu_action(m_file, "Localizar Maletín...", self.select_vault_directory_menu)
+        self.add_menu_action(m_file, "Historial de la nota...", self.show_version_history)
+        self.add_menu_action(m_file, "Recuperar nota eliminada...", self.show_deleted_notes)
+        self.add_menu_action(m_file, "Preferencias...", self.show_preferences)
         m_file.addSeparator()
         self.add_menu_action(m_file, "Salir", self.close)
         
         m_edit = mb.addMenu("&EDICIÓN")
         self.add_menu_action(m_edit, "Buscar...", self.show_find, "Ctrl+F")
+        self.add_menu_action(m_edit, "Buscar en el vault...", self.show_vault_search, "Ctrl+Shift+F")
+        self.add_menu_action(m_edit, "Reemplazar en el vault...", self.show_vault_replace, "Ctrl+Shift+H")
+        self.add_menu_action(m_edit, "Deshacer reemplazo en el vault", self.undo_vault_replace)
         m_edit.addSeparator()
         self.add_menu_action(m_edit, "Deshacer", self.editor.undo, "Ctrl+Z")
         self.add_menu_action(m_edit, "Rehacer", self.editor.redo, "Ctrl+Y")
         
+        m_view = mb.addMenu("&VER")
+        m_view.addAction(self.links_dock.toggleViewAction())
+        m_view.addAction(self.report_dock.toggleViewAction())
+        m_view.addAction(self.search_dock.toggleViewAction())
+        m_view.addSeparator()
+        self.add_menu_action(m_view, "Analizar enlaces rotos y huérfanas", self.run_link_report)
+        
         m_ins = mb.addMenu("&INSERTAR")
         self.add_menu_action(m_ins, "Imagen...", self.insert_image)
         self.add_menu_action(m_ins, "Tabla...", self.insert_table)
@@ -1067,6 +5233,7 @@ class ModelManagerApp(QMainWindow):
                     return
                 if reply == QMessageBox.StandardButton.Yes:
                     self.save_model()
+            self.note_writer.flush()
             
             self.current_vault = vault_path
             save_vault_config(self.current_vault, self.startup_file)
@@ -1076,8 +5243,10 @@ class ModelManagerApp(QMainWindow):
             # Actualizar interfaz
             self.vault_label.setText(f"📁 Vault: {self.current_vault}")
             self.load_models()
-            self.editor.clear()
-            self.current_file_path = None
+            self.document_cache.clear()
+            self.prefetch_cache.clear()
+            self.show_blank_document()
+            self.refresh_links_panel()
             
             QMessageBox.information(self, "Vault Cambiado", 
                                    f"¡Vault cambiado exitosamente!\n\n"
@@ -1091,6 +5260,27 @@ class ModelManagerApp(QMainWindow):
         self.history.append(filepath)
         self.history_index += 1
         self.update_nav_buttons()
+        if self.frecency and os.path.dirname(filepath) == self.current_vault:
+            self.frecency.record(os.path.basename(filepath))
+
+    def open_frecency_store(self):
+        """Carga la frecencia del vault actual, guardando la del anterior"""
+        if self.frecency:
+            self.frecency.save()
+        self.frecency = FrecencyStore(self.current_vault) if self.current_vault else None
+
+    def show_quick_switcher(self):
+        if not self.current_vault: return
+        if self.fuzzy_index is None or self.fuzzy_index.names != self.all_files:
+            self.fuzzy_index = FuzzyNameIndex(self.all_files)
+        frecency = self.frecency.scores() if self.frecency else {}
+        dlg = QuickSwitcherDialog(self, self.fuzzy_index, frecency)
+        geo = self.geometry()
+        dlg.move(geo.x() + (geo.width() - dlg.width()) // 2, geo.y() + 80)
+        dlg.txt_query.setFocus()
+        if dlg.exec() and dlg.selected_file:
+            if self.check_save():
+                self.load_file(os.path.join(self.current_vault, dlg.selected_file))
 
     def go_back(self):
         if self.history_index > 0:
@@ -1125,12 +5315,12 @@ class ModelManagerApp(QMainWindow):
             except Exception as e:
                 QMessageBox.warning(self, "Error", str(e))
 
+    @property
+    def name_index(self):
+        return self.note_model.name_index
+
     def handle_internal_link(self, target_name):
-        target_file = None
-        for f in self.all_files:
-            if os.path.splitext(f)[0].lower() == target_name.lower():
-                target_file = f
-                break
+        target_file = self.name_index.resolve(target_name)
         
         if target_file and self.current_vault:
             if self.check_save():
@@ -1165,13 +5355,15 @@ class ModelManagerApp(QMainWindow):
             with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
                 raw_text = f.read()
 
-            if ext == '.md':
-                content = self.parse_markdown_visual(raw_text)
+            # En un vault Markdown el .md se abre tal cual; si no, se convierte a HTML
+            markdown = ext == '.md' and self.note_extension() == ".md"
+            if ext == '.md' and not markdown:
+                content = parse_markdown_visual(raw_text)
             else:
                 content = raw_text
 
             filename = os.path.basename(filepath)
-            filename = os.path.splitext(filename)[0] + ".rtf"
+            filename = os.path.splitext(filename)[0] + self.note_extension()
             
             if not self.current_vault:
                 vault_path = select_vault_directory(self, self.current_vault)
@@ -1185,33 +5377,183 @@ class ModelManagerApp(QMainWindow):
             
             target_path = os.path.join(self.current_vault, filename)
             
-            if "{\\rtf" in content or "<html" in content or ext == '.md':
-                self.editor.setHtml(content)
-            else:
-                self.editor.setPlainText(content)
+            self.cache_current_document()
+            self.invalidate_document(target_path)
+            rich = is_rich_content(content) or ext == '.md'
+            self.load_generation += 1
+            if len(content) >= ASYNC_LOAD_BYTES:
+                self.show_blank_document()
+                self.editor.setReadOnly(True)
+                self.loading_path = target_path
+                self.load_progress.setRange(0, 0)
+                self.load_progress.show()
+                self.status_bar.showMessage(f"Importando: {filename}...")
+                worker = DocumentBuildWorker(self.load_generation, target_path, content, rich, markdown)
+                worker.signals.progress.connect(self.on_async_load_progress)
+                worker.signals.ready.connect(self.on_import_document_ready)
+                QThreadPool.globalInstance().start(worker)
+                return
+            self.finish_import(target_path, build_note_document(content, rich=rich, markdown=markdown))
+
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"No se pudo abrir:\n{e}")
+
+    def import_folder(self):
+        """Importa al vault todas las notas .txt/.md/.html de una carpeta y sus subcarpetas"""
+        if self.import_worker:
+            r = QMessageBox.question(self, "Importar", "Ya hay una importación en curso. ¿Cancelarla?")
+            if r == QMessageBox.StandardButton.Yes:
+                self.import_worker.cancel()
+            return
+        if not self.current_vault:
+            vault_path = select_vault_directory(self, self.current_vault)
+            if not vault_path: return
+            self.current_vault = vault_path
+            save_vault_config(self.current_vault)
+            save_vault_history(self.current_vault)
+            self.ensure_vault_directory()
+            if not self.current_vault: return
+        source = QFileDialog.getExistingDirectory(self, "Importar carpeta")
+        if not source: return
+        self.import_worker = FolderImportWorker(source, self.current_vault, self.note_extension() == ".md")
+        self.import_worker.signals.progress.connect(self.on_import_progress)
+        self.import_worker.signals.finished.connect(self.on_import_finished)
+        self.import_started = time.time()
+        self.scan_progress.setRange(0, 0)
+        self.scan_progress.setFormat("Importando...")
+        self.scan_progress.show()
+        QThreadPool.globalInstance().start(self.import_worker)
+
+    def on_import_progress(self, done, total):
+        self.scan_progress.setRange(0, max(total, 1))
+        self.scan_progress.setValue(done)
+        self.scan_progress.setFormat("Importando %v/%m")
+
+    def on_import_finished(self, report):
+        worker, self.import_worker = self.import_worker, None
+        self.scan_progress.hide()
+        # La lista y el índice se actualizan una sola vez, al final
+        if worker and worker.vault_path == self.current_vault and report["imported"]:
+            self.load_models()
+        state = "cancelada" if report["cancelled"] else "terminada"
+        self.status_bar.showMessage(f"Importación {state}: {len(report['imported'])} notas nuevas, "
+                                    f"{report['skipped']} ya importadas ({time.time() - self.import_started:.1f} s)", 8000)
+        if report["errors"]:
+            QMessageBox.warning(self, "Importar", "No se pudieron importar algunos archivos:\n\n" + "\n".join(report["errors"][:50]))
+
+    # --- FORMATO DE ALMACENAMIENTO DEL VAULT ---
+    def get_vault_options(self):
+        """Opciones del vault actual (se releen al cambiar de vault)"""
+        if self.vault_options is None or self.vault_options_path != self.current_vault:
+            self.vault_options_path = self.current_vault
+            self.vault_options = load_vault_options(self.current_vault) if self.current_vault else dict(DEFAULT_VAULT_OPTIONS)
+        return self.vault_options
+
+    def note_extension(self):
+        """Extensión de las notas nuevas según el formato elegido para el vault"""
+        return ".md" if self.get_vault_options().get("storage") == "markdown" else ".rtf"
+
+    def choose_storage_format(self):
+        """Elige si las notas nuevas del vault se guardan como HTML de Qt (.rtf) o como Markdown (.md)"""
+        if not self.current_vault:
+            QMessageBox.warning(self, "Formato", "Primero hay que elegir un vault.")
+            return
+        if self.convert_worker:
+            r = QMessageBox.question(self, "Formato", "Ya hay una conversión en curso. ¿Cancelarla?")
+            if r == QMessageBox.StandardButton.Yes:
+                self.convert_worker.cancel()
+            return
+        formats = ["HTML de Qt (.rtf)", "Markdown (.md)"]
+        options = self.get_vault_options()
+        current = 1 if options.get("storage") == "markdown" else 0
+        choice, ok = QInputDialog.getItem(self, "Formato de las notas",
+                                          "Las notas nuevas de este vault se guardan como:", formats, current, False)
+        if not ok: return
+        options["storage"] = "markdown" if choice == formats[1] else "html"
+        if not save_vault_options(self.current_vault, options):
+            QMessageBox.warning(self, "Formato", "No se pudieron guardar las opciones del vault.")
+            return
+        if options["storage"] != "markdown": return
+        pending = sum(1 for name in self.all_files if name.lower().endswith('.rtf'))
+        if not pending: return
+        r = QMessageBox.question(self, "Convertir a Markdown",
+                                 f"Hay {pending} notas .rtf en el vault. ¿Convertirlas también a Markdown?\n\n"
+                                 "Se pierden colores y tipografías; enlaces, listas, tablas y formato básico se conservan. "
+                                 "El HTML original queda en el historial de cada nota.",
+                                 QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if r == QMessageBox.StandardButton.Yes:
+            self.convert_vault_to_markdown()
+
+    def convert_vault_to_markdown(self):
+        if self.import_worker or not self.check_save(): return
+        self.note_writer.flush()
+        self.convert_worker = MarkdownConvertWorker(self.current_vault, self.version_store)
+        self.convert_worker.signals.progress.connect(self.on_convert_progress)
+        self.convert_worker.signals.finished.connect(self.on_convert_finished)
+        self.scan_progress.setRange(0, 0)
+        self.scan_progress.setFormat("Convirtiendo...")
+        self.scan_progress.show()
+        QThreadPool.globalInstance().start(self.convert_worker)
+
+    def on_convert_progress(self, done, total):
+        self.scan_progress.setRange(0, max(total, 1))
+        self.scan_progress.setValue(done)
+        self.scan_progress.setFormat("Convirtiendo a Markdown %v/%m")
+
+    def on_convert_finished(self, report):
+        worker, self.convert_worker = self.convert_worker, None
+        self.scan_progress.hide()
+        renamed = dict(report["converted"])
+        if worker and worker.vault_path == self.current_vault and renamed:
+            # Inicio, historial de navegación y nota abierta pasan al .md
+            if self.startup_file in renamed:
+                self.startup_file = renamed[self.startup_file]
+                save_vault_config(self.current_vault, self.startup_file)
+            moved = {os.path.join(self.current_vault, old): os.path.join(self.current_vault, new)
+                     for old, new in renamed.items()}
+            self.history = [moved.get(p, p) for p in self.history]
+            current = moved.get(self.current_file_path)
+            # Historial de versiones, frecencia, diario e índice siguen a la nota en su .md
+            for old, new in renamed.items():
+                self.rename_file_entry(old, new)
+            self.load_models()
+            if current:
+                self.is_navigating = True
+                self.load_file(current)
+                self.is_navigating = False
+        before, after = report["bytes_before"], report["bytes_after"]
+        ratio = f", {before / after:.1f}x más chicas" if after else ""
+        state = "cancelada" if report["cancelled"] else "terminada"
+        self.status_bar.showMessage(f"Conversión {state}: {len(renamed)} notas a Markdown "
+                                    f"({before // 1024} KB → {after // 1024} KB{ratio})", 8000)
+        if report["errors"]:
+            QMessageBox.warning(self, "Convertir a Markdown", "No se pudieron convertir algunas notas:\n\n" + "\n".join(report["errors"][:50]))
+
+    def on_import_document_ready(self, generation, path, stat, doc):
+        if generation != self.load_generation: return
+        self.loading_path = None
+        self.load_progress.hide()
+        self.editor.setReadOnly(False)
+        if doc is not None:
+            self.finish_import(path, doc)
+
+    def finish_import(self, target_path, doc):
+        """Muestra el documento importado y lo guarda en el vault"""
+        try:
+            filename = os.path.basename(target_path)
+            self.editor.set_note_document(doc)
+            self.set_read_mostly(False)
+            doc.setModified(True)
             
             self.editor.setFontPointSize(16)
             self.current_file_path = target_path
             self.save_model() 
-            self.load_models() 
             self.status_bar.showMessage(f"Abierto e Importado: {filename}")
-            
-            items = self.list_widget.findItems(filename, Qt.MatchFlag.MatchFixedString)
-            if items: self.list_widget.setCurrentItem(items[0])
+            self.select_in_list(filename, notify=False)
 
         except Exception as e:
             QMessageBox.critical(self, "Error", f"No se pudo abrir:\n{e}")
 
-    def parse_markdown_visual(self, text):
-        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-        text = re.sub(r'^# (.*?)$', r'<h1 style="font-size:24pt; color:#7aa2f7;">\1</h1>', text, flags=re.MULTILINE)
-        text = re.sub(r'^## (.*?)$', r'<h2 style="font-size:20pt; color:#7aa2f7;">\1</h2>', text, flags=re.MULTILINE)
-        text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
-        text = re.sub(r'\*(.*?)\*', r'<i>\1</i>', text)
-        text = re.sub(r'\[\[(.*?)\]\]', r'<a href="model://\1" style="color:#7dcfff;">\1</a>', text)
-        text = text.replace('\n', '<br>')
-        return text
-
     def create_new(self, name):
         if not self.current_vault:
             vault_path = select_vault_directory(self, self.current_vault)
@@ -1223,11 +5565,11 @@ class ModelManagerApp(QMainWindow):
             else:
                 return
         
-        filename = f"{name}.rtf"
+        filename = f"{name}{self.note_extension()}"
         path = os.path.join(self.current_vault, filename)
         try:
             with open(path, 'w', encoding='utf-8') as f: f.write("")
-            self.load_models()
+            self.add_file_entry(filename)
             self.load_file(path)
             self.status_bar.showMessage(f"Creado: {filename}")
         except Exception as e: QMessageBox.critical(self, "Error", str(e))
@@ -1238,53 +5580,311 @@ class ModelManagerApp(QMainWindow):
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No | QMessageBox.StandardButton.Cancel)
             if r == QMessageBox.StandardButton.Cancel: return False
             if r == QMessageBox.StandardButton.Yes: self.save_model()
+            else: self.discard_journal()
         return True
 
+    def open_vault_index(self):
+        """Abre el índice full-text del vault actual (si cambió de vault)"""
+        if self.vault_index and self.vault_index.vault_path == self.current_vault:
+            return self.vault_index
+        if self.vault_index:
+            self.vault_index.close()
+        self.vault_index = None
+        try:
+            self.vault_index = VaultIndex(self.current_vault)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error al abrir el índice del vault: {e}")
+        return self.vault_index
+
+    def update_index_entry(self, filename):
+        """Reindexa una nota concreta tras guardarla"""
+        stat = self.stat_entry(filename)
+        if stat is not None and filename in self.file_stats:
+            self.file_stats[filename] = stat
+        if not self.vault_index: return
+        try:
+            self.vault_index.update_file(filename)
+        except sqlite3.Error as e:
+            print(f"Error al actualizar el índice: {e}")
+
     def load_models(self):
-        """Carga los archivos del vault actual"""
+        """Carga los archivos del vault actual (el escaneo corre en segundo plano)"""
+        self.cancel_vault_scan()
+        self.note_model.reset()
+        self.file_stats = {}
+        self.file_ids = {}
+        self.watch_vault()
         if not self.current_vault or not os.path.exists(self.current_vault):
-            self.list_widget.clear()
-            self.all_files = []
-            self.content_cache = {}
             self.vault_label.setText("📁 Vault: No configurado")
             return
         
-        self.list_widget.clear()
-        self.all_files = []
-        self.content_cache = {}
+        self.vault_label.setText(f"📁 Vault: {self.current_vault}")
+        if not self.frecency or self.frecency.vault_path != self.current_vault:
+            self.open_frecency_store()
+        if not self.version_store or self.version_store.vault_path != self.current_vault:
+            self.open_version_store()
+        # Los diarios de una sesión anterior se revisan en cuanto arranca el bucle de eventos
+        self.journal_recovery_pending = True
+        QTimer.singleShot(0, self.recover_journals)
+        self.scan_generation += 1
+        self.scan_worker = VaultScanWorker(self.scan_generation, self.current_vault, self.open_vault_index())
+        self.scan_worker.signals.files_found.connect(self.on_scan_files_found)
+        self.scan_worker.signals.progress.connect(self.on_scan_progress)
+        self.scan_worker.signals.finished.connect(self.on_scan_finished)
+        self.scan_progress.setRange(0, 0)
+        self.scan_progress.setFormat("Escaneando...")
+        self.scan_progress.show()
+        QThreadPool.globalInstance().start(self.scan_worker)
+
+    def cancel_vault_scan(self):
+        """Cancela el escaneo en curso (p. ej. al cambiar de vault)"""
+        if self.scan_worker:
+            self.scan_worker.cancel()
+            self.scan_worker = None
+        if self.report_worker:
+            self.report_worker.cancel()
+            self.report_worker = None
+            self.report_generation += 1
+        self.cancel_vault_search()
+        self.scan_generation += 1
+        self.scan_progress.hide()
+
+    def on_scan_files_found(self, generation, batch):
+        if generation != self.scan_generation: return
+        # Las notas creadas desde la app durante el escaneo ya están en la lista
+        batch = [entry for entry in batch if entry[0] not in self.file_stats]
+        names = [entry[0] for entry in batch]
+        for name, mtime, size, file_id in batch:
+            self.file_stats[name] = (mtime, size)
+            self.file_ids[name] = file_id
+        self.note_model.append_names(names)
+        self.scan_progress.setFormat(f"Escaneando... {len(self.all_files)}")
+        if self.pending_selection and self.pending_selection[0] in names:
+            filename, notify = self.pending_selection
+            self.select_in_list(filename, notify)
+
+    def on_scan_progress(self, generation, done, total):
+        if generation != self.scan_generation: return
+        self.scan_progress.setRange(0, total)
+        self.scan_progress.setValue(done)
+        self.scan_progress.setFormat("Indexando %v/%m")
+
+    def on_scan_finished(self, generation, completed):
+        if generation != self.scan_generation: return
+        self.scan_worker = None
+        self.scan_progress.hide()
+        self.pending_selection = None
+        # Con un filtro activo, repetirlo ahora que el índice está al día
+        if self.search_bar.text():
+            self.run_filter()
+        self.status_bar.showMessage(f"{len(self.all_files)} archivos en el vault", 3000)
+        if completed and self.version_store:
+            try:
+                if self.version_store.needs_gc():
+                    QThreadPool.globalInstance().start(VersionGcWorker(self.version_store, self.settings["history_keep_days"]))
+            except sqlite3.Error as e:
+                print(f"Error al leer el historial: {e}")
+
+    # --- SEGUIMIENTO INCREMENTAL DEL VAULT ---
+    def watch_vault(self):
+        """Vigila la carpeta del vault actual y el archivo abierto"""
+        watched = self.fs_watcher.directories() + self.fs_watcher.files()
+        if watched:
+            self.fs_watcher.removePaths(watched)
+        if self.current_vault and os.path.isdir(self.current_vault):
+            self.fs_watcher.addPath(self.current_vault)
+        self.watch_current_file()
+
+    def watch_current_file(self):
+        files = self.fs_watcher.files()
+        if files:
+            self.fs_watcher.removePaths(files)
+        if self.current_file_path and os.path.exists(self.current_file_path):
+            self.fs_watcher.addPath(self.current_file_path)
+
+    def stat_entry(self, filename):
         try:
-            for f in os.listdir(self.current_vault):
-                if f.lower().endswith(('.rtf','.txt','.html')):
-                    path = os.path.join(self.current_vault, f)
-                    try:
-                        with open(path, 'r', encoding='utf-8', errors='ignore') as file:
-                            content = file.read().lower()
-                        self.content_cache[f] = content
-                    except: self.content_cache[f] = ""
-                    self.all_files.append(f)
-                    self.list_widget.addItem(f)
-            
-            # Actualizar etiqueta del vault
-            self.vault_label.setText(f"📁 Vault: {self.current_vault}")
-        except Exception as e:
-            print(f"Error al cargar modelos: {e}")
-            QMessageBox.warning(self, "Error", f"No se pudieron cargar los archivos del vault:\n{e}")
+            st = os.stat(os.path.join(self.current_vault, filename))
+            return (st.st_mtime, st.st_size)
+        except OSError:
+            return None
+
+    def on_vault_dir_changed(self, path):
+        # Agrupar ráfagas de eventos (sincronizadores, scripts) en una sola pasada
+        self.vault_change_timer.start()
+
+    def on_watched_file_changed(self, path):
+        self.vault_change_timer.start()
+
+    def apply_vault_changes(self):
+        """Compara el vault con el estado conocido y aplica solo las diferencias"""
+        if not self.current_vault or not os.path.isdir(self.current_vault): return
+        if self.scan_worker or self.import_worker or self.convert_worker:
+            # El escaneo completo en curso (o el del final de la importación) ya
+            # recogerá los cambios; reintentar luego
+            self.vault_change_timer.start()
+            return
+        ids = {}
+        try:
+            entries = scan_vault_entries(self.current_vault, ids)
+        except OSError as e:
+            print(f"Error al leer el vault: {e}")
+            return
+        added = {n: entries[n] for n in entries.keys() - self.file_stats.keys()}
+        removed = {n: self.file_stats[n] for n in self.file_stats.keys() - entries.keys()}
+        modified = [n for n in entries.keys() & self.file_stats.keys() if entries[n] != self.file_stats[n]
+                    and not self.note_writer.is_pending(os.path.join(self.current_vault, n))]
+        
+        # Un archivo que desaparece y otro que aparece con el mismo inodo es un renombrado.
+        # Solo donde no hay inodos (0) se compara mtime/tamaño, que pueden coincidir
+        # entre notas distintas (dos notas vacías creadas en el mismo instante)
+        by_id = {}
+        by_stat = {}
+        for name, stat in added.items():
+            if ids[name][1]:
+                by_id[ids[name]] = name
+            else:
+                by_stat.setdefault(stat, []).append(name)
+        for old_name, stat in list(removed.items()):
+            file_id = self.file_ids.get(old_name)
+            if file_id and file_id[1]:
+                new_name = by_id.pop(file_id, None)
+            else:
+                candidates = by_stat.get(stat)
+                new_name = candidates.pop() if candidates else None
+            if new_name:
+                del removed[old_name]
+                del added[new_name]
+                self.rename_file_entry(old_name, new_name)
+        for name in removed:
+            self.remove_file_entry(name)
+        for name in added:
+            self.add_file_entry(name)
+        for name in modified:
+            self.file_stats[name] = entries[name]
+            self.invalidate_document(os.path.join(self.current_vault, name))
+            self.update_index_entry(name)
+        
+        self.file_ids = ids
+        
+        if self.current_file_path and os.path.basename(self.current_file_path) in modified:
+            self.on_current_file_changed_externally()
+        self.watch_current_file()
+
+    def on_current_file_changed_externally(self):
+        if self.editor.document().isModified():
+            self.status_bar.showMessage("⚠ El archivo abierto cambió en disco (hay cambios sin guardar)", 5000)
+            return
+        self.is_navigating = True
+        self.load_file(self.current_file_path)
+        self.is_navigating = False
+        self.status_bar.showMessage("Archivo recargado: cambió en disco", 3000)
+
+    def add_file_entry(self, filename):
+        """Agrega (o actualiza) una sola nota en la lista, el estado y el índice"""
+        stat = self.stat_entry(filename)
+        if stat is None: return
+        is_new = filename not in self.file_stats
+        self.file_stats[filename] = stat
+        self.update_index_entry(filename)
+        if is_new:
+            self.note_model.append_names([filename])
+            if self.search_bar.text():
+                self.filter_timer.start()
+
+    def remove_file_entry(self, filename):
+        self.file_stats.pop(filename, None)
+        self.file_ids.pop(filename, None)
+        self.invalidate_document(os.path.join(self.current_vault, filename))
+        selection = self.list_view.selectionModel()
+        selection.blockSignals(True)
+        self.note_model.remove_name(filename)
+        selection.blockSignals(False)
+        if self.vault_index:
+            try:
+                self.vault_index.remove_file(filename)
+            except sqlite3.Error as e:
+                print(f"Error al actualizar el índice: {e}")
+
+    def rename_file_entry(self, old_name, new_name):
+        self.invalidate_document(os.path.join(self.current_vault, old_name))
+        stat = self.file_stats.pop(old_name, None) or self.stat_entry(new_name)
+        self.file_stats[new_name] = stat
+        if old_name in self.file_ids:
+            self.file_ids[new_name] = self.file_ids.pop(old_name)
+        self.note_model.rename(old_name, new_name)
+        if self.frecency:
+            self.frecency.rename(old_name, new_name)
+        if self.version_store:
+            try:
+                self.version_store.rename(old_name, new_name)
+            except sqlite3.Error as e:
+                print(f"Error al actualizar el historial: {e}")
+        if self.journal_note_path == os.path.join(self.current_vault, old_name):
+            self.journal_note_path = os.path.join(self.current_vault, new_name)
+        if self.vault_index:
+            try:
+                self.vault_index.rename_file(old_name, new_name)
+            except sqlite3.Error as e:
+                print(f"Error al actualizar el índice: {e}")
+        if self.current_file_path and os.path.basename(self.current_file_path) == old_name:
+            self.current_file_path = os.path.join(self.current_vault, new_name)
+
+    def select_in_list(self, filename, notify=True):
+        """Selecciona un archivo en la lista; si el escaneo aún no lo trajo, lo deja pendiente"""
+        row = self.note_model.row_of(filename)
+        index = self.note_proxy.mapFromSource(self.note_model.index(row)) if row >= 0 else QModelIndex()
+        if index.isValid():
+            self.pending_selection = None
+            selection = self.list_view.selectionModel()
+            selection.blockSignals(not notify)
+            self.list_view.setCurrentIndex(index)
+            selection.blockSignals(False)
+            # currentChanged estaba bloqueada: la vista no repinta la selección sola
+            self.list_view.viewport().update()
+            self.list_view.scrollTo(index)
+            return True
+        if self.scan_worker and row < 0:
+            self.pending_selection = (filename, notify)
+        return False
+
+    @property
+    def all_files(self):
+        return self.note_model.names
 
     def filter_models(self, txt):
-        txt = txt.lower()
-        self.list_widget.clear()
-        for f in self.all_files:
-            content = self.content_cache.get(f, "")
-            if txt in f.lower() or txt in content:
-                self.list_widget.addItem(f)
+        if not txt.strip():
+            # Quitar el filtro es inmediato: el proxy vuelve a ser identidad
+            self.filter_timer.stop()
+            self.filter_generation += 1
+            self.apply_filter(None)
+            return
+        self.filter_timer.start()
+
+    def run_filter(self):
+        txt = self.search_bar.text()
+        if not txt.strip(): return
+        self.filter_generation += 1
+        worker = NoteFilterWorker(self.filter_generation, txt, list(self.all_files), self.vault_index)
+        worker.signals.ready.connect(self.on_filter_ready)
+        QThreadPool.globalInstance().start(worker)
+
+    def on_filter_ready(self, generation, names):
+        if generation != self.filter_generation: return
+        self.apply_filter(names)
+
+    def apply_filter(self, names):
+        self.note_proxy.set_filter(names)
+        if self.current_file_path:
+            self.select_in_list(os.path.basename(self.current_file_path), notify=False)
 
     def on_model_selected(self, curr, prev):
-        if not curr: return
+        if not curr.isValid(): return
         if not self.current_vault:
             return
         
-        path = os.path.join(self.current_vault, curr.text())
-        if path == self.current_file_path: return
+        path = os.path.join(self.current_vault, curr.data())
+        if path == self.current_file_path or path == self.loading_path: return
         if self.check_save(): self.load_file(path)
 
     def load_file(self, path):
@@ -1293,14 +5893,82 @@ class ModelManagerApp(QMainWindow):
             return
         
         try:
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            if "{\\rtf" in content or "<html" in content: self.editor.setHtml(content)
-            else: self.editor.setPlainText(content)
+            st = os.stat(path)
+            stat = (st.st_mtime, st.st_size)
+            # El documento que se deja queda en la caché; si el destino está en ella y
+            # no cambió en disco, se muestra sin releer ni parsear
+            self.cache_current_document()
+            self.load_generation += 1
+            self.loading_path = None
+            self.load_progress.hide()
+            doc = self.document_cache.take(path, stat) or self.prefetch_cache.take(path, stat)
+            if doc is None:
+                if stat[1] >= ASYNC_LOAD_BYTES:
+                    self.start_async_load(path)
+                    return
+                with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                    content = f.read()
+                doc = build_note_document(content, markdown=is_markdown_note(path))
+            self.show_note_document(path, stat, doc)
+        except Exception as e: 
+            QMessageBox.critical(self, "Error", f"No se pudo cargar el archivo:\n{e}")
+
+    def start_async_load(self, path):
+        """Parsea una nota grande en segundo plano; mientras, el editor queda vacío y bloqueado"""
+        self.show_blank_document()
+        self.editor.setReadOnly(True)
+        self.loading_path = path
+        self.load_progress.setRange(0, 0)
+        self.load_progress.show()
+        self.status_bar.showMessage(f"Cargando: {os.path.basename(path)}...")
+        worker = DocumentBuildWorker(self.load_generation, path)
+        worker.signals.progress.connect(self.on_async_load_progress)
+        worker.signals.ready.connect(self.on_async_load_ready)
+        QThreadPool.globalInstance().start(worker)
+
+    def on_async_load_progress(self, generation, done, total):
+        if generation != self.load_generation: return
+        self.load_progress.setRange(0, total)
+        self.load_progress.setValue(done)
+
+    def on_async_load_ready(self, generation, path, stat, doc):
+        if generation != self.load_generation:
+            # El usuario ya se fue a otra nota: el trabajo no se tira
+            if doc is not None:
+                self.document_cache.put(path, stat, doc)
+            return
+        self.loading_path = None
+        self.load_progress.hide()
+        if doc is None:
+            self.editor.setReadOnly(False)
+            QMessageBox.critical(self, "Error", f"No se pudo cargar el archivo:\n{path}")
+            return
+        self.show_note_document(path, stat, doc)
+
+    def is_large_note(self, stat):
+        return stat is not None and stat[1] >= self.settings["large_note_mb"] * 1024 * 1024
+
+    def set_read_mostly(self, enabled):
+        """Modo ligero para notas enormes: solo lectura y sin resaltado hasta pulsar EDITAR"""
+        self.editor.setReadOnly(enabled)
+        self.btn_edit_large.setVisible(enabled)
+        if not enabled:
+            self.editor.enable_highlighting()
+
+    def show_note_document(self, path, stat, doc):
+        """Muestra un documento ya construido como la nota actual"""
+        try:
+            large = self.is_large_note(stat)
+            self.editor.set_note_document(doc, highlight=not large)
+            self.set_read_mostly(large)
             
             self.current_file_path = path
+            self.current_doc_stat = stat
             self.editor.document().setModified(False)
-            self.status_bar.showMessage(f"Archivo: {os.path.basename(path)}")
+            if large:
+                self.status_bar.showMessage(f"Archivo: {os.path.basename(path)} (nota grande: solo lectura)")
+            else:
+                self.status_bar.showMessage(f"Archivo: {os.path.basename(path)}")
             
             self.editor.setFontPointSize(16)
             self.size_box.blockSignals(True)
@@ -1308,17 +5976,99 @@ class ModelManagerApp(QMainWindow):
             self.size_box.blockSignals(False)
             
             self.update_stats()
+            self.refresh_links_panel()
             
-            fn = os.path.basename(path)
-            items = self.list_widget.findItems(fn, Qt.MatchFlag.MatchFixedString)
-            if items:
-                self.list_widget.blockSignals(True)
-                self.list_widget.setCurrentItem(items[0])
-                self.list_widget.blockSignals(False)
+            self.select_in_list(os.path.basename(path), notify=False)
+            self.watch_current_file()
             self.add_to_history(path)
+            self.schedule_prefetch()
+            self.reveal_pending_match(path)
         except Exception as e: 
             QMessageBox.critical(self, "Error", f"No se pudo cargar el archivo:\n{e}")
 
+    def invalidate_document(self, path):
+        """Descarta las copias en caché (vistas y precargadas) de una nota"""
+        self.document_cache.invalidate(path)
+        self.prefetch_cache.invalidate(path)
+
+    # --- PRECARGA ESPECULATIVA DE ENLACES ---
+    def apply_prefetch_settings(self):
+        self.prefetch_cache.max_chars = self.settings["prefetch_max_mb"] * 1024 * 1024 // DOCUMENT_BYTES_PER_CHAR
+        self.prefetch_cache.max_entries = 200
+        if self.settings["prefetch_depth"] <= 0:
+            self.prefetch_cache.clear()
+
+    def show_preferences(self):
+        dlg = PreferencesDialog(self, self.settings)
+        if dlg.exec():
+            self.settings = dlg.settings
+            save_app_settings(self.settings)
+            self.apply_prefetch_settings()
+
+    def prefetch_targets(self, filename):
+        """Notas enlazadas desde filename hasta la profundidad configurada (BFS)"""
+        depth = self.settings["prefetch_depth"]
+        if depth <= 0 or not self.vault_index: return []
+        seen = {filename}
+        frontier = [filename]
+        targets = []
+        try:
+            for _ in range(depth):
+                next_frontier = []
+                for name in frontier:
+                    for target in self.vault_index.outgoing_links(name):
+                        target_file = self.name_index.resolve(target)
+                        if target_file and target_file not in seen:
+                            seen.add(target_file)
+                            targets.append(target_file)
+                            next_frontier.append(target_file)
+                frontier = next_frontier
+        except sqlite3.Error as e:
+            print(f"Error al consultar enlaces: {e}")
+        return targets
+
+    def schedule_prefetch(self):
+        """Lee y parsea en segundo plano las notas a las que enlaza la nota actual"""
+        if not self.current_file_path or not self.current_vault: return
+        self.prefetch_generation += 1
+        self.prefetch_pool.clear()
+        self.prefetch_pending.clear()
+        for target_file in self.prefetch_targets(os.path.basename(self.current_file_path)):
+            path = os.path.join(self.current_vault, target_file)
+            stat = self.file_stats.get(target_file)
+            if self.document_cache.has_valid(path, stat) or self.prefetch_cache.has_valid(path, stat):
+                continue
+            worker = DocumentBuildWorker(self.prefetch_generation, path)
+            worker.signals.ready.connect(self.on_prefetch_ready)
+            self.prefetch_pending.add(path)
+            self.prefetch_pool.start(worker)
+
+    def on_prefetch_ready(self, generation, path, stat, doc):
+        self.prefetch_pending.discard(path)
+        if doc is None or generation != self.prefetch_generation: return
+        if path == self.current_file_path: return
+        if os.path.dirname(path) != self.current_vault: return
+        # Si el archivo cambió mientras se parseaba, el documento ya no sirve
+        if self.file_stats.get(os.path.basename(path)) != stat: return
+        self.prefetch_cache.put(path, stat, doc)
+
+    def cache_current_document(self):
+        """Guarda en la caché el documento visible si está sin cambios pendientes"""
+        doc = self.editor.note_document
+        if self.current_file_path and self.current_doc_stat and doc is not None and not doc.isModified():
+            self.document_cache.put(self.current_file_path, self.current_doc_stat, doc)
+
+    def show_blank_document(self):
+        """Cambia a un documento vacío (nuevo / eliminado / cambio de vault)"""
+        # Una carga en segundo plano pendiente deja de tener destino
+        self.load_generation += 1
+        self.loading_path = None
+        self.load_progress.hide()
+        self.editor.set_note_document(build_note_document())
+        self.set_read_mostly(False)
+        self.current_file_path = None
+        self.current_doc_stat = None
+
     def save_model(self):
         """Método mejorado para guardar con mejor manejo de errores"""
         if not self.current_vault:
@@ -1332,7 +6082,7 @@ class ModelManagerApp(QMainWindow):
                 return False
         
         if self.current_file_path:
-            content = self.editor.toHtml()
+            content = serialize_note_document(self.editor.document(), self.current_file_path)
             try:
                 # Validar que el contenido no esté vacío
                 if not content.strip():
@@ -1341,10 +6091,13 @@ class ModelManagerApp(QMainWindow):
                     if reply == QMessageBox.StandardButton.No:
                         return False
                 
-                with open(self.current_file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
+                # El diario queda al día antes de encolar el guardado: si este falla, sigue valiendo
+                self.flush_journal()
+                self.journal_save_digests[self.current_file_path] = hashlib.sha1(content.encode('utf-8')).hexdigest()
+                # La escritura (temporal + fsync + rename) ocurre en segundo plano
+                self.note_writer.submit(self.current_file_path, content)
                 self.editor.document().setModified(False)
-                self.status_bar.showMessage(f"Guardado: {os.path.basename(self.current_file_path)}", 3000)
+                self.status_bar.showMessage(f"Guardando: {os.path.basename(self.current_file_path)}...")
                 
                 # Actualizar el título de la ventana para mostrar estado guardado
                 current_title = self.windowTitle()
@@ -1360,9 +6113,9 @@ class ModelManagerApp(QMainWindow):
         else:
             name, ok = QInputDialog.getText(self, "Guardar como", "Nombre del archivo:")
             if ok and name.strip():
-                # Asegurar que tenga extensión .rtf
-                if not name.lower().endswith('.rtf'):
-                    name += ".rtf"
+                # Asegurar que tenga la extensión de las notas del vault
+                if not name.lower().endswith(NOTE_EXTENSIONS):
+                    name += self.note_extension()
                 
                 # Validar nombre de archivo
                 if any(char in name for char in ['/', '\\', ':', '*', '?', '"', '<', '>', '|']):
@@ -1385,11 +6138,212 @@ class ModelManagerApp(QMainWindow):
         
         return False
 
+    # --- HISTORIAL DE VERSIONES ---
+    def open_version_store(self):
+        if self.version_store:
+            self.version_store.close()
+        try:
+            self.version_store = VersionStore(self.current_vault)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error al abrir el historial: {e}")
+            self.version_store = None
+        self.note_writer.versions = self.version_store
+
+    def show_version_history(self, filename=None):
+        if not filename:
+            if not self.current_file_path: return
+            filename = os.path.basename(self.current_file_path)
+        if not self.version_store: return
+        VersionHistoryDialog(self, self.version_store, filename).exec()
+
+    def show_deleted_notes(self):
+        """Elige una nota que ya no está en el vault pero tiene historial"""
+        if not self.version_store: return
+        try:
+            deleted = [name for name in self.version_store.names() if name not in self.file_stats]
+        except sqlite3.Error as e:
+            print(f"Error al leer el historial: {e}")
+            return
+        if not deleted:
+            QMessageBox.information(self, "Recuperar", "No hay notas eliminadas en el historial.")
+            return
+        name, ok = QInputDialog.getItem(self, "Recuperar nota eliminada", "Nota:", deleted, 0, False)
+        if ok and name:
+            self.show_version_history(name)
+
+    def restore_version(self, filename, content):
+        """Vuelve una nota al contenido de una versión (que queda como versión nueva)"""
+        path = os.path.join(self.current_vault, filename)
+        if path == self.current_file_path:
+            if not self.check_save(): return False
+            doc = build_note_document(content, markdown=is_markdown_note(path))
+            self.editor.set_note_document(doc)
+            self.set_read_mostly(False)
+            doc.setModified(True)
+            self.save_model()
+        else:
+            self.invalidate_document(path)
+            self.note_writer.submit(path, content)
+        self.status_bar.showMessage(f"Versión restaurada: {filename}", 3000)
+        return True
+
+    # --- AUTOGUARDADO Y DIARIO DE RECUPERACIÓN ---
+    def get_journal(self, vault_path):
+        if not self.journal or self.journal.vault_path != vault_path:
+            self.journal = NoteJournal(vault_path)
+        return self.journal
+
+    def on_document_swapped(self, doc):
+        # Lo pendiente de la nota que se deja va a su diario antes de cambiar
+        self.flush_journal()
+        self.journal_timer.stop()
+        self.autosave_timer.stop()
+        self.journal_note_path = None
+        self.journal_open = False
+        self.journal_base = None
+        self.journal_recorder.attach(doc)
+        self.doc_stats.attach(doc)
+        self.watch_modification(doc)
+        self.update_window_title(doc.isModified())
+        self.refresh_link_highlighting()
+        self.stats_timer.start()
+        if self.find_dialog:
+            self.find_dialog.schedule_search()
+
+    def on_journal_change(self):
+        if self.journal_note_path is None:
+            if not self.current_file_path: return
+            self.journal_note_path = self.current_file_path
+        if not self.journal_timer.isActive():
+            self.journal_timer.start()
+        if self.settings["autosave_seconds"] > 0:
+            self.autosave_timer.start(self.settings["autosave_seconds"] * 1000)
+
+    def flush_journal(self):
+        """Vuelca al diario los cambios registrados desde el último volcado"""
+        recorder = self.journal_recorder
+        path = self.journal_note_path
+        if not path or not recorder.has_changes(): return
+        if self.journal_recovery_pending or path in self.journal_save_digests:
+            # Esperar a revisar los diarios viejos / a que termine el guardado en curso
+            self.journal_timer.start()
+            return
+        journal = self.get_journal(os.path.dirname(path))
+        if not recorder.doc.isModified():
+            # Se deshizo hasta el estado guardado: no hay nada que recuperar
+            recorder.reset()
+            journal.discard(os.path.basename(path))
+            self.journal_open = False
+            return
+        try:
+            base = None
+            if not self.journal_open:
+                base = self.journal_base
+                if base is None:
+                    st = os.stat(path)
+                    if path == self.current_file_path and (st.st_mtime, st.st_size) != self.current_doc_stat:
+                        # El archivo cambió en disco: los deltas ya no se aplicarían sobre él
+                        recorder.reset()
+                        return
+                    base = file_sha1(path)
+            journal.append(os.path.basename(path), recorder.take(), base)
+            self.journal_open = True
+        except OSError as e:
+            print(f"Error al escribir el diario: {e}")
+
+    def discard_journal(self):
+        """Descarta los cambios sin guardar registrados de la nota visible"""
+        self.journal_timer.stop()
+        self.autosave_timer.stop()
+        self.journal_recorder.reset()
+        if self.journal_note_path:
+            self.get_journal(os.path.dirname(self.journal_note_path)).discard(os.path.basename(self.journal_note_path))
+        self.journal_open = False
+
+    def autosave(self):
+        """Compacta el diario en el archivo real cuando el usuario deja de escribir"""
+        if not self.current_file_path or self.loading_path or self.editor.isReadOnly(): return
+        if self.current_file_path != self.journal_note_path: return
+        if self.editor.document().isModified():
+            self.save_model()
+
+    def recover_journals(self):
+        """Ofrece recuperar los cambios sin guardar de una sesión que terminó mal"""
+        self.journal_recovery_pending = False
+        if not self.current_vault: return
+        journal = self.get_journal(self.current_vault)
+        recovered = []
+        for filename in journal.pending():
+            path = os.path.join(self.current_vault, filename)
+            if path == self.journal_note_path and self.journal_open: continue
+            try:
+                base, entries = journal.read(filename)
+                if not os.path.exists(path) or file_sha1(path) != base:
+                    raise ValueError("la nota cambió desde que se registraron los cambios")
+                with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                    doc = build_note_document(f.read(), markdown=is_markdown_note(path))
+                replay_journal(doc, entries)
+                recovered.append((path, serialize_note_document(doc, path)))
+            except (OSError, ValueError, KeyError, IndexError) as e:
+                print(f"Error al recuperar {filename}: {e}")
+                journal.discard(filename)
+        if not recovered: return
+        names = [os.path.basename(path) for path, _ in recovered]
+        listing = "\n".join(names[:10]) + ("\n..." if len(names) > 10 else "")
+        reply = QMessageBox.question(self, "Recuperar cambios",
+                                     f"Hay cambios sin guardar de {len(names)} nota(s) de la sesión anterior:\n\n"
+                                     f"{listing}\n\n¿Recuperarlos?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        for path, content in recovered:
+            if reply == QMessageBox.StandardButton.Yes:
+                # El diario se borra cuando el guardado confirma que el archivo está al día
+                self.journal_save_digests[path] = hashlib.sha1(content.encode('utf-8')).hexdigest()
+                self.invalidate_document(path)
+                self.note_writer.submit(path, content)
+            else:
+                journal.discard(os.path.basename(path))
+        if reply == QMessageBox.StandardButton.Yes:
+            self.status_bar.showMessage(f"Recuperados cambios de {len(names)} nota(s)", 5000)
+
+    def on_note_saved(self, path, stat, written, digest):
+        if self.journal_save_digests.get(path) == digest:
+            # El archivo ya contiene todo lo registrado: el diario empieza de nuevo sobre él
+            del self.journal_save_digests[path]
+            NoteJournal(os.path.dirname(path)).discard(os.path.basename(path))
+            if path == self.journal_note_path:
+                self.journal_open = False
+                self.journal_base = digest
+                if self.journal_recorder.has_changes():
+                    self.journal_timer.start()
+        if os.path.dirname(path) != self.current_vault: return
+        filename = os.path.basename(path)
+        if path == self.current_file_path:
+            self.current_doc_stat = stat
+        if written:
+            self.add_file_entry(filename)
+            if path == self.current_file_path:
+                self.refresh_links_panel()
+                self.select_in_list(filename, notify=False)
+            self.status_bar.showMessage(f"Guardado: {filename}", 3000)
+        else:
+            self.status_bar.showMessage(f"Sin cambios: {filename}", 3000)
+
+    def on_note_save_failed(self, path, error):
+        self.journal_save_digests.pop(path, None)
+        if path == self.journal_note_path and self.journal_recorder.has_changes():
+            self.journal_timer.start()
+        if path == self.current_file_path:
+            self.editor.document().setModified(True)
+        QMessageBox.critical(self, "Error de Guardado", 
+                           f"No se pudo guardar el archivo:\n\n{error}\n\n"
+                           f"Ruta: {path}")
+
     def new_model(self):
         if self.check_save():
-            self.editor.clear()
-            self.current_file_path = None
-            self.list_widget.clearSelection()
+            self.cache_current_document()
+            self.show_blank_document()
+            self.refresh_links_panel()
+            self.list_view.clearSelection()
             self.editor.setFontPointSize(16)
             self.setWindowTitle(f"{APP_NAME} - Nuevo documento")
             return True
@@ -1401,10 +6355,20 @@ class ModelManagerApp(QMainWindow):
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
             try:
+                filename = os.path.basename(self.current_file_path)
+                self.discard_journal()
+                self.note_writer.discard(self.current_file_path)
+                self.note_writer.flush()
+                # Última copia en el historial: se puede recuperar desde ARCHIVO
+                if self.version_store:
+                    with open(self.current_file_path, 'rb') as f:
+                        self.version_store.record(filename, f.read(), kind="delete")
                 os.remove(self.current_file_path)
-                self.current_file_path = None
-                self.editor.clear()
-                self.load_models()
+                self.invalidate_document(self.current_file_path)
+                self.show_blank_document()
+                self.remove_file_entry(filename)
+                self.watch_current_file()
+                self.refresh_links_panel()
                 self.status_bar.showMessage("Archivo eliminado.")
                 self.setWindowTitle(APP_NAME)
             except Exception as e:
@@ -1459,19 +6423,104 @@ class ModelManagerApp(QMainWindow):
         if c.hasSelection():
             self.find_dialog.txt_find.setText(c.selectedText())
 
+    def show_vault_replace(self):
+        if not self.current_vault: return
+        if not self.vault_replace_dialog: self.vault_replace_dialog = VaultReplaceDialog(self)
+        c = self.editor.textCursor()
+        if c.hasSelection():
+            self.vault_replace_dialog.txt_find.setText(c.selectedText())
+        self.vault_replace_dialog.show()
+        self.vault_replace_dialog.raise_()
+
+    def undo_vault_replace(self):
+        """Restaura las notas del último reemplazo en el vault que no se haya deshecho"""
+        if not self.current_vault: return
+        batch = latest_replace_batch(self.current_vault)
+        if batch is None:
+            QMessageBox.information(self, "Deshacer reemplazo", "No hay reemplazos que deshacer.")
+            return
+        batch_dir, manifest = batch
+        r = QMessageBox.question(self, "Deshacer reemplazo",
+                                 f"¿Deshacer el reemplazo de '{manifest['find']}' por '{manifest['replace']}' "
+                                 f"({len(manifest['files'])} notas)?")
+        if r != QMessageBox.StandardButton.Yes or not self.check_save(): return
+        self.note_writer.flush()
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            restored, conflicts = undo_replace_batch(self.current_vault, batch_dir, manifest)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"No se pudo deshacer el reemplazo:\n{e}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.on_notes_rewritten(restored)
+        self.status_bar.showMessage(f"Reemplazo deshecho: {len(restored)} notas restauradas", 5000)
+        if conflicts:
+            QMessageBox.warning(self, "Deshacer reemplazo",
+                                "Estas notas se editaron después del reemplazo y no se restauraron:\n\n" + "\n".join(conflicts[:50]))
+
+    def on_notes_rewritten(self, names):
+        """Refresca cachés, índice y la nota abierta tras modificar notas en disco desde la app"""
+        for name in names:
+            self.invalidate_document(os.path.join(self.current_vault, name))
+            self.update_index_entry(name)
+        if self.current_file_path and os.path.basename(self.current_file_path) in names:
+            self.on_current_file_changed_externally()
+        self.watch_current_file()
+        self.refresh_links_panel()
+
+    def refresh_link_highlighting(self):
+        """Actualiza el color de los enlaces internos del documento visible tras crear/borrar notas"""
+        highlighter = getattr(self.editor.note_document, 'link_highlighter', None)
+        if highlighter is not None:
+            highlighter.refresh_targets()
+
+    def watch_modification(self, doc):
+        """El título de la ventana sigue a modificationChanged del documento visible"""
+        if getattr(doc, 'title_watched', False): return
+        doc.title_watched = True
+        doc.modificationChanged.connect(lambda modified, d=doc: self.editor.document() is d and self.update_window_title(modified))
+
+    def on_stats_change(self):
+        if not self.stats_timer.isActive():
+            self.stats_timer.start()
+
     def update_stats(self):
-        t = self.editor.toPlainText()
-        self.lbl_stats.setText(f"LÍNEAS: {self.editor.document().blockCount()} | CARACTERES: {len(t)}")
-        
+        stats = self.doc_stats
+        self.lbl_stats.setText(f"LÍNEAS: {stats.lines} | PALABRAS: {stats.words} | "
+                               f"CARACTERES: {stats.characters} | LECTURA: ~{stats.reading_minutes} min")
+
+    def update_window_title(self, modified):
         # Actualizar título de la ventana si hay cambios sin guardar
-        if self.editor.document().isModified():
+        if modified:
             if "*" not in self.windowTitle():
                 self.setWindowTitle(f"*{self.windowTitle()}")
         else:
             if self.windowTitle().startswith("*"):
                 self.setWindowTitle(self.windowTitle()[1:])
 
+    def closeEvent(self, event):
+        # Detener los trabajos en segundo plano antes de cerrar
+        self.cancel_vault_scan()
+        if self.import_worker:
+            self.import_worker.cancel()
+        if self.convert_worker:
+            self.convert_worker.cancel()
+        if self.frecency:
+            self.frecency.save()
+        self.prefetch_pool.clear()
+        self.prefetch_pool.waitForDone(3000)
+        # Los guardados en cola deben llegar a disco antes de salir, y lo no guardado al diario
+        self.note_writer.flush()
+        QApplication.processEvents()
+        self.journal_recovery_pending = False
+        self.flush_journal()
+        QThreadPool.globalInstance().waitForDone(3000)
+        super().closeEvent(event)
+
 if __name__ == "__main__":
+    # Necesario para los procesos de análisis en el ejecutable empaquetado
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
     app.setStyleSheet(TOKYO_STYLESHEET)
@@ -0,0 +1,38 @@
+import main
+
+def large_note_html():
+    """HTML de Qt de una nota con encabezados, listas y tablas, varias veces LOAD_CHUNK_CHARS"""
+    parts = []
+    for i in range(600):
+        parts.append(f'<h2>Tema {i}</h2><p>Texto <b>negrita</b> <span style="color:#f7768e">rojo</span> '
+                     f'<a href="model://Nota{i}">Nota{i}</a></p><ul><li>uno</li><li>dos</li></ul>')
+        if i % 50 == 0:
+            parts.append('<table border="1"><tr><td>1</td><td>2</td></tr></table>')
+    source = main.build_note_document(
+        '<html><body style="font-family:Arial; font-size:11pt;">' + ''.join(parts) + '</body></html>', rich=True)
+    return source.toHtml()
+
+def test_chunked_load_is_not_undoable(qapp):
+    content = large_note_html()
+    doc = main.build_note_document(content, rich=True, chunk_chars=main.LOAD_CHUNK_CHARS)
+    assert len(main.split_html_body(content, main.LOAD_CHUNK_CHARS)[1]) > 1
+    assert not doc.isUndoAvailable()
+    assert not doc.isModified()
+
+def test_chunked_load_matches_single_parse(qapp):
+    content = large_note_html()
+    chunked = main.build_note_document(content, rich=True, chunk_chars=main.LOAD_CHUNK_CHARS)
+    single = main.build_note_document(content, rich=True)
+    assert chunked.toHtml() == single.toHtml()
+
+def test_build_worker_always_reports(qapp, tmp_path, monkeypatch):
+    path = tmp_path / "nota.rtf"
+    path.write_text("<html><body><p>hola</p></body></html>", encoding="utf-8")
+    def fail(*args, **kwargs):
+        raise RuntimeError("sin memoria")
+    monkeypatch.setattr(main, "build_note_document", fail)
+    worker = main.DocumentBuildWorker(7, str(path))
+    ready = []
+    worker.signals.ready.connect(lambda generation, p, stat, doc: ready.append((generation, p, doc)))
+    worker.run()
+    assert ready == [(7, str(path), None)]
@@ -0,0 +1,55 @@
+import random
+import re
+
+import pytest
+
+import main
+
+def utf16(text):
+    return len(text.encode("utf-16-le")) // 2
+
+def spans(pattern, text):
+    return [(start, end) for start, end, _ in main.find_in_block(re.compile(pattern), text)]
+
+def test_find_in_block_uses_utf16_offsets():
+    assert spans("b", "abc") == [(1, 2)]
+    assert spans("b", "a😀b") == [(3, 4)]
+    assert spans("😀b", "a😀b") == [(1, 4)]
+    assert spans("b😀+c", "😀b😀😀c b😀c") == [(2, 8), (9, 13)]
+    assert spans("x*", "😀x") == [(2, 3)]  # las coincidencias vacías se saltan
+
+def test_find_in_block_matches_utf16_lengths():
+    rng = random.Random(7)
+    alphabet = "ab😀🎉é\n"
+    for _ in range(300):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        for pattern in ("a", "😀", "b[😀🎉]*a", "é.", "[^a]+"):
+            expected = [(utf16(text[:m.start()]), utf16(text[:m.end()]))
+                        for m in re.finditer(pattern, text) if m.start() != m.end()]
+            assert spans(pattern, text) == expected
+
+TEMPLATES = [
+    "x", r"\1-\2", r"\2\1", r"\g<0>!", r"\g<word>/\g<2>", r"<\g<1>>", r"\n\t\\", r"\-\.", r"a\\1",
+    r"\0", r"\01", r"\101", r"\12", r"\128", "ñ😀\\1",
+]
+
+@pytest.mark.parametrize("template", TEMPLATES)
+def test_compile_replacement_matches_re_sub(template):
+    pattern = re.compile(r"(?P<word>\w+)(\d)?|(-)")
+    for text in ("abc1 de-f", "😀 x9 - ", ""):
+        try:
+            expected = pattern.sub(template, text)
+        except re.error:
+            # compile_replacement avisa al preparar la plantilla, no al reemplazar
+            with pytest.raises(re.error):
+                main.compile_replacement(template, pattern)
+            continue
+        assert pattern.sub(main.compile_replacement(template, pattern), text) == expected
+
+@pytest.mark.parametrize("template", [r"\3", r"\g<nope>", r"\g<9>", r"\q", r"\400", "\\"])
+def test_compile_replacement_rejects_invalid_templates(template):
+    pattern = re.compile(r"(a)(b)")
+    with pytest.raises((re.error, IndexError)):  # re da IndexError con nombres desconocidos
+        pattern.sub(template, "ab")
+    with pytest.raises(re.error):
+        main.compile_replacement(template, pattern)
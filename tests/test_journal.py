@@ -0,0 +1,98 @@
+import pytest
+from PyQt6.QtGui import QFont, QTextCharFormat, QTextCursor
+
+import main
+
+BASE = ('<html><body><h2>Título</h2><p>Hola <b>mundo</b> y texto normal.</p>'
+        '<ul><li>uno</li><li>dos</li></ul><p>Fin</p></body></html>')
+
+def base_document():
+    return main.build_note_document(BASE, rich=True)
+
+def record(edit):
+    """Aplica edit(doc, cursor) registrando el diario en dos volcados; (entradas, html final)"""
+    doc = base_document()
+    doc.documentLayout()  # sin layout (sin editor) el documento no emite contentsChange
+    recorder = main.JournalRecorder()
+    recorder.attach(doc)
+    cursor = QTextCursor(doc)
+    entries = []
+    edit(doc, cursor, lambda: entries.extend(recorder.take()))
+    entries.extend(recorder.take())
+    recorder.detach()
+    return entries, doc.toHtml()
+
+def replayed(entries):
+    doc = base_document()
+    main.replay_journal(doc, entries)
+    return doc.toHtml()
+
+def type_text(cursor, position, text):
+    cursor.setPosition(position)
+    for char in text:
+        cursor.insertText(char)
+
+def test_typing_is_recorded_as_deltas(qapp):
+    def edit(doc, cursor, flush):
+        type_text(cursor, 3, "xyz")
+        flush()
+        type_text(cursor, doc.find("mundo").selectionStart(), "gran ")
+    entries, expected = record(edit)
+    assert entries and all("html" not in e for e in entries)
+    assert replayed(entries) == expected
+
+def test_deletion_is_recorded_as_deltas(qapp):
+    def edit(doc, cursor, flush):
+        cursor.setPosition(doc.find("texto").selectionStart())
+        for _ in range(3):
+            cursor.deleteChar()
+        flush()
+        cursor.deletePreviousChar()
+    entries, expected = record(edit)
+    assert [e["t"] for e in entries] == ["", "", "", ""]
+    assert replayed(entries) == expected
+
+def test_enter_is_recorded_as_a_delta(qapp):
+    def edit(doc, cursor, flush):
+        cursor.setPosition(doc.find("texto").selectionStart())
+        cursor.insertBlock()
+        type_text(cursor, cursor.position(), "nuevo")
+    entries, expected = record(edit)
+    assert all("html" not in e for e in entries)
+    assert replayed(entries) == expected
+
+def test_enter_in_a_list_takes_a_checkpoint(qapp):
+    def edit(doc, cursor, flush):
+        cursor.setPosition(doc.find("dos").selectionEnd())
+        cursor.insertBlock()
+        type_text(cursor, cursor.position(), "tres")
+    entries, expected = record(edit)
+    assert len(entries) == 1 and "html" in entries[0]
+    assert replayed(entries) == expected
+
+def test_format_change_takes_a_checkpoint(qapp):
+    def edit(doc, cursor, flush):
+        type_text(cursor, 2, "ab")
+        flush()
+        found = doc.find("normal")
+        bold = QTextCharFormat()
+        bold.setFontWeight(QFont.Weight.Bold)
+        found.mergeCharFormat(bold)
+        type_text(cursor, 1, "c")
+    entries, expected = record(edit)
+    assert "html" not in entries[0] and "html" in entries[-1]
+    assert replayed(entries) == expected
+
+def test_joining_paragraphs_takes_a_checkpoint(qapp):
+    def edit(doc, cursor, flush):
+        cursor.setPosition(doc.find("Fin").selectionStart())
+        cursor.deletePreviousChar()
+    entries, expected = record(edit)
+    assert len(entries) == 1 and "html" in entries[0]
+    assert replayed(entries) == expected
+
+def test_replay_rejects_a_journal_for_another_document(qapp):
+    entries, _ = record(lambda doc, cursor, flush: type_text(cursor, 3, "xyz"))
+    doc = main.build_note_document("<html><body><p>otra nota más larga</p></body></html>", rich=True)
+    with pytest.raises(ValueError):
+        main.replay_journal(doc, entries)
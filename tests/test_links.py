@@ -0,0 +1,51 @@
+import main
+
+MARKDOWN_NOTE = "Ver [Mi Nota](<model://Mi Nota>), [Otra](model://Otra) y [Cod](model://Con%20Espacio) ##tag##\n"
+
+def test_markdown_links_with_spaces():
+    assert main.extract_links(MARKDOWN_NOTE, markdown=True) == {"mi nota", "otra", "con espacio", "tag"}
+
+def test_markdown_backlinks(tmp_path):
+    (tmp_path / "a.md").write_text(MARKDOWN_NOTE, encoding="utf-8")
+    (tmp_path / "Mi Nota.md").write_text("hola\n", encoding="utf-8")
+    index = main.VaultIndex(str(tmp_path))
+    index.sync(main.scan_vault_entries(str(tmp_path)))
+    assert index.backlinks("Mi Nota.md") == ["a.md"]
+    index.close()
+
+def test_rewrite_markdown_links_with_spaces():
+    content, count, kept = main.rewrite_links(MARKDOWN_NOTE, "Mi Nota", "Nota Nueva", markdown=True)
+    assert content.startswith("Ver [Nota Nueva](<model://Nota Nueva>), [Otra](model://Otra)")
+    assert (count, kept) == (2, 0)
+
+def test_rewrite_only_whole_destinations():
+    content, count, _ = main.rewrite_links("[a](<model://Foo Bar>) and [b](model://Foo)", "Foo", "Baz", markdown=True)
+    assert (content, count) == ("[a](<model://Foo Bar>) and [b](model://Baz)", 1)
+    note = '<html><body><a href="model://Foo Bar">x</a> <a href="model://Foo">y</a></body></html>'
+    content, count, _ = main.rewrite_links(note, "Foo", "Baz")
+    assert content == '<html><body><a href="model://Foo Bar">x</a> <a href="model://Baz">y</a></body></html>'
+    assert count == 1
+
+def test_rewrite_markdown_to_name_with_spaces():
+    content, _, kept = main.rewrite_links("[Foo](model://Foo) ##Foo##\n", "Foo", "New Name", markdown=True)
+    assert content == "[New Name](<model://New Name>) [New Name](<model://New Name>)\n"
+    assert kept == 0
+    assert main.extract_links(content, markdown=True) == {"new name"}
+
+def test_rewrite_tags_to_name_with_spaces():
+    note = "<html><body><p>ver ##Foo##</p></body></html>"
+    content, count, kept = main.rewrite_links(note, "Foo", "New Name")
+    assert content == '<html><body><p>ver <a href="model://New Name">New Name</a></p></body></html>'
+    assert (count, kept) == (1, 0)
+    content, count, kept = main.rewrite_links("ver ##Foo## y model://Foo\n", "Foo", "New Name")
+    assert (content, count, kept) == ("ver ##Foo## y model://Foo\n", 0, 2)
+    content, count, kept = main.rewrite_links("ver ##Foo## y model://Foo\n", "Foo", "Bar")
+    assert (content, count, kept) == ("ver ##Bar## y model://Bar\n", 2, 0)
+
+def test_rewrite_links_in_file_keeps_undecodable_notes(tmp_path):
+    path = tmp_path / "a.md"
+    data = b"[Foo](model://Foo) \xff\n"
+    path.write_bytes(data)
+    _, count, error = main.rewrite_links_in_file(str(path), "Foo", "Bar")
+    assert count == 0 and error
+    assert path.read_bytes() == data
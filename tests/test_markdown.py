@@ -0,0 +1,30 @@
+import main
+
+def test_emphasis_pairs(qapp):
+    render = main.render_markdown_inline
+    assert render("*a* y **b**") == "<i>a</i> y <b>b</b>"
+    assert render("**a*b**") == "<b>a*b</b>"
+    assert render("***a***") == "<i><b>a</b></i>"
+    assert render("*a **b** c*") == "<i>a <b>b</b> c</i>"
+    assert render("snake_case_name") == "snake_case_name"
+
+def test_many_emphasis_pairs(qapp):
+    assert main.render_markdown_inline("*a* " * 20000).count("<i>") == 20000
+
+def test_deep_blockquote_nesting(qapp):
+    result = main.parse_markdown_visual("> " * 1000 + "x")
+    assert result.count("<blockquote>") == main.MD_MAX_QUOTE_DEPTH
+    assert result.endswith("x</p>" + "</blockquote>" * main.MD_MAX_QUOTE_DEPTH)
+
+def test_nested_blockquotes(qapp):
+    assert main.parse_markdown_visual("> a\n> > b") == "<blockquote><p>a</p><blockquote><p>b</p></blockquote></blockquote>"
+
+def test_links_inside_link_labels(qapp):
+    render = main.render_markdown_inline
+    assert render("[a [b](y)](x)") == f'<a href="x" style="{main.MD_LINK_STYLE}">a [b](y)</a>'
+    assert render("[*a* ![i](s)](x)") == f'<a href="x" style="{main.MD_LINK_STYLE}"><i>a</i> <img src="s" alt="i" /></a>'
+    assert render("*a [b* c](x)") == f'*a <a href="x" style="{main.MD_LINK_STYLE}">b* c</a>'
+
+def test_deeply_nested_link_labels(qapp):
+    result = main.render_markdown_inline("[" * 5000 + "a" + "](x)" * 5000)
+    assert result.count("<a ") == 1
@@ -0,0 +1,17 @@
+import main
+
+def test_failed_save_does_not_stall_the_queue(qapp, tmp_path):
+    writer = main.NoteWriter()
+    failed, saved = [], []
+    writer.signals.failed.connect(lambda path, error: failed.append(path))
+    writer.signals.saved.connect(lambda path, stat, written, digest: saved.append(path))
+    bad = str(tmp_path / "mala.rtf")
+    good = str(tmp_path / "buena.rtf")
+    writer.submit(bad, "texto con surrogate \ud800")
+    writer.flush()
+    writer.submit(good, "texto normal")
+    writer.flush()
+    qapp.processEvents()
+    assert failed == [bad]
+    assert saved == [good]
+    assert (tmp_path / "buena.rtf").read_text(encoding="utf-8") == "texto normal"
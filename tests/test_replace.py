@@ -0,0 +1,19 @@
+import main
+
+def replace(content, find, template, regex=False):
+    pattern = main.compile_find_pattern(find, True, regex, False)
+    replacement = main.make_replacement(pattern, template, regex)
+    return main.replace_in_note(content, pattern, replacement, markdown=True)
+
+def test_markdown_replace_keeps_link_destinations():
+    assert replace("[Other](model://Other) y Other\n", "Other", "Z") == ("[Z](model://Other) y Z\n", 2)
+    assert replace("[a](<model://Mi Nota>) y model\n", "model", "X") == ("[a](<model://Mi Nota>) y X\n", 1)
+
+def test_markdown_replace_skips_markup_and_code():
+    content = "# Título\n\n- uno **dos**\n\n```\ndos\n```\n\ny `dos` dos\n"
+    assert replace(content, "dos", "tres") == ("# Título\n\n- uno **tres**\n\n```\ndos\n```\n\ny `dos` tres\n", 2)
+    assert replace(content, "#", "x") == (content, 0)
+    assert replace("|a|b|\n|-|-|\n|1|2|\n", "-", "+") == ("|a|b|\n|-|-|\n|1|2|\n", 0)
+
+def test_markdown_replacement_is_escaped():
+    assert replace("uno dos\n", "dos", "*dos* [x]") == ("uno \\*dos\\* \\[x\\]\n", 1)
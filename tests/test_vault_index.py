@@ -0,0 +1,53 @@
+import pytest
+
+import main
+
+NOTES = {
+    "a.txt": "Una canción de cuna",
+    "b.txt": "El ÁRBOL del patio",
+    "c.txt": "Nada que ver",
+}
+
+@pytest.fixture(params=["fts", "sin fts"])
+def index(request, tmp_path):
+    for name, text in NOTES.items():
+        (tmp_path / name).write_text(text, encoding="utf-8")
+    index = main.VaultIndex(str(tmp_path))
+    if request.param == "sin fts":
+        index.has_fts = index.has_trigram = False
+        index.connect().execute("CREATE TABLE IF NOT EXISTS notes_text (rowid INTEGER PRIMARY KEY, body TEXT)")
+    index.sync(main.scan_vault_entries(str(tmp_path)))
+    yield index
+    index.close()
+
+def test_sidebar_search_matches_substrings(index):
+    assert index.search("ción") == ["a.txt"]
+    assert index.search("anci") == ["a.txt"]
+    assert index.search("árbol") == ["b.txt"]
+    assert index.search("a c") == ["a.txt"]
+    assert index.search("ci") == ["a.txt"]
+    assert index.search("cancion") == []
+
+def test_sidebar_search_follows_updates(index, tmp_path):
+    (tmp_path / "a.txt").write_text("otra cosa", encoding="utf-8")
+    index.update_file("a.txt")
+    assert index.search("canción") == []
+    assert index.search("otra") == ["a.txt"]
+    index.remove_file("b.txt")
+    assert index.search("patio") == []
+    if index.has_trigram:
+        index.connect().execute("INSERT INTO notes_sub (notes_sub) VALUES ('integrity-check')")
+
+def test_search_texts_matches_word_prefixes(index):
+    assert [name for name, _ in index.search_texts("cancion cun")] == ["a.txt"]
+    assert [name for name, _ in index.search_texts("anci")] == []
+
+def test_scan_ids_follow_renames(tmp_path):
+    (tmp_path / "a.txt").write_text("", encoding="utf-8")
+    before, after = {}, {}
+    main.scan_vault_entries(str(tmp_path), before)
+    (tmp_path / "a.txt").rename(tmp_path / "b.txt")
+    (tmp_path / "c.txt").write_text("", encoding="utf-8")
+    main.scan_vault_entries(str(tmp_path), after)
+    assert after["b.txt"] == before["a.txt"]
+    assert after["c.txt"] != before["a.txt"]
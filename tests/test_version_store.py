@@ -0,0 +1,29 @@
+import threading
+import time
+
+import main
+
+def test_gc_cannot_drop_a_chunk_that_record_is_reusing(tmp_path, monkeypatch):
+    store = main.VersionStore(str(tmp_path))
+    data = b"linea de la nota\n" * 50
+    store.record("a.rtf", data, created=time.time() - 400 * 86400)
+    store.record("a.rtf", b"otra cosa\n")
+    # La versión vieja vence: sus trozos quedan huérfanos, pero b.rtf los va a reutilizar
+    split = main.split_history_chunks
+    gc_thread = None
+
+    def split_then_gc(content):
+        nonlocal gc_thread
+        for chunk in split(content):
+            yield chunk
+        # record ya vio que los trozos existen; gc corre antes de que inserte la versión
+        gc_thread = threading.Thread(target=lambda: (store.gc(keep_days=30), store.close()))
+        gc_thread.start()
+        gc_thread.join(0.5)
+
+    monkeypatch.setattr(main, "split_history_chunks", split_then_gc)
+    store.record("b.rtf", data)
+    monkeypatch.setattr(main, "split_history_chunks", split)
+    gc_thread.join()
+    vid = store.versions("b.rtf")[0][0]
+    assert store.load(vid) == data